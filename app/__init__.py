@@ -40,6 +40,25 @@ def create_app(config_name):
         verify_certs=True,
     )
 
+    from .aliases import alias_resolver
+    from .json_codec import json_codec
+    from .main.services.conversion_pool import conversion_pool
+    from .mapping import mapping_cache, mapping_registry
+    from .refresh import refresh_coordinator
+    from .search_cache import aggregation_cache, search_cache
+    from .search_type import search_type_chooser
+    from .write_behind import write_behind_queue
+    alias_resolver.init_app(application)
+    json_codec.init_app(application)
+    conversion_pool.init_app(application)
+    mapping_cache.init_app(application)
+    mapping_registry.init_app(application)
+    refresh_coordinator.init_app(application)
+    search_cache.init_app(application)
+    aggregation_cache.init_app(application)
+    search_type_chooser.init_app(application)
+    write_behind_queue.init_app(application)
+
     from .metrics import metrics as metrics_blueprint, gds_metrics
     from .main import main as main_blueprint
     from .status import status as status_blueprint
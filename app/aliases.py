@@ -0,0 +1,95 @@
+import threading
+import time
+
+from elasticsearch.exceptions import NotFoundError
+from flask import g
+from flask.ctx import has_request_context
+
+from dmutils.timing import logged_duration_for_external_request
+
+from app import elasticsearch_client as es
+
+
+CONCRETE_INDEX_HEADER = 'X-Concrete-Index'
+
+
+class AliasResolver(object):
+    """
+    A process-local record of which concrete index each alias (or index) name currently refers to.
+
+    Resolutions are trusted for `recheck_interval` seconds before Elasticsearch is asked again. Alias changes made
+    through this app should call `set` so this process sees them immediately - other processes will pick them up on
+    their next recheck.
+    """
+    def __init__(self, recheck_interval=60):
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._resolved = {}  # {name: (recheck_after, concrete_index_name)}
+
+    def init_app(self, app):
+        self.recheck_interval = app.config['DM_ALIAS_RECHECK_INTERVAL']
+        self.clear()
+        app.after_request(add_concrete_index_header)
+
+    def get(self, name):
+        """Return the cached concrete index for `name`, or None if we don't have a current resolution for it."""
+        entry = self._resolved.get(name)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def set(self, name, concrete_index_name):
+        with self._lock:
+            self._resolved[name] = (time.monotonic() + self.recheck_interval, concrete_index_name)
+
+    def resolve(self, name):
+        """
+        Return the concrete index `name` currently refers to, asking Elasticsearch if we don't have a current
+        resolution. Names which don't resolve to exactly one index (missing indexes, wildcards) are returned unchanged
+        and not cached, leaving Elasticsearch to report the problem on the request that follows.
+        """
+        concrete_index_name = self.get(name)
+        if concrete_index_name is None:
+            try:
+                with logged_duration_for_external_request('es'):
+                    concrete_index_names = list(es.indices.get_alias(index=name).keys())
+            except NotFoundError:
+                concrete_index_names = []
+
+            if len(concrete_index_names) != 1:
+                return name
+
+            concrete_index_name = concrete_index_names[0]
+            self.set(name, concrete_index_name)
+
+        record_concrete_index(concrete_index_name)
+        return concrete_index_name
+
+    def invalidate(self, name):
+        """Forget `name` along with any names resolving to an index called `name`."""
+        with self._lock:
+            for key in [
+                key for key, (_, concrete_index_name) in self._resolved.items()
+                if name in (key, concrete_index_name)
+            ]:
+                del self._resolved[key]
+
+    def clear(self):
+        with self._lock:
+            self._resolved.clear()
+
+
+alias_resolver = AliasResolver()
+
+
+def record_concrete_index(concrete_index_name):
+    """Note the concrete index that served the current request, to be reported in the response headers"""
+    if has_request_context():
+        g.concrete_index_name = concrete_index_name
+
+
+def add_concrete_index_header(response):
+    concrete_index_name = g.get('concrete_index_name')
+    if concrete_index_name:
+        response.headers[CONCRETE_INDEX_HEADER] = concrete_index_name
+    return response
@@ -0,0 +1,87 @@
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(obj):
+    # matching the compact, key-sorted output of flask's jsonify
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+
+def _orjson_default(obj):
+    # orjson would otherwise encode subclasses of the types it knows by their underlying data. Werkzeug's MultiDict
+    # (as search responses' meta.query is) holds a list of values for each key, where `json` encodes its `items()` -
+    # each key's first value.
+    if isinstance(obj, dict):
+        return dict(obj.items())
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, list):
+        return list(obj)
+    raise TypeError("Type is not JSON serializable: {}".format(type(obj).__name__))
+
+
+# {name: (dumps, loads)} - dumps returns bytes, loads accepts bytes or str and raises ValueError on invalid JSON
+BACKENDS = {'json': (_json_dumps, json.loads)}
+if orjson is not None:
+    BACKENDS['orjson'] = (_orjson_dumps, orjson.loads)
+
+
+class JsonCodec(object):
+    """
+    The JSON encoder and decoder used for request bodies and for search responses, which are large enough for the
+    choice to matter.
+
+    `backend` is one of `BACKENDS`, or 'auto' to use orjson if it's installed and the standard library `json` if not.
+    """
+    def __init__(self, backend='auto'):
+        self.use(backend)
+
+    def init_app(self, app):
+        self.use(app.config['DM_SEARCH_JSON_CODEC'])
+
+        # defined here as app.request_class has already been replaced by dmutils (to add request ids)
+        class _CodecRequest(app.request_class):
+            """A request whose `get_json` parses the body with this codec"""
+            json_module = self
+
+        app.request_class = _CodecRequest
+
+    def use(self, backend):
+        if backend == 'auto':
+            backend = 'orjson' if 'orjson' in BACKENDS else 'json'
+        if backend not in BACKENDS:
+            raise ValueError(
+                "Unknown or unavailable JSON codec {!r}; expected one of: auto, {}".format(backend, ", ".join(BACKENDS))
+            )
+        self.backend = backend
+        self._dumps, self._loads = BACKENDS[backend]
+
+    def dumps(self, obj):
+        return self._dumps(obj)
+
+    def loads(self, data):
+        return self._loads(data)
+
+
+json_codec = JsonCodec()
+
+
+def jsonify(*args, **kwargs):
+    """Like flask's `jsonify`, but serialised with `json_codec`"""
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    data = args[0] if len(args) == 1 else (args or kwargs)
+
+    return current_app.response_class(json_codec.dumps(data), mimetype='application/json')
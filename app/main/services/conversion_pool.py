@@ -0,0 +1,110 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+from app.mapping import Mapping
+from app.main.services.process_request_json import convert_request_jsons_into_index_jsons
+
+
+class ConversionPool(object):
+    """
+    Converts large batches of request documents into index documents across a pool of worker processes, so that one
+    big `_bulk` request isn't limited to the single core the GIL allows its web worker.
+
+    Batches smaller than `threshold` documents, or any batch if `processes` is 0, are converted in the calling process
+    as usual - for those the cost of pickling documents to and from the workers outweighs the gain. Larger batches are
+    split into contiguous slices, one for each worker and one for the calling process, and the results joined back
+    together in their original order. The calling process still pickles and unpickles the workers' slices, so
+    throughput is bounded by that rather than by the number of cores well before it reaches 1 + `processes` times.
+    """
+    def __init__(self, processes=0, threshold=5000):
+        self.processes = processes
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._mapping_keys = weakref.WeakKeyDictionary()  # {mapping: key identifying its definition to the workers}
+
+    def init_app(self, app):
+        self.processes = int(app.config['DM_SEARCH_CONVERSION_PROCESSES'])
+        self.threshold = int(app.config['DM_SEARCH_CONVERSION_PROCESS_THRESHOLD'])
+        self.shutdown()
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def convert(self, mapping, request_jsons):
+        """Equivalent to `convert_request_jsons_into_index_jsons`, spread across the pool when the batch is large."""
+        if not self.enabled or len(request_jsons) < max(self.threshold, 2):
+            return convert_request_jsons_into_index_jsons(mapping, request_jsons)
+
+        # the calling process converts the first chunk itself while it waits for the workers to do the rest
+        chunk_size = -(-len(request_jsons) // (self.processes + 1))
+        chunks = [request_jsons[i:i + chunk_size] for i in range(0, len(request_jsons), chunk_size)]
+        mapping_args = (self._mapping_key(mapping), mapping.definition, mapping.mapping_type)
+
+        try:
+            worker_results = self._get_executor().map(_convert_chunk, [mapping_args] * (len(chunks) - 1), chunks[1:])
+            results = [convert_request_jsons_into_index_jsons(mapping, chunks[0])]
+            results.extend(worker_results)
+        except BrokenProcessPool as e:
+            # a worker was killed (most likely by the OOM killer) - start afresh next time, and don't fail this request
+            current_app.logger.warning(
+                "Conversion pool broken, converting %s documents in-process: %s", len(request_jsons), e
+            )
+            self.shutdown()
+            return convert_request_jsons_into_index_jsons(mapping, request_jsons)
+
+        return [index_json for chunk in results for index_json in chunk]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _get_executor(self):
+        # created on first use, and again after a fork, so that each web worker has a pool of its own
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    # forking a process with a write-behind flusher or refresh timers running isn't safe
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _mapping_key(self, mapping):
+        key = self._mapping_keys.get(mapping)
+        if key is None:
+            key = hashlib.sha1(
+                json.dumps([mapping.mapping_type, mapping.definition], sort_keys=True).encode('utf-8')
+            ).hexdigest()
+            self._mapping_keys[mapping] = key
+        return key
+
+
+conversion_pool = ConversionPool()
+
+
+_worker_mappings = {}  # {key: Mapping}, in each worker process
+
+
+def _convert_chunk(mapping_args, request_jsons):
+    key, definition, mapping_type = mapping_args
+    mapping = _worker_mappings.get(key)
+    if mapping is None:
+        if len(_worker_mappings) >= 16:
+            _worker_mappings.clear()
+        # keeping hold of the mapping keeps its compiled converter alive for the next chunk
+        mapping = _worker_mappings[key] = Mapping(definition, mapping_type)
+    return convert_request_jsons_into_index_jsons(mapping, request_jsons)
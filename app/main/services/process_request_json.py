@@ -1,8 +1,9 @@
 import hashlib
-from itertools import chain
+import threading
+import weakref
 
 import six
-from flask import request
+from flask import json, request
 from werkzeug.exceptions import abort
 
 
@@ -13,87 +14,366 @@ def _ensure_value_list(json_string_or_list):
         return [json_string_or_list]
 
 
-def _append_conditionally(arguments, document):
+def _compile_append_conditionally(arguments):
     """
     A transformation processor that generates new field values in "target field" when
     certain values are present in "field". The example use case is when
     we are adding parent categories, whenever any one of their subcategories
     is present.
     :param arguments: dict -- the parameters to the processor as specified in configuration
-    :param document: dict -- the submitted document that we are transforming
+    :return: callable -- applies the processor to a submitted document in place, with a `batch` attribute applying it
+        to a list of documents and an `again` attribute applying it to a document it may already have been applied to
     """
-    _set_conditionally(arguments, document, append=True)
+    return _compile_set_conditionally(arguments, append=True)
 
 
-def _set_conditionally(arguments, document, append=False):
+def _compile_set_conditionally(arguments, append=False):
     """
     A transformation processor that sets field values in "target field" when
     certain values are present in "field". The example use case is when
     we are converting awarded, unsuccessful or cancelled brief status to closed.
     :param arguments: dict -- the parameters to the processor as specified in configuration
-    :param document: dict -- the submitted document that we are transforming
     :param append: bool -- if true, then the target field is appended to instead of set. See the function above.
+    :return: callable -- applies the processor to a submitted document in place, with a `batch` attribute applying it
+        to a list of documents and an `again` attribute applying it to a document it may already have been applied to
     """
-
     source_field = arguments['field']
     target_field = arguments.get('target_field') or source_field
+    any_of = frozenset(arguments['any_of'])
+
+    if append:
+        # "append_value" key singular despite being a list, consistent with Elasticsearch practice
+        append_value = tuple(arguments['append_value'])
+
+        def append_conditionally(document):
+            if source_field in document and not any_of.isdisjoint(_ensure_value_list(document[source_field])):
+                target_values = _ensure_value_list(document.get(target_field, []))
+                target_values.extend(append_value)
+                document[target_field] = target_values
 
-    if source_field in document:
-        source_values = _ensure_value_list(document[source_field])
-        source_values_set = set(source_values)
-        target_values = _ensure_value_list(document.get(target_field, []))
+        def append_conditionally_batch(documents):
+            for document in _documents_with_any_of(documents, source_field, any_of):
+                target_values = _ensure_value_list(document.get(target_field, []))
+                target_values.extend(append_value)
+                document[target_field] = target_values
 
-        if any(value in source_values_set for value in arguments['any_of']):
-            if append:
-                target_values.extend(arguments['append_value'])
-                # "append_value" key singular despite being a list, consistent with Elasticsearch practice
+        def append_conditionally_again(document):
+            # for documents which have already been through this transformation, so may hold its values already
+            if source_field in document and not any_of.isdisjoint(_ensure_value_list(document[source_field])):
+                target_values = _ensure_value_list(document.get(target_field, []))
+                target_values.extend(value for value in append_value if value not in target_values)
                 document[target_field] = target_values
-            else:
-                document[target_field] = arguments['set_value']
 
+        append_conditionally.batch = append_conditionally_batch
+        append_conditionally.again = append_conditionally_again
+        return append_conditionally
+
+    set_value = arguments['set_value']
+
+    def set_conditionally(document):
+        if source_field in document and not any_of.isdisjoint(_ensure_value_list(document[source_field])):
+            document[target_field] = set_value
+
+    def set_conditionally_batch(documents):
+        for document in _documents_with_any_of(documents, source_field, any_of):
+            document[target_field] = set_value
 
-def _hash_to(arguments, document):
+    set_conditionally.batch = set_conditionally_batch
+    set_conditionally.again = set_conditionally
+    return set_conditionally
+
+
+def _documents_with_any_of(documents, source_field, any_of):
+    # the same test as the single-document processors make, inlined for the sake of large batches
+    for document in documents:
+        if source_field in document:
+            value = document[source_field]
+            if (not any_of.isdisjoint(value)) if isinstance(value, list) else (value in any_of):
+                yield document
+
+
+def _compile_hash_to(arguments):
     """
     A transformation processor that performs a sha256 on the (utf8) string representation of the "field" and stores
     the (lowercase hex string) result on the document under a key specified by "target_field". If "target_field" is not
     specified, the source field will be overwritten with the result.
     :param arguments: dict -- the parameters to the processor as specified in configuration
-    :param document: dict -- the submitted document that we are transforming
+    :return: callable -- applies the processor to a submitted document in place, with a `batch` attribute applying it
+        to a list of documents and an `again` attribute applying it to a document it may already have been applied to
     """
     source_field = arguments['field']
     target_field = arguments.get('target_field') or source_field
 
-    if source_field in document:
-        document[target_field] = hashlib.sha256((six.text_type(document[source_field])).encode('utf-8')).hexdigest()
+    def hash_to(document):
+        if source_field in document:
+            document[target_field] = hashlib.sha256((six.text_type(document[source_field])).encode('utf-8')).hexdigest()
+
+    def hash_to_batch(documents):
+        sha256 = hashlib.sha256
+        for document in documents:
+            if source_field in document:
+                document[target_field] = sha256((six.text_type(document[source_field])).encode('utf-8')).hexdigest()
+
+    hash_to.batch = hash_to_batch
+    hash_to.again = hash_to
+    return hash_to
 
 
 TRANSFORMATION_PROCESSORS = {
-    'append_conditionally': _append_conditionally,
-    'set_conditionally': _set_conditionally,
-    'hash_to': _hash_to,
+    'append_conditionally': _compile_append_conditionally,
+    'set_conditionally': _compile_set_conditionally,
+    'hash_to': _compile_hash_to,
 }
 
 
-def convert_request_json_into_index_json(mapping, request_json):
-    for transformation in mapping.transform_fields:
+class IndexJsonConverter(object):
+    """
+    Converts submitted documents into the form they are indexed in for a particular `Mapping`, with the mapping's
+    transformations compiled into a chain of callables and its prefix fan-out worked out up front.
+
+    Obtain one with `get_index_json_converter` rather than constructing directly.
+    """
+    def __init__(self, mapping):
+        self.transform_fields = mapping.transform_fields
+
         # Each transformation is a dictionary, with a type mapping to the arguments pertaining to
         # that type. We anticipate only one type per transformation (consistent with how 'ingest
         # processors' are specified for Elasticsearch - see
         # <https://www.elastic.co/guide/en/elasticsearch/reference/current/ingest-processors.html>).
+        self.transformations = tuple(
+            TRANSFORMATION_PROCESSORS[transformation_type](transformation_arguments)
+            for transformation in mapping.transform_fields
+            for transformation_type, transformation_arguments in transformation.items()
+        )
+
+        # (source field, target field) of each transformation, for working out which transformations can apply
+        self.transformation_fields = transformation_fields = tuple(
+            (transformation_arguments['field'], transformation_arguments.get('target_field') or
+             transformation_arguments['field'])
+            for transformation in mapping.transform_fields
+            for transformation_arguments in transformation.values()
+        )
+        self.sources_by_target = {}
+        for source_field, target_field in transformation_fields:
+            self.sources_by_target.setdefault(target_field, set()).add(source_field)
+        # fields which only ever come out of transformations, never from the submitted document
+        self.derived_fields = frozenset(self.sources_by_target) - frozenset(
+            source_field for source_field, _ in transformation_fields
+        )
+
+        self.fingerprint_field = mapping.fingerprint_field if mapping.has_fingerprint else None
+
+        # for each field in the mapping, all of its differently-prefixed variants
+        self.prefixed_fields = {
+            field_name: tuple("_".join((prefix, field_name)) for prefix in prefixes)
+            for field_name, prefixes in mapping.prefixes_by_field.items()
+        }
+
+        # for `convert_batch`, keyed by the fields documents have
+        self._transformation_plans = {}  # {frozenset(field_names): (transformation, ...)}
+        self._fan_out_tables = {}  # {(field_name, ...): ((field_name, prefixed_field_names), ...)}
+
+    def __call__(self, request_json):
+        for transformation in self.transformations:
+            transformation(request_json)
+
+        return self._fan_out(request_json)
+
+    def convert_indexed(self, request_json):
+        """
+        Convert a document recovered from an index by `convert_index_json_into_request_json`, whose values have
+        already been through transformations (perhaps another mapping's). Fields only transformations produce are
+        dropped and derived afresh, and values which transformations append to a submitted field are only appended if
+        the field doesn't hold them already - otherwise every re-conversion would add another copy of them.
+        """
+        request_json = {
+            key: value for key, value in request_json.items() if key not in self.derived_fields
+        }
+        for transformation in self.transformations:
+            transformation.again(request_json)
+
+        return self._fan_out(request_json)
+
+    def _fan_out(self, request_json):
+        # copy each value in request_json verbatim to all the prefixed variants its key has in the mapping. it could
+        # of course have no representation in the mapping, in which case it would be ignored.
+        index_json = {}
+        for key, value in request_json.items():
+            for prefixed_key in self.prefixed_fields.get(key, ()):
+                index_json[prefixed_key] = value
+
+        if self.fingerprint_field:
+            index_json[self.fingerprint_field] = fingerprint_index_json(index_json)
+        return index_json
 
-        for transformation_type, transformation_arguments in transformation.items():
-            TRANSFORMATION_PROCESSORS[transformation_type](transformation_arguments, request_json)
+    def convert_batch(self, request_jsons):
+        """
+        Convert a list of submitted documents, with the same results as calling the converter on each in turn but less
+        work per document. Documents are grouped by the fields they have; each group's transformations are narrowed
+        down to those whose source field it could have, and each of those is applied across the whole group in one
+        pass. The prefix fan-out then uses a table of just the mapped fields for each distinct set of fields.
+        """
+        groups = {}
+        for position, request_json in enumerate(request_jsons):
+            groups.setdefault(frozenset(request_json), []).append(position)
 
-    # build a dict: for each key/value in the request_json, look up mapping.prefixes_by_field to see how many
-    # differently-prefixed variants that field has in the mapping and copy value verbatim to all those keys. it could
-    # of course have no representation in the mapping, in which case it would be ignored.
-    return dict(chain.from_iterable(
-        (
-            ("_".join((prefix, key)), value)
-            for prefix in mapping.prefixes_by_field.get(key, ())
+        for field_names, positions in groups.items():
+            documents = [request_jsons[position] for position in positions]
+            for transformation in self._transformation_plan(field_names):
+                transformation.batch(documents)
+
+        index_jsons = []
+        for request_json in request_jsons:
+            index_json = {
+                prefixed_key: request_json[key]
+                for key, prefixed_keys in self._fan_out_table(tuple(request_json))
+                for prefixed_key in prefixed_keys
+            }
+            if self.fingerprint_field:
+                index_json[self.fingerprint_field] = fingerprint_index_json(index_json)
+            index_jsons.append(index_json)
+        return index_jsons
+
+    def _transformation_plan(self, field_names):
+        plan = self._transformation_plans.get(field_names)
+        if plan is None:
+            # a transformation can only do anything if its source field is present, either from the start or because
+            # an earlier transformation may have set it
+            possible_field_names = set(field_names)
+            plan = []
+            for (source_field, target_field), transformation in zip(
+                self.transformation_fields, self.transformations
+            ):
+                if source_field in possible_field_names:
+                    plan.append(transformation)
+                    possible_field_names.add(target_field)
+            plan = tuple(plan)
+            _bounded_set(self._transformation_plans, field_names, plan)
+        return plan
+
+    def _fan_out_table(self, field_names):
+        table = self._fan_out_tables.get(field_names)
+        if table is None:
+            table = tuple(
+                (field_name, self.prefixed_fields[field_name])
+                for field_name in field_names
+                if field_name in self.prefixed_fields
+            )
+            _bounded_set(self._fan_out_tables, field_names, table)
+        return table
+
+    def convert_partial(self, partial_request_json):
+        """
+        Convert a partial document - some of a document's fields - into the partial index document which updates the
+        indexed version to match. Transformations are re-run for the fields supplied, so any field they combine into
+        (say `serviceCategories`) must be supplied along with all the fields which feed into it, otherwise
+        `PartialDocumentError` is raised. Fields derived purely by transformations are cleared if they no longer apply.
+        """
+        # a transformation's output may feed into further transformations, so keep going until nothing new is needed
+        required_fields = frozenset(partial_request_json)
+        while True:
+            affected_targets = frozenset(
+                target_field for target_field, source_fields in self.sources_by_target.items()
+                if not source_fields.isdisjoint(required_fields)
+            )
+            now_required_fields = required_fields.union(*(
+                self.sources_by_target[target_field] | (
+                    frozenset() if target_field in self.derived_fields else frozenset((target_field,))
+                )
+                for target_field in affected_targets
+            ))
+            if now_required_fields == required_fields:
+                break
+            required_fields = now_required_fields
+
+        missing_fields = required_fields - frozenset(partial_request_json)
+        if missing_fields:
+            raise PartialDocumentError(
+                "Invalid JSON; a partial update with these fields must also include {}".format(
+                    ", ".join(sorted(missing_fields))
+                )
+            )
+
+        request_json = dict(partial_request_json)
+        for transformation in self.transformations:
+            transformation(request_json)
+        for target_field in affected_targets & self.derived_fields:
+            request_json.setdefault(target_field, None)
+
+        index_json = {}
+        for key, value in request_json.items():
+            for prefixed_key in self.prefixed_fields.get(key, ()):
+                index_json[prefixed_key] = value
+
+        if self.fingerprint_field:
+            # we can't know the fingerprint of the whole updated document, but mustn't leave the old one in place
+            index_json[self.fingerprint_field] = None
+        return index_json
+
+
+def fingerprint_index_json(index_json):
+    """A sha256 of the (canonically serialized) document, the same for any two documents with the same content"""
+    return hashlib.sha256(
+        json.dumps(index_json, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    ).hexdigest()
+
+
+def _bounded_set(cache, key, value, max_size=1024):
+    # documents' field sets are usually few and repetitive, but don't let unusual input grow these without limit
+    if len(cache) >= max_size:
+        cache.clear()
+    cache[key] = value
+    return value
+
+
+class PartialDocumentError(ValueError):
+    pass
+
+
+_index_json_converters = weakref.WeakKeyDictionary()  # {mapping: IndexJsonConverter}
+_index_json_converters_lock = threading.Lock()
+
+
+def get_index_json_converter(mapping):
+    converter = _index_json_converters.get(mapping)
+    # a mapping's transformations may have been swapped out (in practice only by tests) since we compiled them
+    if converter is None or converter.transform_fields is not mapping.transform_fields:
+        converter = IndexJsonConverter(mapping)
+        with _index_json_converters_lock:
+            _index_json_converters[mapping] = converter
+    return converter
+
+
+def convert_request_json_into_index_json(mapping, request_json):
+    return get_index_json_converter(mapping)(request_json)
+
+
+def convert_request_jsons_into_index_jsons(mapping, request_jsons):
+    return get_index_json_converter(mapping).convert_batch(request_jsons)
+
+
+def convert_indexed_request_json_into_index_json(mapping, request_json):
+    return get_index_json_converter(mapping).convert_indexed(request_json)
+
+
+def convert_partial_request_json_into_index_json(mapping, partial_request_json):
+    return get_index_json_converter(mapping).convert_partial(partial_request_json)
+
+
+def convert_index_json_into_request_json(index_json):
+    """
+    The inverse of `convert_request_json_into_index_json`, as far as is possible: strips the prefixes from an indexed
+    document's fields. Only fields the index stored under some prefix can be recovered, and values are as they were
+    after the original mapping's transformations.
+    """
+    return {
+        maybe_name_seq[0]: value
+        for (prefix, *maybe_name_seq), value in (
+            (prefixed_name.split("_", 1), value)
+            for prefixed_name, value in index_json.items()
         )
-        for key, value in request_json.items()
-    ))
+        if prefix and maybe_name_seq
+    }
 
 
 def check_json_from_request(request):
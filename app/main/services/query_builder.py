@@ -1,24 +1,113 @@
+import base64
+import binascii
+import json
+import threading
+import weakref
 from itertools import chain
 
 
-def construct_query(mapping, query_args, aggregations=[], page_size=100):
+class QueryPlan(object):
+    """
+    The parts of a search query which depend only on an index's `Mapping`, worked out once per mapping so that
+    `construct_query` only has to fill in the parts which vary between requests.
+
+    Obtain one with `get_query_plan` rather than constructing directly. Its clauses are shared between queries and so
+    must not be modified.
+    """
+    def __init__(self, mapping):
+        self.text_search_fields = [
+            "_".join((mapping.text_search_field_prefix, field_name))
+            for field_name in mapping.fields_by_prefix.get(mapping.text_search_field_prefix, ())
+        ]
+        self.highlight_clause = {
+            "encoder": "html",
+            "pre_tags": ["<mark class='search-result-highlighted-text'>"],
+            "post_tags": ["</mark>"],
+
+            # we always want the whole field, the longest field is the description
+            # which is limited to 500 chars
+            "number_of_fragments": 0,
+            "no_match_size": 500,
+
+            # Get all fields searched
+            "fields": {
+                f"{mapping.text_search_field_prefix}_*": {},
+            }
+        }
+        self.sort_clause = mapping.sort_clause
+
+        self.filter_fields = mapping.fields_by_prefix.get(mapping.filter_field_prefix) or frozenset()
+        self.aggregatable_fields = mapping.fields_by_prefix.get(mapping.aggregatable_field_prefix) or frozenset()
+
+        self.filter_field_prefix = mapping.filter_field_prefix
+        self.prefixed_filter_fields = {
+            name: "_".join((mapping.filter_field_prefix, name)) for name in self.filter_fields
+        }
+        self.aggregation_clauses = {
+            name: {"terms": {"field": "_".join((mapping.aggregatable_field_prefix, name)), "size": 999999}}
+            for name in self.aggregatable_fields
+        }
+
+    def prefixed_filter_field(self, field_name):
+        # filters on fields unknown to the mapping are still passed through to elasticsearch
+        return self.prefixed_filter_fields.get(field_name) or "_".join((self.filter_field_prefix, field_name))
+
+
+FILTER_ARG_PREFIX = "filter_"
+# pages through results with `search_after` rather than `page` - empty for the first page, after which each page's
+# `next` link carries the cursor for the one after it
+CURSOR_ARG = "cursor"
+# searches a point in time rather than the live index, so that pages are consistent with each other - empty to open
+# one, after which the links to further pages carry its id. Not part of the query itself.
+PIT_ARG = "pit"
+
+_query_plans = weakref.WeakKeyDictionary()  # {mapping: QueryPlan}
+_query_plans_lock = threading.Lock()
+
+
+def get_query_plan(mapping):
+    query_plan = _query_plans.get(mapping)
+    if query_plan is None:
+        query_plan = QueryPlan(mapping)
+        with _query_plans_lock:
+            _query_plans[mapping] = query_plan
+    return query_plan
+
+
+def filter_args(query_args):
+    """
+    Returns a list of (unprefixed_field_name, values) for each `filter_*` argument in the MultiDict `query_args`
+    """
+    return [
+        (arg_key[len(FILTER_ARG_PREFIX):], values)
+        for arg_key, values in query_args.lists()
+        if arg_key.startswith(FILTER_ARG_PREFIX)
+    ]
+
+
+def construct_query(mapping, query_args, aggregations=[], page_size=100, include_documents=False):
     """
         :param mapping: index's mapping as returned by `app.mapping.get_mapping`
         :param query_args: a MultiDict of request arguments
         :param aggregations: sequence of aggregations request arguments
         :param page_size: desired number of results per page. falsey values cause page & sorting-related parameters to
             be omitted (useful for e.g. `count` requests)
+        :param include_documents: whether a query with `aggregations` should fetch a page of documents too, rather
+            than just the aggregations
     """
-    if not is_filtered(mapping, query_args):
+    query_plan = get_query_plan(mapping)
+    filters = filter_args(query_args)
+
+    if not _is_filtered(query_plan, filters):
         query = {
-            "query": build_keywords_query(mapping, query_args)
+            "query": _build_keywords_query(query_plan, query_args)
         }
     else:
         query = {
             "query": {
                 "bool": {
-                    "must": build_keywords_query(mapping, query_args),
-                    "filter": filter_clause(mapping, query_args)
+                    "must": _build_keywords_query(query_plan, query_args),
+                    "filter": _filter_clause(query_plan, filters)
                 }
             }
         }
@@ -28,25 +117,29 @@ def construct_query(mapping, query_args, aggregations=[], page_size=100):
 
     if aggregations:
         aggregations = set(aggregations)
-        missing_aggregations = aggregations.difference(
-            mapping.fields_by_prefix.get(mapping.aggregatable_field_prefix) or frozenset()
-        )
+        missing_aggregations = aggregations.difference(query_plan.aggregatable_fields)
         if missing_aggregations:
             raise ValueError("Aggregations for `{}` are not supported.".format(', '.join(missing_aggregations)))
 
-        query["size"] = 0  # We don't want any services returned, just aggregations
-        query['aggregations'] = {
-            x: {"terms": {"field": "_".join((mapping.aggregatable_field_prefix, x)), "size": 999999}}
-            for x in aggregations
-        }
+        query['aggregations'] = {x: query_plan.aggregation_clauses[x] for x in aggregations}
 
+    if aggregations and not include_documents:
+        query["size"] = 0  # We don't want any services returned, just aggregations
     elif 'idOnly' in query_args:
         query['_source'] = False
+        if CURSOR_ARG in query_args:
+            query['sort'] = query_plan.sort_clause
     elif page_size:
-        query["highlight"] = highlight_clause(mapping)
-        query['sort'] = mapping.sort_clause
-
-    if page_size and "page" in query_args:
+        query["highlight"] = query_plan.highlight_clause
+        query['sort'] = query_plan.sort_clause
+
+    if page_size and CURSOR_ARG in query_args:
+        if "page" in query_args:
+            raise ValueError("Invalid page; can't use both page and cursor")
+        if query_args[CURSOR_ARG]:
+            # the sort clause always ends in a unique tie-breaker, so this carries on exactly where the last page ended
+            query["search_after"] = decode_cursor(query_args[CURSOR_ARG])
+    elif page_size and "page" in query_args:
         try:
             query["from"] = (int(query_args.get("page")) - 1) * page_size
         except ValueError:
@@ -55,37 +148,48 @@ def construct_query(mapping, query_args, aggregations=[], page_size=100):
     return query
 
 
-def highlight_clause(mapping):
-    highlights = {
-        "encoder": "html",
-        "pre_tags": ["<mark class='search-result-highlighted-text'>"],
-        "post_tags": ["</mark>"],
-
-        # we always want the whole field, the longest field is the description
-        # which is limited to 500 chars
-        "number_of_fragments": 0,
-        "no_match_size": 500,
-
-        # Get all fields searched
-        "fields": {
-            f"{mapping.text_search_field_prefix}_*": {},
-        }
-    }
+def encode_cursor(sort_values):
+    """Encode the `sort` values of the last hit on a page as the cursor for the page after it"""
+    # unpadded, so that it needn't be escaped in URLs
+    return base64.urlsafe_b64encode(
+        json.dumps(sort_values, separators=(',', ':')).encode('utf-8')
+    ).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii') + b'=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeError, ValueError):
+        sort_values = None
+    if not isinstance(sort_values, list) or not sort_values:
+        raise ValueError("Invalid cursor {}".format(cursor))
+    return sort_values
 
-    return highlights
+
+def highlight_clause(mapping):
+    return get_query_plan(mapping).highlight_clause
 
 
 def is_filtered(mapping, query_args):
-    return bool(frozenset(
-        maybe_name_seq[0]
-        for prefix, *maybe_name_seq in (arg_key.split("_", 1) for arg_key in query_args.keys())
-        if prefix == "filter" and maybe_name_seq  # maybe_name_seq could be an empty seq if no underscores were found
-    ) & (mapping.fields_by_prefix.get(mapping.filter_field_prefix) or frozenset()))
+    return _is_filtered(get_query_plan(mapping), filter_args(query_args))
+
+
+def _is_filtered(query_plan, filters):
+    return any(field_name in query_plan.filter_fields for field_name, _ in filters)
 
 
 def build_keywords_query(mapping, query_args):
+    return _build_keywords_query(get_query_plan(mapping), query_args)
+
+
+def has_scoring_terms(query_args):
+    """Whether the query for `query_args` scores the documents it matches - filters and match_all don't"""
+    return bool(query_args.get("q", "").strip())
+
+
+def _build_keywords_query(query_plan, query_args):
     if "q" in query_args:
-        return multi_match_clause(mapping, query_args["q"])
+        return _multi_match_clause(query_plan, query_args["q"])
     else:
         return match_all_clause()
 
@@ -115,13 +219,14 @@ def multi_match_clause(mapping, keywords):
     "simple_query_string" doesn't support "use_dis_max" flag.
 
     """
+    return _multi_match_clause(get_query_plan(mapping), keywords)
+
+
+def _multi_match_clause(query_plan, keywords):
     return {
         "simple_query_string": {
             "query": keywords,
-            "fields": [
-                "_".join((mapping.text_search_field_prefix, field_name))
-                for field_name in mapping.fields_by_prefix.get(mapping.text_search_field_prefix, ())
-            ],
+            "fields": query_plan.text_search_fields,
             "default_operator": "and",
             "flags": "OR|AND|NOT|PHRASE|ESCAPE|WHITESPACE"
         }
@@ -140,7 +245,11 @@ def field_is_or_filter(field_values):
 
 def field_filters(mapping, arg_field_name, field_values):
     """Build a list of Elasticsearch filters for the given field."""
-    field_name = "_".join((mapping.filter_field_prefix, arg_field_name))
+    return _field_filters(get_query_plan(mapping), arg_field_name, field_values)
+
+
+def _field_filters(query_plan, arg_field_name, field_values):
+    field_name = query_plan.prefixed_filter_field(arg_field_name)
     if field_is_or_filter(field_values):
         return or_field_filters(field_name, field_values)
     else:
@@ -204,16 +313,15 @@ def filter_clause(mapping, query_args):
     just any one of them.
 
     """
+    return _filter_clause(get_query_plan(mapping), filter_args(query_args))
+
+
+def _filter_clause(query_plan, filters):
     return {
         "bool": {
             "must": list(chain.from_iterable(
-                field_filters(mapping, maybe_name_seq[0], values)
-                for (prefix, *maybe_name_seq), values in (
-                    (arg_key.split("_", 1), values)
-                    for arg_key, values in query_args.lists()
-                )
-                if prefix == "filter" and maybe_name_seq  # maybe_name_seq could be an empty seq if no underscores were
-                                                          # found
+                _field_filters(query_plan, field_name, values)
+                for field_name, values in filters
             )),
         },
     }
@@ -1,6 +1,11 @@
 import math
 
-from flask import current_app, jsonify
+from flask import current_app
+
+from app.json_codec import jsonify
+
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 
 def convert_es_status(index_name, status_response, info_response=None):
@@ -28,6 +33,7 @@ def _convert_es_index_status(index_name, status_response, info_response):
         'mapping_version': index_mapping.get('_meta', {}).get('version'),
         'max_result_window': index_settings.get('index', {}).get('max_result_window'),
         'mapping_generated_from_framework': index_mapping.get('_meta', {}).get('generated_from_framework'),
+        'mapping_content_hash': index_mapping.get('_meta', {}).get('content_hash'),
         'aliases': list(index_aliases.keys()),
     }
 
@@ -45,21 +51,22 @@ def _convert_es_result(mapping, es_result):
     }
 
 
-def convert_es_results(mapping, results, query_args):
-    documents = []
+def convert_es_hit(mapping, document, query_args):
+    if 'idOnly' in query_args:
+        return {"id": document["_id"]}
 
-    for document in results["hits"]["hits"]:
-        if 'idOnly' in query_args:
-            documents.append({"id": document["_id"]})
-        else:
-            # populate result from document["_source"] object
-            result = _convert_es_result(mapping, document["_source"])
+    # populate result from document["_source"] object
+    result = _convert_es_result(mapping, document["_source"])
 
-            if "highlight" in document:
-                # perform the same conversion for any highlight terms
-                result["highlight"] = _convert_es_result(mapping, document["highlight"])
+    if "highlight" in document:
+        # perform the same conversion for any highlight terms
+        result["highlight"] = _convert_es_result(mapping, document["highlight"])
 
-            documents.append(result)
+    return result
+
+
+def convert_es_results(mapping, results, query_args):
+    documents = [convert_es_hit(mapping, document, query_args) for document in results["hits"]["hits"]]
 
     return {
         "meta": {
@@ -73,7 +80,12 @@ def convert_es_results(mapping, results, query_args):
     }
 
 
-def generate_pagination_links(query_args, total, page_size, url_for_search):
+def generate_pagination_links(query_args, total, page_size, url_for_search, next_cursor=None):
+    if 'cursor' in query_args:
+        # cursors only lead forwards
+        args_no_cursor = {k: v for k, v in query_args.lists() if k != 'cursor'}
+        return {'next': url_for_search(cursor=next_cursor, **args_no_cursor)} if next_cursor else {}
+
     page = int(query_args.get('page', 1))
     max_page = int(math.ceil(float(total) / page_size))
     args_no_page = {k: v for k, v in query_args.lists() if k != 'page'}
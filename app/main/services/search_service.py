@@ -1,29 +1,67 @@
-from elasticsearch import TransportError
-from flask import current_app, url_for
+import queue
+import threading
+from itertools import islice
+
+from elasticsearch import NotFoundError, TransportError
+from elasticsearch.helpers import scan, streaming_bulk
+from flask import current_app, has_request_context, request, url_for
+from werkzeug.datastructures import MultiDict
 
 from dmutils.timing import logged_duration_for_external_request
 
+import app.aliases
 import app.mapping
-from app.main.services.response_formatters import convert_es_status, convert_es_results, generate_pagination_links
-from app.main.services.query_builder import construct_query
+import app.refresh
+import app.search_cache
+import app.search_type
+import app.write_behind
+from app.main.services.process_request_json import (
+    convert_index_json_into_request_json,
+    convert_indexed_request_json_into_index_json,
+)
+from app.main.services.response_formatters import (
+    convert_es_hit,
+    convert_es_results,
+    convert_es_status,
+    generate_pagination_links,
+)
+from app.main.services.query_builder import CURSOR_ARG, PIT_ARG, construct_query, encode_cursor, has_scoring_terms
 
 from ... import elasticsearch_client as es
 
 
+# how a write can ask for its changes to be made searchable: by waiting for the next refresh before responding
+# (Elasticsearch's refresh=wait_for), or by requesting a refresh which may be merged with others for the same index
+REFRESH_WAIT_FOR = 'wait_for'
+REFRESH_DEBOUNCED = 'debounced'
+REFRESH_OPTIONS = (REFRESH_WAIT_FOR, REFRESH_DEBOUNCED)
+# writes through the write-behind queue are only sent once the request has been answered
+WRITE_BEHIND_REFRESH_ERROR = "The 'refresh' option can't be used while write-behind is enabled"
+
+
 def refresh(index_name):
     try:
         with logged_duration_for_external_request('es'):
             es.indices.refresh(index_name)
+        app.search_cache.write_generations.invalidate(index_name, refreshed=True)
         return "acknowledged", 200
     except TransportError as e:
         return _get_an_error_message(e), e.status_code
 
 
 def create_index(index_name, mapping_name):
-    mapping_definition = app.mapping.load_mapping_definition(mapping_name)
+    registered_mapping = app.mapping.mapping_registry.get(mapping_name)
+    definition = app.mapping.mapping_registry.get_definition(mapping_name)
+    # so the index's status shows which version of the definition it was created from
+    definition["mappings"]["_meta"]["content_hash"] = registered_mapping.content_hash
     try:
         with logged_duration_for_external_request('es'):
-            es.indices.create(index=index_name, body=mapping_definition)
+            es.indices.create(index=index_name, body=definition)
+        app.aliases.alias_resolver.invalidate(index_name)
+        # the new index's mapping is exactly the one we created it with, so there's no need to fetch it back
+        app.mapping.mapping_cache.set(
+            index_name, app.mapping.Mapping(definition, mapping_type=registered_mapping.mapping.mapping_type)
+        )
         return "acknowledged", 200
     except TransportError as e:
         current_app.logger.warning(
@@ -36,25 +74,149 @@ def create_index(index_name, mapping_name):
 def create_alias(alias_name, target_index):
     """Sets an alias for a given index
 
-    If alias already exists it's removed from any existing indexes first.
+    If alias already exists it's removed from any existing indexes first. Indexes part-way through a bulk load can't
+    be aliased.
 
     """
 
     try:
+        meta = _get_index_meta(target_index)
+        if BULK_LOAD_META_KEY in meta:
+            return "Index '{}' is being bulk loaded and cannot be aliased until the load is finished".format(
+                target_index
+            ), 400
+
         with logged_duration_for_external_request('es'):
             es.indices.update_aliases({"actions": [
                 {"remove": {"index": "_all", "alias": alias_name}},
                 {"add": {"index": target_index, "alias": alias_name}}
             ]})
+        app.aliases.alias_resolver.set(alias_name, target_index)
+        app.search_cache.write_generations.bump(alias_name, target_index, settled=True)
+        _prewarm_aggregation_cache(alias_name, meta.get("doc_type"))
+        return "acknowledged", 200
+    except TransportError as e:
+        return _get_an_error_message(e), e.status_code
+
+
+def _prewarm_aggregation_cache(alias_name, doc_type):
+    """
+    Fill the aggregation cache with the unfiltered counts of `DM_AGGREGATION_CACHE_PREWARM` for a newly swapped alias,
+    as requested by the aggregations endpoint. Anything going wrong is logged and otherwise ignored.
+    """
+    aggregations = current_app.config['DM_AGGREGATION_CACHE_PREWARM']
+    if isinstance(aggregations, str):
+        aggregations = aggregations.split(',')
+    # the cache keys depend on the request's URL root, which we only have while handling a request
+    if not (doc_type and aggregations and app.search_cache.aggregation_cache.enabled and has_request_context()):
+        return
+
+    try:
+        mapping = app.mapping.get_mapping(alias_name, doc_type)
+        aggregations = [name for name in aggregations if name in mapping.fields_by_prefix.get('dmagg', ())]
+        if not aggregations:
+            return
+
+        query_args = MultiDict([('aggregations', name) for name in aggregations])
+        result, status_code = aggregations_with_keywords_and_filters(alias_name, doc_type, query_args, aggregations)
+    except TransportError as e:
+        result, status_code = _get_an_error_message(e), e.status_code
+    except app.mapping.MappingNotFound as e:
+        result, status_code = e.description, 400
+    if status_code != 200:
+        current_app.logger.warning("Failed to pre-warm aggregations for %s: %s", alias_name, result)
+
+
+BULK_LOAD_META_KEY = 'bulk_load_restore_settings'
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+def start_bulk_load(index_name):
+    """
+    Switch off refreshes and replicas on `index_name` while it's being loaded, recording the settings they replace in
+    the index's mapping `_meta` so that `finish_bulk_load` can restore them from any process.
+    """
+    try:
+        meta = _get_index_meta(index_name)
+        if BULK_LOAD_META_KEY not in meta:
+            with logged_duration_for_external_request('es'):
+                res = es.indices.get_settings(
+                    index=index_name,
+                    name=["index.{}".format(setting) for setting in BULK_LOAD_SETTINGS],
+                    include_defaults=True,
+                    flat_settings=True,
+                )
+            index_settings = next(iter(res.values()))
+            original_settings = {
+                setting: index_settings["settings"].get(
+                    "index.{}".format(setting), index_settings["defaults"].get("index.{}".format(setting))
+                )
+                for setting in BULK_LOAD_SETTINGS
+            }
+            _put_index_meta(index_name, dict(meta, **{BULK_LOAD_META_KEY: original_settings}))
+
+        with logged_duration_for_external_request('es'):
+            es.indices.put_settings(index=index_name, body={"index": BULK_LOAD_SETTINGS})
+        return "acknowledged", 200
+    except TransportError as e:
+        return _get_an_error_message(e), e.status_code
+
+
+def finish_bulk_load(index_name, force_merge=False):
+    """
+    Restore the settings `start_bulk_load` replaced, refresh (and optionally force-merge) the index, then wait for it
+    to reach `DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS` before allowing it to be aliased.
+    """
+    try:
+        meta = _get_index_meta(index_name)
+        if BULK_LOAD_META_KEY not in meta:
+            return "Index '{}' is not being bulk loaded".format(index_name), 400
+
+        with logged_duration_for_external_request('es'):
+            es.indices.put_settings(index=index_name, body={"index": meta[BULK_LOAD_META_KEY]})
+        with logged_duration_for_external_request('es'):
+            es.indices.refresh(index=index_name)
+        app.search_cache.write_generations.invalidate(index_name, refreshed=True)
+        if force_merge:
+            with logged_duration_for_external_request('es'):
+                es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=3600)
+        with logged_duration_for_external_request('es'):
+            health = es.cluster.health(
+                index=index_name,
+                wait_for_status=current_app.config['DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS'],
+                timeout=current_app.config['DM_SEARCH_BULK_LOAD_WAIT_TIMEOUT'],
+            )
+        if health["timed_out"]:
+            return "Index '{}' did not reach {} status (currently {})".format(
+                index_name, current_app.config['DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS'], health["status"]
+            ), 504
+
+        _put_index_meta(index_name, {key: value for key, value in meta.items() if key != BULK_LOAD_META_KEY})
         return "acknowledged", 200
     except TransportError as e:
         return _get_an_error_message(e), e.status_code
 
 
+def _get_index_meta(index_name):
+    with logged_duration_for_external_request('es'):
+        res = es.indices.get_mapping(index=index_name)
+    return next(iter(res.values()))["mappings"].get("_meta", {})
+
+
+def _put_index_meta(index_name, meta):
+    # _meta is replaced wholesale by a mapping update, so this must always be given all of it
+    with logged_duration_for_external_request('es'):
+        es.indices.put_mapping(index=index_name, body={"_meta": meta})
+    app.mapping.mapping_cache.invalidate(app.aliases.alias_resolver.get(index_name) or index_name)
+
+
 def delete_index(index_name):
     try:
         with logged_duration_for_external_request('es'):
             es.indices.delete(index=index_name)
+        app.search_cache.write_generations.invalidate(index_name)
+        app.mapping.mapping_cache.invalidate(index_name)
+        app.aliases.alias_resolver.invalidate(index_name)
         return "acknowledged", 200
     except TransportError as e:
         return _get_an_error_message(e), e.status_code
@@ -64,28 +226,55 @@ def fetch_by_id(index_name, doc_type, document_id):
     try:
         with logged_duration_for_external_request('es'):
             res = es.get(index=index_name, id=document_id)
+        app.aliases.record_concrete_index(res['_index'])
         return res, 200
     except TransportError as e:
         return _get_an_error_message(e), e.status_code
 
 
-def delete_by_id(index_name, doc_type, document_id):
+def delete_by_id(index_name, doc_type, document_id, refresh=None):
+    if app.write_behind.write_behind_queue.enabled:
+        if refresh is not None:
+            return WRITE_BEHIND_REFRESH_ERROR, 400
+        app.write_behind.write_behind_queue.put({"_op_type": "delete", "_index": index_name, "_id": document_id})
+        return "accepted", 202
+
     try:
         with logged_duration_for_external_request('es'):
-            res = es.delete(index=index_name, id=document_id)
+            res = es.delete(index=index_name, id=document_id, **_write_refresh_kwargs(refresh))
+        app.aliases.record_concrete_index(res['_index'])
+        app.search_cache.write_generations.bump(res['_index'])
+        _request_refresh(index_name, refresh)
         return res, 200
     except TransportError as e:
         return _get_an_error_message(e), e.status_code
 
 
-def index(index_name, doc_type, document, document_id):
+def index(index_name, doc_type, document, document_id, refresh=None):
+    write_behind = app.write_behind.write_behind_queue.enabled
+    if write_behind and refresh is not None:
+        return WRITE_BEHIND_REFRESH_ERROR, 400
+
     try:
+        if _is_unchanged(index_name, document_id, document):
+            return "skipped", 200
+
+        if write_behind:
+            app.write_behind.write_behind_queue.put(
+                {"_op_type": "index", "_index": index_name, "_id": document_id, "_source": document}
+            )
+            return "accepted", 202
+
         with logged_duration_for_external_request('es'):
-            es.index(
+            res = es.index(
                 index=index_name,
                 id=document_id,
-                body=document)
-            return "acknowledged", 200
+                body=document,
+                **_write_refresh_kwargs(refresh))
+        app.aliases.record_concrete_index(res['_index'])
+        app.search_cache.write_generations.bump(res['_index'])
+        _request_refresh(index_name, refresh)
+        return "acknowledged", 200
     except TransportError as e:
         current_app.logger.error(
             "Failed to index the document %s: %s",
@@ -94,6 +283,233 @@ def index(index_name, doc_type, document, document_id):
         return _get_an_error_message(e), e.status_code
 
 
+def _is_unchanged(index_name, document_id, document):
+    """
+    Whether `document` has the same fingerprint as the one stored with `document_id` - or, if a write to it is still
+    waiting in the write-behind queue, as the one that will be.
+    """
+    fingerprint_field = app.mapping.Mapping.fingerprint_field
+    fingerprint = document.get(fingerprint_field)
+    if fingerprint is None:
+        return False
+
+    queued = app.write_behind.write_behind_queue.pending(index_name, document_id)
+    if queued is not None:
+        return queued["_op_type"] == "index" and queued["_source"].get(fingerprint_field) == fingerprint
+    return _stored_fingerprints(index_name, [document_id]).get(document_id) == fingerprint
+
+
+def update(index_name, doc_type, partial_document, document_id, refresh=None):
+    """Apply a partial index document to an existing document, using the Elasticsearch update API"""
+    try:
+        with logged_duration_for_external_request('es'):
+            res = es.update(
+                index=index_name,
+                id=document_id,
+                body={"doc": partial_document},
+                **_write_refresh_kwargs(refresh))
+        app.aliases.record_concrete_index(res['_index'])
+        app.search_cache.write_generations.bump(res['_index'])
+        _request_refresh(index_name, refresh)
+        return "acknowledged", 200
+    except TransportError as e:
+        current_app.logger.error(
+            "Failed to update the document %s: %s",
+            document_id, _get_an_error_message(e)
+        )
+        return _get_an_error_message(e), e.status_code
+
+
+def bulk_index(index_name, doc_type, documents, skip_unchanged=True, refresh=None):
+    """
+    Index many documents using the Elasticsearch `_bulk` API, sending them in batches of
+    `DM_SEARCH_BULK_BATCH_SIZE`. Unless `skip_unchanged` is false, documents whose fingerprint matches the one already
+    stored are left alone - each batch's stored fingerprints are fetched with a single `_mget`.
+
+    :param documents: iterable of (document_id, index_json) tuples, consumed lazily
+    :return: generator of per-document results (see `_bulk_item_result`), in the same order as `documents`
+    """
+    if not skip_unchanged:
+        results = _streaming_bulk_results(
+            (
+                {"_op_type": "index", "_index": index_name, "_id": document_id, "_source": document}
+                for document_id, document in documents
+            ),
+            refresh,
+        )
+    else:
+        results = _bulk_index_changed(index_name, documents, refresh)
+    return _requesting_refresh_after(results, index_name, refresh)
+
+
+def _bulk_index_changed(index_name, documents, refresh):
+    fingerprint_field = app.mapping.Mapping.fingerprint_field
+    batch_size = int(current_app.config['DM_SEARCH_BULK_BATCH_SIZE'])
+    documents = iter(documents)
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            return
+
+        stored_fingerprints = _stored_fingerprints(
+            index_name, [document_id for document_id, document in batch if fingerprint_field in document]
+        )
+        # decided per item, comparing against what the earlier items in the batch will have left stored, as an id
+        # can turn up more than once
+        unchanged = []
+        for document_id, document in batch:
+            fingerprint = document.get(fingerprint_field)
+            unchanged.append(fingerprint is not None and stored_fingerprints.get(document_id) == fingerprint)
+            stored_fingerprints[document_id] = fingerprint
+        results = _streaming_bulk_results((
+            {"_op_type": "index", "_index": index_name, "_id": document_id, "_source": document}
+            for (document_id, document), skipped in zip(batch, unchanged)
+            if not skipped
+        ), refresh)
+        for (document_id, _), skipped in zip(batch, unchanged):
+            if skipped:
+                yield {"id": document_id, "status": 200, "message": "skipped"}
+            else:
+                yield next(results)
+
+
+def _stored_fingerprints(index_name, document_ids):
+    """
+    Fetch the fingerprints stored with `document_ids`, as {document_id: fingerprint}. A failed lookup is logged and
+    treated as there being no fingerprints, so the documents simply get written.
+    """
+    if not document_ids:
+        return {}
+
+    fingerprint_field = app.mapping.Mapping.fingerprint_field
+    try:
+        with logged_duration_for_external_request('es'):
+            res = es.mget(index=index_name, body={"ids": document_ids}, _source_includes=[fingerprint_field])
+    except TransportError as e:
+        current_app.logger.warning(
+            "Failed to fetch document fingerprints from %s: %s",
+            index_name, _get_an_error_message(e)
+        )
+        return {}
+
+    return {
+        doc["_id"]: doc["_source"].get(fingerprint_field)
+        for doc in res["docs"]
+        if doc.get("found")
+    }
+
+
+def bulk_delete(index_name, doc_type, document_ids, refresh=None):
+    """
+    Delete many documents using the Elasticsearch `_bulk` API, sending them in batches of
+    `DM_SEARCH_BULK_BATCH_SIZE`.
+
+    :param document_ids: iterable of document ids, consumed lazily
+    :return: generator of per-document results (see `_bulk_item_result`), in the same order as `document_ids`
+    """
+    actions = (
+        {"_op_type": "delete", "_index": index_name, "_id": document_id}
+        for document_id in document_ids
+    )
+    return _requesting_refresh_after(_streaming_bulk_results(actions, refresh), index_name, refresh)
+
+
+def _streaming_bulk_results(actions, refresh=None):
+    for ok, item in streaming_bulk(
+        es,
+        actions,
+        chunk_size=int(current_app.config['DM_SEARCH_BULK_BATCH_SIZE']),
+        raise_on_error=False,
+        raise_on_exception=False,
+        **_write_refresh_kwargs(refresh)
+    ):
+        yield _bulk_item_result(ok, item)
+
+
+def _write_refresh_kwargs(refresh):
+    return {"refresh": "wait_for"} if refresh == REFRESH_WAIT_FOR else {}
+
+
+def _request_refresh(index_name, refresh):
+    if refresh == REFRESH_DEBOUNCED:
+        app.refresh.refresh_coordinator.request(index_name)
+
+
+def _requesting_refresh_after(results, index_name, refresh):
+    yield from results
+    _request_refresh(index_name, refresh)
+
+
+def _bulk_item_result(ok, item):
+    """
+    Convert an item from a `_bulk` response into a dict carrying the document's id and the status code plus message or
+    error that `api_response` would have returned for it as a single request.
+    """
+    op_type, info = next(iter(item.items()))
+    if ok:
+        app.aliases.record_concrete_index(info['_index'])
+        app.search_cache.write_generations.bump(info['_index'])
+        return {
+            "id": info["_id"],
+            "status": 200,
+            "message": "acknowledged" if op_type == "index" else info.get("result"),
+        }
+
+    status_code = info.get("status")
+    if status_code == 404 and info.get("result") == "not_found":
+        # a delete of a document that isn't there - not an error as such, so there's no "error" to report
+        return {"id": info["_id"], "status": 404, "message": "not_found"}
+
+    error = info.get("error")
+    if isinstance(error, dict):
+        error = "{}: {}".format(error.get('type', '<unknown type>'), error.get('reason', '<unknown reason>'))
+    if not isinstance(status_code, int):
+        # e.g. elasticsearch-py reports a status of 'N/A' if the cluster couldn't be reached
+        return {"id": info.get("_id"), "status": 500, "error": str(error), "unexpectedStatusCode": status_code}
+
+    return {"id": info.get("_id"), "status": status_code, "error": error}
+
+
+def copy_documents(source_index_name, target_index_name, mapping):
+    """
+    Copy every document in `source_index_name` into `target_index_name`, re-running each through `mapping`'s
+    transformations on the way so that it's indexed with the target's prefixes. Documents are read with a scroll and
+    written with `_bulk`, in batches of `DM_SEARCH_BULK_BATCH_SIZE`.
+
+    :return: generator of progress dicts - one after each batch, the last with a "status" of "complete" or "failed"
+    """
+    batch_size = int(current_app.config['DM_SEARCH_BULK_BATCH_SIZE'])
+    progress = {"source": source_index_name, "target": target_index_name, "total": None, "copied": 0, "failed": 0}
+
+    try:
+        with logged_duration_for_external_request('es'):
+            progress["total"] = es.count(index=source_index_name)["count"]
+
+        hits = scan(es, index=source_index_name, size=batch_size, query={"query": {"match_all": {}}})
+        documents = (
+            (
+                hit["_id"],
+                convert_indexed_request_json_into_index_json(
+                    mapping, convert_index_json_into_request_json(hit["_source"])
+                ),
+            )
+            for hit in hits
+        )
+        for result in bulk_index(target_index_name, mapping.mapping_type, documents, skip_unchanged=False):
+            progress["copied" if result["status"] == 200 else "failed"] += 1
+            if (progress["copied"] + progress["failed"]) % batch_size == 0:
+                yield dict(progress)
+    except TransportError as e:
+        current_app.logger.error(
+            "Failed to copy documents from %s to %s: %s",
+            source_index_name, target_index_name, _get_an_error_message(e)
+        )
+        yield dict(progress, status="failed", error=_get_an_error_message(e))
+        return
+
+    yield dict(progress, status="failed" if progress["failed"] else "complete")
+
+
 def status_for_index(index_name):
     try:
         with logged_duration_for_external_request('es'):
@@ -122,45 +538,28 @@ def _page_404_response(requested_page):
 def core_search_and_aggregate(index_name, doc_type, query_args, search=False, aggregations=[]):
     try:
         mapping = app.mapping.get_mapping(index_name, doc_type)
-        page_size = int(current_app.config['DM_SEARCH_PAGE_SIZE'])
-        if 'idOnly' in query_args:
-            page_size *= int(current_app.config['DM_ID_ONLY_SEARCH_PAGE_SIZE_MULTIPLIER'])
-
-        es_search_kwargs = {'search_type': 'dfs_query_then_fetch'} if search else {}
-        constructed_query = construct_query(mapping, query_args, aggregations, page_size)
-        with logged_duration_for_external_request('es'):
-            res = es.search(
-                index=index_name, body=constructed_query, track_total_hits=True, **es_search_kwargs
-            )
-
-        results = convert_es_results(mapping, res, query_args)
-
-        def url_for_search(**kwargs):
-            return url_for('.search', index_name=index_name, doc_type=doc_type, _external=True, **kwargs)
-
-        response = {
-            "meta": results['meta'],
-            "documents": results['documents'],
-            "links": generate_pagination_links(
-                query_args, results['meta']['total'],
-                page_size, url_for_search
-            ),
-        }
-
-        if aggregations:
-            # Return aggregations in a slightly cleaner format.
-            response['aggregations'] = {
-                k: {d['key']: d['doc_count'] for d in v['buckets']}
-                for k, v in res.get('aggregations', {}).items()
-            }
-
-        # determine whether we're actually off the end of the results. ES handles this as a result-less-yet-happy
-        # response, but we probably want to turn it into a 404 not least so we can match our behaviour when fetching
-        # beyond the `max_result_window` below
-        if search and constructed_query.get("from") and not response["documents"]:
-            return _page_404_response(query_args.get("page", None))
+        cache, cache_key, cache_generation, cached_response = _look_up_cached_response(
+            index_name, doc_type, query_args, search, aggregations
+        )
+        if cached_response is not None:
+            return cached_response, 200
+
+        page_size = _page_size(query_args)
+        # with no documents to return, aggregations have nothing to score
+        scoring = search and has_scoring_terms(query_args)
+        search_type = app.search_type.search_type_chooser.choose(index_name, scoring)
+        constructed_query = construct_query(mapping, query_args, aggregations, page_size, include_documents=search)
+        res, query_args = _search(
+            index_name, constructed_query, query_args, track_total_hits=True, search_type=search_type
+        )
+        app.search_type.search_type_chooser.record_shards(index_name, res)
 
-        return response, 200
+        response, status_code = _search_response(
+            index_name, doc_type, mapping, query_args, constructed_query, page_size, res, search, aggregations
+        )
+        if status_code == 200 and cache is not None:
+            cache.set(cache_key, response, cache_generation)
+        return response, status_code
 
     except TransportError as e:
         try:
@@ -173,12 +572,9 @@ def core_search_and_aggregate(index_name, doc_type, query_args, search=False, ag
             # in this case we have to fire off another request to determine how we should handle this error...
             # (note minor race condition possible if index is modified between the original call and this one)
             try:
-                body = construct_query(mapping, query_args, page_size=None)
-                with logged_duration_for_external_request('es'):
-                    result_count = es.count(
-                        index=index_name,
-                        body=body
-                    )["count"]
+                result_count = _count(
+                    index_name, construct_query(mapping, query_args, page_size=None), query_args.get(PIT_ARG)
+                )
             except TransportError as e:
                 return _get_an_error_message(e), e.status_code
             else:
@@ -193,19 +589,329 @@ def core_search_and_aggregate(index_name, doc_type, query_args, search=False, ag
         return str(e), 400
 
 
-def search_with_keywords_and_filters(index_name, doc_type, query_args):
-    return core_search_and_aggregate(index_name, doc_type, query_args, search=True)
+def _page_size(query_args):
+    page_size = int(current_app.config['DM_SEARCH_PAGE_SIZE'])
+    if 'idOnly' in query_args:
+        page_size *= int(current_app.config['DM_ID_ONLY_SEARCH_PAGE_SIZE_MULTIPLIER'])
+    return page_size
+
+
+def _search_response(index_name, doc_type, mapping, query_args, constructed_query, page_size, res, search,
+                     aggregations):
+    """Format the Elasticsearch response `res` to a search as our API responds with it"""
+    results = convert_es_results(mapping, res, query_args)
+
+    def url_for_search(**kwargs):
+        return url_for('.search', index_name=index_name, doc_type=doc_type, _external=True, **kwargs)
+
+    hits = res["hits"]["hits"]
+    # a short page must be the last; a full one may be too, in which case the next will be empty
+    next_cursor = encode_cursor(hits[-1]["sort"]) if CURSOR_ARG in query_args and len(hits) == page_size else None
+
+    response = {
+        "meta": results['meta'],
+        "documents": results['documents'],
+        "links": generate_pagination_links(
+            query_args, results['meta']['total'],
+            page_size, url_for_search, next_cursor
+        ),
+    }
+
+    if aggregations:
+        # Return aggregations in a slightly cleaner format.
+        response['aggregations'] = {
+            k: {d['key']: d['doc_count'] for d in v['buckets']}
+            for k, v in res.get('aggregations', {}).items()
+        }
+
+    # determine whether we're actually off the end of the results. ES handles this as a result-less-yet-happy
+    # response, but we probably want to turn it into a 404 not least so we can match our behaviour when fetching
+    # beyond the `max_result_window` below
+    if search and constructed_query.get("from") and not response["documents"]:
+        return _page_404_response(query_args.get("page", None))
+
+    return response, 200
+
+
+def _search_concrete_index(index_name, body, **kwargs):
+    """
+    Run a search against the concrete index `index_name` currently resolves to, saving Elasticsearch resolving the
+    alias again. Our resolution may be stale if the alias has been moved by another process and its old index deleted,
+    in which case we re-resolve and try again once.
+    """
+    concrete_index_name = app.aliases.alias_resolver.resolve(index_name)
+    try:
+        with logged_duration_for_external_request('es'):
+            return es.search(index=concrete_index_name, body=body, **kwargs)
+    except NotFoundError:
+        if concrete_index_name == index_name:
+            raise
+
+    app.aliases.alias_resolver.invalidate(index_name)
+    concrete_index_name = app.aliases.alias_resolver.resolve(index_name)
+    with logged_duration_for_external_request('es'):
+        return es.search(index=concrete_index_name, body=body, **kwargs)
+
+
+def _look_up_cached_response(index_name, doc_type, query_args, search, aggregations):
+    """
+    Returns the response cache for this search, its key and write generation, and the cached response if there is one.
+    Searches of a point in time aren't cached, as each is a snapshot of its own and opening one can't be skipped.
+    Nor are searches made outside a request, as responses' links depend on the URL they were requested at.
+    """
+    if PIT_ARG in query_args or not has_request_context():
+        return None, None, None, None
+
+    # aggregation requests (facet counts) are expensive and change little, so get a cache of their own
+    cache = app.search_cache.search_cache if search else app.search_cache.aggregation_cache
+    # get_mapping has just resolved index_name, so this doesn't need to ask Elasticsearch
+    cache_key = cache.key(
+        app.aliases.alias_resolver.resolve(index_name), doc_type, query_args,
+        search, tuple(aggregations), request.url_root,
+    )
+    cache_generation = cache.generation(cache_key)
+    return cache, cache_key, cache_generation, cache.get(cache_key)
+
+
+def _search(index_name, body, query_args, **kwargs):
+    """
+    Search `index_name`, or the point in time named by the `pit` query arg - opening one if it's empty. Returns the
+    response and the query args, with `pit` set to the id to use for the point in time from now on.
+    """
+    pit_id = query_args.get(PIT_ARG)
+    if pit_id is None:
+        return _search_concrete_index(index_name, body, **kwargs), query_args
+
+    res = _search_point_in_time(pit_id or _open_point_in_time(index_name), body, **kwargs)
+    # the id can change from one search to the next, and the links to further pages need the latest
+    query_args = MultiDict(query_args)
+    query_args[PIT_ARG] = res["pit_id"]
+    return res, query_args
+
+
+def _count(index_name, body, pit_id=None):
+    if pit_id:
+        # the count API doesn't take a point in time
+        return _search_point_in_time(pit_id, dict(body, size=0), track_total_hits=True)["hits"]["total"]["value"]
+
+    with logged_duration_for_external_request('es'):
+        return es.count(
+            index=index_name,
+            body=body
+        )["count"]
+
+
+def _open_point_in_time(index_name):
+    """Open a point in time on the concrete index `index_name` currently resolves to, returning its id"""
+    concrete_index_name = app.aliases.alias_resolver.resolve(index_name)
+    with logged_duration_for_external_request('es'):
+        return es.open_point_in_time(
+            index=concrete_index_name,
+            keep_alive=current_app.config['DM_SEARCH_PIT_KEEP_ALIVE'],
+        )["id"]
+
+
+def _search_point_in_time(pit_id, body, **kwargs):
+    """Run a search against a point in time, extending its keep-alive. The point in time determines the index."""
+    body = dict(body, pit={"id": pit_id, "keep_alive": current_app.config['DM_SEARCH_PIT_KEEP_ALIVE']})
+    with logged_duration_for_external_request('es'):
+        return es.search(body=body, **kwargs)
+
+
+def search_with_keywords_and_filters(index_name, doc_type, query_args, aggregations=[]):
+    return core_search_and_aggregate(index_name, doc_type, query_args, search=True, aggregations=aggregations)
 
 
 def aggregations_with_keywords_and_filters(index_name, doc_type, query_args, aggregations=[]):
     return core_search_and_aggregate(index_name, doc_type, query_args, aggregations=aggregations)
 
 
+def multi_search(searches):
+    """
+    Run many searches in one Elasticsearch round trip. `searches` is a sequence of (index_name, doc_type, query_args)
+    tuples, and a (result, status_code) pair is returned for each in the same order, as from
+    `search_with_keywords_and_filters`. Searches served from the response cache aren't sent to Elasticsearch.
+    """
+    results = [None] * len(searches)
+    pending = []  # [(position, prepared search)]
+    for position, (index_name, doc_type, query_args) in enumerate(searches):
+        prepared, results[position] = _prepare_multi_search(index_name, doc_type, query_args)
+        if prepared is not None:
+            pending.append((position, prepared))
+
+    if not pending:
+        return results
+
+    body = []
+    for _, prepared in pending:
+        body.extend((prepared["header"], dict(prepared["query"], track_total_hits=True)))
+    try:
+        with logged_duration_for_external_request('es'):
+            responses = es.msearch(body=body)["responses"]
+    except TransportError as e:
+        for position, _ in pending:
+            results[position] = _get_an_error_message(e), e.status_code
+        return results
+
+    for (position, prepared), res in zip(pending, responses):
+        if "error" in res:
+            results[position] = _get_an_error_message_from_info(res), res.get("status", 500)
+            continue
+
+        app.search_type.search_type_chooser.record_shards(prepared["index_name"], res)
+        results[position] = _search_response(
+            prepared["index_name"], prepared["doc_type"], prepared["mapping"], prepared["query_args"],
+            prepared["query"], prepared["page_size"], res, True, [],
+        )
+        if results[position][1] == 200:
+            prepared["cache"].set(prepared["cache_key"], results[position][0], prepared["cache_generation"])
+
+    return results
+
+
+def _prepare_multi_search(index_name, doc_type, query_args):
+    """
+    Returns the details needed to send one of a multi-search's searches to Elasticsearch and format its response, or
+    None and the (result, status_code) to respond with if it has one already.
+    """
+    if PIT_ARG in query_args:
+        return None, ("Invalid search; points in time can't be used in a multi-search", 400)
+
+    try:
+        mapping = app.mapping.get_mapping(index_name, doc_type)
+        cache, cache_key, cache_generation, cached_response = _look_up_cached_response(
+            index_name, doc_type, query_args, True, []
+        )
+        if cached_response is not None:
+            return None, (cached_response, 200)
+
+        page_size = _page_size(query_args)
+        constructed_query = construct_query(mapping, query_args, page_size=page_size)
+    except app.mapping.MappingNotFound as e:
+        return None, (e.description, 400)
+    except TransportError as e:
+        return None, (_get_an_error_message(e), e.status_code)
+    except ValueError as e:
+        return None, (str(e), 400)
+
+    return {
+        "header": {
+            # get_mapping has just resolved index_name, so this doesn't need to ask Elasticsearch
+            "index": app.aliases.alias_resolver.resolve(index_name),
+            "search_type": app.search_type.search_type_chooser.choose(index_name, has_scoring_terms(query_args)),
+        },
+        "query": constructed_query,
+        "index_name": index_name,
+        "doc_type": doc_type,
+        "mapping": mapping,
+        "query_args": query_args,
+        "page_size": page_size,
+        "cache": cache,
+        "cache_key": cache_key,
+        "cache_generation": cache_generation,
+    }, None
+
+
+def export_documents(index_name, doc_type, query_args):
+    """
+    Every document matching the search `query_args` describes, however many there are - converted as in search
+    responses, so just ids with `idOnly`. Paging arguments are ignored.
+
+    The documents are read with `DM_SEARCH_EXPORT_SLICES` sliced scrolls running in parallel, in batches of
+    `DM_SEARCH_EXPORT_BATCH_SIZE`. At most two batches per slice are held waiting to be consumed, so memory use
+    doesn't grow with the number of documents.
+
+    :return: generator of documents, ending with an {"error": ...} document if a scroll fails part way through
+    """
+    try:
+        mapping = app.mapping.get_mapping(index_name, doc_type)
+        body = construct_query(mapping, query_args, page_size=None)
+        concrete_index_name = app.aliases.alias_resolver.resolve(index_name)
+    except TransportError as e:
+        return _get_an_error_message(e), e.status_code
+
+    return (
+        convert_es_hit(mapping, hit, query_args) if not isinstance(hit, TransportError)
+        else {"error": _get_an_error_message(hit)}
+        for hit in _scroll_slices(
+            concrete_index_name,
+            # the order scrolls are cheapest to read in
+            dict(body, sort=["_doc"]),
+            int(current_app.config['DM_SEARCH_EXPORT_SLICES']),
+            int(current_app.config['DM_SEARCH_EXPORT_BATCH_SIZE']),
+            current_app.config['DM_SEARCH_EXPORT_SCROLL'],
+        )
+    ), 200
+
+
+def _scroll_slices(index_name, body, slices, batch_size, scroll):
+    """
+    Generator of every hit for `body` in `index_name`, read with `slices` sliced scrolls each in its own thread. A
+    TransportError from any of them is yielded in place of a hit and ends the generator. Closing the generator stops
+    the scrolls.
+    """
+    application = current_app._get_current_object()
+    batches = queue.Queue(maxsize=2 * slices)
+    stopping = threading.Event()
+
+    def put(item):
+        # gives up if the consumer has gone away, rather than waiting on a full queue forever
+        while not stopping.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def scroll_slice(slice_id):
+        slice_body = dict(body, slice={"id": slice_id, "max": slices}) if slices > 1 else body
+        try:
+            with application.app_context():
+                with logged_duration_for_external_request('es'):
+                    res = es.search(index=index_name, body=slice_body, scroll=scroll, size=batch_size)
+                try:
+                    while res["hits"]["hits"] and put(res["hits"]["hits"]):
+                        with logged_duration_for_external_request('es'):
+                            res = es.scroll(scroll_id=res["_scroll_id"], scroll=scroll)
+                finally:
+                    es.clear_scroll(scroll_id=res["_scroll_id"], ignore=(404,))
+        except TransportError as e:
+            application.logger.error("Export scroll of %s failed: %s", index_name, _get_an_error_message(e))
+            put(e)
+        finally:
+            put(None)
+
+    for slice_id in range(slices):
+        threading.Thread(
+            target=scroll_slice, args=(slice_id,), name=f'export-slice-{slice_id}', daemon=True,
+        ).start()
+
+    try:
+        remaining_slices = slices
+        while remaining_slices:
+            batch = batches.get()
+            if batch is None:
+                remaining_slices -= 1
+            elif isinstance(batch, TransportError):
+                yield batch
+                return
+            else:
+                yield from batch
+    finally:
+        stopping.set()
+
+
 def _get_an_error_message(exception):
     try:
         info = exception.info
     except AttributeError:
         return str(exception)
+    return _get_an_error_message_from_info(info)
+
+
+def _get_an_error_message_from_info(info):
+    """The message for an Elasticsearch error response body `info`, as found in a TransportError or a multi-search"""
     try:
         error = info['error']
     except (KeyError, TypeError):
@@ -1,9 +1,22 @@
+from flask import Response, json, jsonify, request, stream_with_context
 from werkzeug.exceptions import abort
 
+from dmutils.config import convert_to_boolean
+
 from app.main import main
-from app.main.services.search_service import create_index, create_alias, status_for_index, delete_index
-from app.main.services.process_request_json import get_json_from_request
-from app.main.services.response_formatters import api_response
+from app.main.services.search_service import (
+    copy_documents,
+    create_alias,
+    create_index,
+    delete_index,
+    finish_bulk_load,
+    start_bulk_load,
+    status_for_index,
+)
+from app.main.services.process_request_json import check_json_from_request, get_json_from_request
+from app.main.services.response_formatters import NDJSON_MIMETYPE, api_response
+from app.mapping import mapping_registry
+from app.write_behind import write_behind_queue
 
 
 @main.route('/<string:index_name>', methods=['PUT'])
@@ -47,3 +60,104 @@ def status(index_name):
     result, status_code = status_for_index(index_name)
 
     return api_response(result, status_code, key='status')
+
+
+@main.route('/<string:index_name>/_bulk-load', methods=['PUT'])
+def start_bulk_load_view(index_name):
+    """Put an index into bulk-load mode: no refreshes, no replicas"""
+    result, status_code = start_bulk_load(index_name)
+
+    return api_response(result, status_code)
+
+
+@main.route('/<string:index_name>/_bulk-load', methods=['DELETE'])
+def finish_bulk_load_view(index_name):
+    """
+    Take an index out of bulk-load mode, restoring its settings and waiting for it to be healthy. Pass
+    ``?force_merge=true`` to force-merge it down to one segment first - worthwhile for an index which won't see many
+    more writes.
+    """
+    force_merge = convert_to_boolean(request.args.get('force_merge', False)) is True
+    result, status_code = finish_bulk_load(index_name, force_merge=force_merge)
+
+    return api_response(result, status_code)
+
+
+@main.route('/<string:index_name>/_reindex', methods=['POST'])
+def reindex(index_name):
+    """
+    Create the new index `index_name` from the named mapping and copy every document from the source index (or alias)
+    into it, re-transforming them for the new mapping. Expects a JSON body of the form
+    ``{"source": "g-cloud-12", "mapping": "services-g-cloud-12", "alias": "g-cloud-12"}`` - if "alias" is given it is
+    repointed at the new index once every document has been copied successfully. The new index is kept in bulk-load
+    mode while the documents are copied, and taken out of it however the copy ends.
+
+    Progress is streamed back as NDJSON, one line per batch of documents copied, then a line with the final status of
+    the new index.
+    """
+    source_index_name = get_json_from_request('source')
+    mapping_name = get_json_from_request('mapping')
+    alias_name = check_json_from_request(request).get('alias')
+
+    result, status_code = create_index(index_name, mapping_name)
+    if status_code == 200:
+        result, status_code = start_bulk_load(index_name)
+    if status_code != 200:
+        return api_response(result, status_code)
+
+    mapping = mapping_registry.get(mapping_name).mapping
+
+    def generate_progress():
+        progress = {}
+        try:
+            for progress in copy_documents(source_index_name, index_name, mapping):
+                yield json.dumps(progress) + "\n"
+        finally:
+            # restores the index's settings and refreshes it, so the copied documents are searchable before anything
+            # is pointed at them - and so an index which couldn't be copied to isn't left without replicas
+            result, status_code = finish_bulk_load(index_name)
+
+        if progress.get("status") != "complete":
+            result, status_code = "Not every document could be copied from '{}'".format(source_index_name), 500
+        elif status_code == 200 and alias_name:
+            result, status_code = create_alias(alias_name, index_name)
+
+        yield json.dumps({
+            "target": index_name,
+            "alias": alias_name,
+            "status": ("aliased" if alias_name else "ready") if status_code == 200 else "failed",
+            "message": result,
+        }) + "\n"
+
+    return Response(
+        stream_with_context(generate_progress()),
+        mimetype=NDJSON_MIMETYPE,
+        # compressing the response would mean buffering all of it
+        headers={'X-Compression-Safe': '0'},
+    )
+
+
+@main.route('/_mappings', methods=['GET'])
+def mapping_definitions():
+    """The hash of the content of each mapping definition this process has loaded"""
+    return jsonify(mappings={name: mapping_registry.get(name).content_hash for name in mapping_registry.names()}), 200
+
+
+@main.route('/_mappings/_reload', methods=['POST'])
+def reload_mapping_definitions():
+    """
+    Re-read the mapping definitions in `mappings/`, for this process only. If any of them can't be read or is invalid
+    the ones already loaded are kept.
+    """
+    try:
+        mapping_registry.reload()
+    except ValueError as e:
+        return api_response(str(e), 500)
+
+    return mapping_definitions()
+
+
+@main.route('/_write-behind', methods=['GET'])
+def write_behind_status():
+    """Queue depth, flush timings and failures for this process's write-behind queue"""
+    return jsonify(write_behind=write_behind_queue.stats()), 200
@@ -57,6 +57,6 @@ def root():
     return jsonify(
         {
             'links': links,
-            'field-mappings': [name for name in app.mapping.get_mapping_file_paths_by_name().keys()],
+            'field-mappings': list(app.mapping.mapping_registry.names()),
         }
     ), 200
@@ -1,19 +1,28 @@
-from flask import jsonify, request
+from flask import Response, current_app, request, stream_with_context
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import abort
 
+from app.json_codec import json_codec, jsonify
 from app.main import main
-from app.main.services.response_formatters import api_response
+from app.main.services.response_formatters import NDJSON_MIMETYPE, api_response
 from app.main.services.search_service import search_with_keywords_and_filters, aggregations_with_keywords_and_filters, \
-    fetch_by_id
+    export_documents, fetch_by_id, multi_search
+from app.main.services.process_request_json import get_json_from_request
 
 
 @main.route('/<string:index_name>/<string:doc_type>/search', methods=['GET'])
 def search(index_name, doc_type):
-    result, status_code = search_with_keywords_and_filters(index_name, doc_type, request.args)
+    # facet counts for the same search can come back with its results, rather than needing a separate request
+    result, status_code = search_with_keywords_and_filters(index_name, doc_type, request.args,
+                                                           request.args.getlist('aggregations'))
 
     if status_code == 200:
-        return jsonify(meta=result['meta'],
-                       documents=result["documents"],
-                       links=result['links']), status_code
+        response = dict(meta=result['meta'],
+                        documents=result["documents"],
+                        links=result['links'])
+        if 'aggregations' in result:
+            response['aggregations'] = result['aggregations']
+        return jsonify(response), status_code
     else:
         return api_response(result, status_code)
 
@@ -31,6 +40,60 @@ def aggregations(index_name, doc_type):
         return api_response(result, status_code)
 
 
+@main.route('/_msearch', methods=['POST'])
+def search_many():
+    """
+    Run many searches in one request. Expects a JSON body of the form
+    ``{"searches": [{"index": "g-cloud-12", "doc_type": "services", "query_args": {"q": "email"}}, ...]}``, where each
+    ``query_args`` holds the arguments a ``/search`` would take (a list for repeated arguments), and responds with the
+    result of each search and its status, in the same order.
+    """
+    searches = get_json_from_request('searches')
+    if not isinstance(searches, list) or not all(
+        isinstance(search, dict)
+        and isinstance(search.get('index'), str)
+        and isinstance(search.get('doc_type'), str)
+        and isinstance(search.get('query_args', {}), dict)
+        and all(_is_query_arg_value(value) for value in search.get('query_args', {}).values())
+        for search in searches
+    ):
+        abort(400, "Invalid JSON; 'searches' must be a list of objects with 'index', 'doc_type' and 'query_args', "
+                   "whose values are strings or lists of strings")
+    if len(searches) > int(current_app.config['DM_SEARCH_MSEARCH_MAX_SEARCHES']):
+        abort(400, "Too many searches; the maximum is {}".format(current_app.config['DM_SEARCH_MSEARCH_MAX_SEARCHES']))
+
+    results = multi_search([
+        (search['index'], search['doc_type'], MultiDict(search.get('query_args', {})))
+        for search in searches
+    ])
+
+    return jsonify(responses=[
+        dict(result, status=status_code) if status_code == 200 else {"status": status_code, "error": result}
+        for result, status_code in results
+    ]), 200
+
+
+def _is_query_arg_value(value):
+    # as a query string would give
+    return isinstance(value, str) or (isinstance(value, list) and all(isinstance(item, str) for item in value))
+
+
+@main.route('/<string:index_name>/<string:doc_type>/export', methods=['GET'])
+def export(index_name, doc_type):
+    """Every document matching the search in one NDJSON response, rather than page by page"""
+    result, status_code = export_documents(index_name, doc_type, request.args)
+
+    if status_code != 200:
+        return api_response(result, status_code)
+
+    return Response(
+        stream_with_context(json_codec.dumps(document) + b"\n" for document in result),
+        mimetype=NDJSON_MIMETYPE,
+        # compressing the response would mean buffering all of it
+        headers={'X-Compression-Safe': '0'},
+    )
+
+
 @main.route('/<string:index_name>/<string:doc_type>/<string:service_id>',
             methods=['GET'])
 def fetch_service(index_name, doc_type, service_id):
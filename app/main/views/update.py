@@ -1,11 +1,28 @@
-from flask import request
+from itertools import islice
+
+from flask import Response, current_app, json, jsonify, request, stream_with_context
 from werkzeug.exceptions import abort
 
+from app.json_codec import json_codec
 from app.main import main
 from app.mapping import get_mapping
-from app.main.services.process_request_json import convert_request_json_into_index_json, check_json_from_request
-from app.main.services.response_formatters import api_response
-from app.main.services.search_service import index, delete_by_id
+from app.main.services.conversion_pool import conversion_pool
+from app.main.services.process_request_json import (
+    PartialDocumentError,
+    check_json_from_request,
+    convert_partial_request_json_into_index_json,
+    convert_request_json_into_index_json,
+    get_json_from_request,
+)
+from app.main.services.response_formatters import NDJSON_MIMETYPE, api_response
+from app.main.services.search_service import (
+    REFRESH_OPTIONS,
+    bulk_delete,
+    bulk_index,
+    delete_by_id,
+    index,
+    update,
+)
 
 
 @main.route('/<string:index_name>/<string:doc_type>/<string:document_id>', methods=['PUT'])
@@ -17,7 +34,24 @@ def index_document(index_name, doc_type, document_id):
 
     mapping = get_mapping(index_name, doc_type)
     index_json = convert_request_json_into_index_json(mapping, json_payload)
-    result, status_code = index(index_name, doc_type, index_json, document_id)
+    result, status_code = index(index_name, doc_type, index_json, document_id, refresh=_get_refresh_option())
+
+    return api_response(result, status_code)
+
+
+@main.route('/<string:index_name>/<string:doc_type>/<string:document_id>', methods=['PATCH'])
+def update_document(index_name, doc_type, document_id):
+    """Update some of a document's fields, leaving the rest as they are"""
+    json_payload = get_json_from_request('document')
+    if not isinstance(json_payload, dict) or not json_payload:
+        abort(400, "Invalid JSON; 'document' must be an object with at least one field")
+
+    mapping = get_mapping(index_name, doc_type)
+    try:
+        index_json = convert_partial_request_json_into_index_json(mapping, json_payload)
+    except PartialDocumentError as e:
+        abort(400, str(e))
+    result, status_code = update(index_name, doc_type, index_json, document_id, refresh=_get_refresh_option())
 
     return api_response(result, status_code)
 
@@ -27,6 +61,140 @@ def delete_service(index_name, doc_type, service_id):
     # This checks that the index_name and doc_type exist or 400s
     get_mapping(index_name, doc_type)
 
-    result, status_code = delete_by_id(index_name, doc_type, service_id)
+    result, status_code = delete_by_id(index_name, doc_type, service_id, refresh=_get_refresh_option())
 
     return api_response(result, status_code)
+
+
+@main.route('/<string:index_name>/<string:doc_type>/_bulk', methods=['POST'])
+def bulk_index_documents(index_name, doc_type):
+    """
+    Index many documents in one request. Expects a JSON body of the form
+    ``{"documents": [{"id": "123", "document": {...}}, ...]}`` and responds with a status for each document, in the
+    same order.
+
+    Uploads sent as ``application/x-ndjson``, one ``{"id": ..., "document": {...}}`` object per line, are instead read
+    from the request stream as they arrive and indexed a chunk at a time, with each chunk's results streamed back as a
+    line of NDJSON - so neither the upload nor the response is ever held in memory whole.
+    """
+    refresh = _get_refresh_option()
+    if request.mimetype == NDJSON_MIMETYPE:
+        mapping = get_mapping(index_name, doc_type)
+        return Response(
+            stream_with_context(_bulk_index_ndjson_stream(index_name, doc_type, mapping, request.stream, refresh)),
+            mimetype=NDJSON_MIMETYPE,
+            # compressing the response would mean buffering all of it
+            headers={'X-Compression-Safe': '0'},
+        )
+
+    documents = get_json_from_request('documents')
+    if not isinstance(documents, list):
+        abort(400, "Invalid JSON; 'documents' must be a list")
+
+    mapping = get_mapping(index_name, doc_type)
+    items = _bulk_index_documents(index_name, doc_type, mapping, documents, refresh)
+
+    return jsonify(
+        errors=any(item['status'] != 200 for item in items),
+        items=items,
+    ), 200
+
+
+@main.route('/<string:index_name>/<string:doc_type>/_bulk', methods=['DELETE'])
+def bulk_delete_documents(index_name, doc_type):
+    """
+    Delete many documents in one request. Expects a JSON body of the form ``{"ids": ["123", ...]}`` and responds with
+    a status for each id, in the same order. Ids which weren't in the index are listed in ``notFound`` and don't count
+    as errors.
+    """
+    document_ids = get_json_from_request('ids')
+    if not isinstance(document_ids, list) or not all(isinstance(i, (str, int)) for i in document_ids):
+        abort(400, "Invalid JSON; 'ids' must be a list of document ids")
+
+    # This checks that the index_name and doc_type exist or 400s
+    get_mapping(index_name, doc_type)
+
+    items = list(bulk_delete(
+        index_name,
+        doc_type,
+        (str(document_id) for document_id in document_ids),
+        refresh=_get_refresh_option(),
+    ))
+
+    return jsonify(
+        errors=any(item['status'] not in (200, 404) for item in items),
+        notFound=[item['id'] for item in items if item['status'] == 404],
+        items=items,
+    ), 200
+
+
+def _bulk_index_documents(index_name, doc_type, mapping, documents, refresh=None):
+    items = [None] * len(documents)
+    to_index = []
+    for position, document in enumerate(documents):
+        if not isinstance(document, dict):
+            document = {}
+        document_id = None if document.get('id') is None else str(document['id'])
+        json_payload = document.get('document') or document.get('service')
+        if document_id is None or not isinstance(json_payload, dict):
+            items[position] = {
+                "id": document_id,
+                "status": 400,
+                "error": "Each item must have 'id' and 'document' keys",
+            }
+        else:
+            to_index.append((position, document_id, json_payload))
+
+    index_jsons = conversion_pool.convert(mapping, [json_payload for _, _, json_payload in to_index])
+    # consumed to the end, as a debounced refresh is only requested once all the results have been read
+    results = list(bulk_index(
+        index_name,
+        doc_type,
+        ((document_id, index_json) for (_, document_id, _), index_json in zip(to_index, index_jsons)),
+        refresh=refresh,
+    ))
+    for (position, _, _), result in zip(to_index, results):
+        items[position] = result
+
+    return items
+
+
+def _bulk_index_ndjson_stream(index_name, doc_type, mapping, stream, refresh=None):
+    chunk_size = int(current_app.config['DM_SEARCH_BULK_BATCH_SIZE'])
+    line_numbered_documents = (
+        (line_number, _parse_ndjson_line(line))
+        for line_number, line in enumerate(stream, start=1)
+        if line.strip()
+    )
+
+    for chunk_number, chunk in enumerate(_chunked(line_numbered_documents, chunk_size)):
+        items = _bulk_index_documents(index_name, doc_type, mapping, [document for _, document in chunk], refresh)
+        yield json.dumps({
+            "chunk": chunk_number,
+            "firstLine": chunk[0][0],
+            "errors": any(item['status'] != 200 for item in items),
+            "items": items,
+        }) + "\n"
+
+
+def _get_refresh_option():
+    refresh = request.args.get('refresh')
+    if refresh is not None and refresh not in REFRESH_OPTIONS:
+        abort(400, "Invalid 'refresh' value; expected one of: {}".format(", ".join(REFRESH_OPTIONS)))
+    return refresh
+
+
+def _parse_ndjson_line(line):
+    try:
+        return json_codec.loads(line)
+    except ValueError:
+        return None
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
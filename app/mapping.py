@@ -1,4 +1,9 @@
+import copy
+import hashlib
 import os.path
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from functools import reduce
 from itertools import groupby
 from operator import or_
@@ -6,13 +11,21 @@ from operator import or_
 from flask import json
 
 from elasticsearch.exceptions import NotFoundError
+from gds_metrics.metrics import Counter
 from werkzeug.exceptions import BadRequest
 
 from dmutils.timing import logged_duration_for_external_request
 
 from app import elasticsearch_client as es
+from app.aliases import alias_resolver
 
-_mapping_files = None  # dict(name: filespec)
+MAPPINGS_DIRECTORY = os.path.join(os.path.dirname(__file__), '../mappings')
+
+MAPPING_CACHE_REQUESTS_TOTAL = Counter(
+    'search_api_mapping_cache_requests_total',
+    'Total lookups of the process-local mapping cache',
+    ['result']
+)
 
 
 class MappingNotFound(BadRequest):
@@ -26,6 +39,8 @@ class Mapping(object):
 
     # for now, these definitions are identical
     response_field_prefix = "dmtext"
+    # unprefixed, so not treated as one of the document's own fields
+    fingerprint_field = "dmfingerprint"
 
     def _get_prefix_split_fields(self):
         """
@@ -64,13 +79,107 @@ class Mapping(object):
 
         self.sort_clause = self.definition['mappings'].get('_meta', {}).get('dm_sort_clause', ["_score"])
 
+        # indexes created before we started fingerprinting documents can't store one (the mappings are strict)
+        self.has_fingerprint = self.fingerprint_field in self.definition['mappings']['properties']
+
+
+class MappingCache(object):
+    """
+    A process-local cache of built `Mapping` objects, keyed by the name of the concrete index they belong to.
+
+    Entries expire `ttl` seconds after being fetched and the least recently used entry is evicted once `max_size`
+    entries are held. Anything which changes or removes an index's mapping should call `invalidate`.
+    """
+    def __init__(self, ttl=300, max_size=64):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {concrete_index_name: (expiry, mapping)}
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.ttl = app.config['DM_MAPPING_CACHE_TTL']
+        self.max_size = app.config['DM_MAPPING_CACHE_MAX_SIZE']
+        self.clear()
+
+    def get(self, index_name):
+        with self._lock:
+            entry = self._entries.get(index_name)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(index_name)
+                self.hits += 1
+                MAPPING_CACHE_REQUESTS_TOTAL.labels('hit').inc()
+                return entry[1]
+
+            self._entries.pop(index_name, None)
+            self.misses += 1
+            MAPPING_CACHE_REQUESTS_TOTAL.labels('miss').inc()
+            return None
+
+    def set(self, index_name, mapping):
+        if not self.ttl or not self.max_size:
+            return
+
+        with self._lock:
+            self._entries[index_name] = (time.monotonic() + self.ttl, mapping)
+            self._entries.move_to_end(index_name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, index_name):
+        with self._lock:
+            self._entries.pop(index_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+mapping_cache = MappingCache()
+
 
 def get_mapping(index_name, document_type):
+    # if we've seen this (alias) name recently we can go straight to its concrete index's cached mapping
+    mapping = mapping_cache.get(alias_resolver.get(index_name) or index_name)
+    if mapping is None:
+        concrete_index_name, mapping = _fetch_mapping(index_name, document_type)
+        # a wildcard or list of indexes isn't one index, so mustn't be taken for its first
+        if concrete_index_name is not None:
+            alias_resolver.set(index_name, concrete_index_name)
+            mapping_cache.set(concrete_index_name, mapping)
+
+    # In ES 7 mapping types are being removed, so document types are no longer relevant.
+    # However our API still uses them in URLs and is expecting a 400 to be raised in case
+    # the wrong document type is specified.
+    if mapping.mapping_type != document_type:
+        raise MappingNotFound(
+            f"Document type '{document_type}' is not valid in index '{index_name}' - not returning mapping."
+        )
+
+    return mapping
+
+
+def _fetch_mapping(index_name, document_type):
+    """
+    The name of the one concrete index `index_name` refers to (or None if it refers to several) and its mapping (or
+    the first of their mappings).
+    """
     try:
         # es.indices.get_mapping has a key for the index name, regardless of any alias we may be going via, so rather
-        # than use index_name, we access the one and only value in the dictionary using next(iter).
+        # than use index_name, we access the first item in the dictionary using next(iter).
         with logged_duration_for_external_request('es'):
-            mapping_data = next(iter(es.indices.get_mapping(index=index_name).values()))
+            mappings = es.indices.get_mapping(index=index_name)
+            concrete_index_name, mapping_data = next(iter(mappings.items()))
     except NotFoundError as e:
         if e.error == "type_missing_exception":
             raise MappingNotFound("Document type '{}' is not valid in index '{}' - no mapping found.".format(
@@ -81,33 +190,81 @@ def get_mapping(index_name, document_type):
         raise MappingNotFound("Document type '{}' is not valid in index '{}' - no mapping found.".format(
             document_type, index_name))
 
-    # In ES 7 mapping types are being removed, so document types are no longer relevant.
-    # However our API still uses them in URLs and is expecting a 400 to be raised in case
-    # the wrong document type is specified.
-    if mapping_data["mappings"]["_meta"]["doc_type"] != document_type:
-        raise MappingNotFound(
-            f"Document type '{document_type}' is not valid in index '{index_name}' - not returning mapping."
-        )
+    if len(mappings) != 1:
+        concrete_index_name = None
+    return concrete_index_name, Mapping(mapping_data, mapping_type=mapping_data["mappings"]["_meta"]["doc_type"])
+
+
+class MappingDefinitionError(ValueError):
+    pass
 
-    return Mapping(mapping_data, mapping_type=document_type)
 
+RegisteredMapping = namedtuple('RegisteredMapping', ('name', 'content_hash', 'mapping'))
 
-def load_mapping_definition(mapping_name):
-    mapping_file_spec = get_mapping_file_paths_by_name().get(mapping_name)
-    if mapping_file_spec is not None:
-        with open(mapping_file_spec) as mapping_file:
-            return json.load(mapping_file)
 
-    else:
-        raise MappingNotFound("Mapping definition named '{}' not found.".format(mapping_name))
+class MappingRegistry(object):
+    """
+    The mapping definitions in `mappings/`, read, parsed and validated once when the app is created (or on an explicit
+    `reload`, which `POST /_mappings/_reload` asks for) so that serving them needs no file I/O.
 
+    Each definition is kept along with a `Mapping` built from it and a hash of its content, and is given a
+    `Mapping.fingerprint_field` property for indexes created from it. The definitions held here are shared and mustn't
+    be modified - `get_definition` returns a copy which the caller is free to modify.
+    """
+    def __init__(self, directory=MAPPINGS_DIRECTORY):
+        self.directory = directory
+        self._registered = {}  # {name: RegisteredMapping}
 
-def get_mapping_file_paths_by_name():
-    global _mapping_files
-    if _mapping_files is None:
-        _mapping_files = dict()
-        with os.scandir(os.path.join(os.path.dirname(__file__), '../mappings')) as directory:
+    def init_app(self, app):
+        self.reload()
+
+    def reload(self):
+        registered = {}
+        with os.scandir(self.directory) as directory:
             for entry in directory:
                 if not entry.name.startswith('.') and entry.name.endswith('.json') and entry.is_file():
-                    _mapping_files[entry.name.rsplit('.', 1)[0]] = entry.path
-    return _mapping_files
+                    name = entry.name.rsplit('.', 1)[0]
+                    with open(entry.path) as mapping_file:
+                        definition = json.load(mapping_file)
+                    registered[name] = self._register(name, definition)
+
+        # swap in the new set of mappings in one go so concurrent readers never see a partial set
+        self._registered = registered
+
+    @staticmethod
+    def _register(name, definition):
+        try:
+            properties = definition['mappings']['properties']
+            doc_type = definition['mappings']['_meta']['doc_type']
+        except (KeyError, TypeError):
+            raise MappingDefinitionError(f"Mapping definition '{name}' must have mappings.properties and a doc_type")
+        if not properties:
+            raise MappingDefinitionError(f"Mapping definition '{name}' has no properties")
+        for transformation in definition['mappings']['_meta'].get('transformations', ()):
+            if len(transformation) != 1:
+                raise MappingDefinitionError(
+                    f"Mapping definition '{name}' has a transformation without exactly one type: {transformation}"
+                )
+
+        content_hash = hashlib.sha256(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()
+
+        # somewhere to store each document's fingerprint, so that unchanged documents needn't be rewritten. it's only
+        # ever read back from _source.
+        properties.setdefault(Mapping.fingerprint_field, {"type": "keyword", "index": False, "doc_values": False})
+
+        return RegisteredMapping(name, content_hash, Mapping(definition, mapping_type=doc_type))
+
+    def names(self):
+        return self._registered.keys()
+
+    def get(self, name):
+        try:
+            return self._registered[name]
+        except KeyError:
+            raise MappingNotFound("Mapping definition named '{}' not found.".format(name))
+
+    def get_definition(self, name):
+        return copy.deepcopy(self.get(name).mapping.definition)
+
+
+mapping_registry = MappingRegistry()
@@ -0,0 +1,101 @@
+import threading
+
+from elasticsearch import TransportError
+from gds_metrics.metrics import Counter
+
+from dmutils.timing import logged_duration_for_external_request
+
+from app import elasticsearch_client as es
+from app.search_cache import write_generations
+
+
+REFRESH_REQUESTS_TOTAL = Counter(
+    'search_api_refresh_requests_total',
+    'Total index refreshes requested of the refresh coordinator, by whether they were merged into one already pending',
+    ['result']
+)
+
+
+class RefreshCoordinator(object):
+    """
+    Merges requests to refresh an index into one Elasticsearch refresh per index every `window` seconds.
+
+    The first request for an index schedules a refresh `window` seconds later; further requests made before that
+    refresh starts are merged into it. A request made while a refresh is running schedules another, as the writes it
+    follows may have missed the running one.
+    """
+    def __init__(self, window=1.0):
+        self.window = window
+        self._app = None
+        self._lock = threading.Lock()
+        self._scheduled = {}  # {index_name: threading.Timer}
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.window = float(app.config['DM_SEARCH_REFRESH_DEBOUNCE_WINDOW'])
+        self._app = app
+        self.clear()
+
+    def request(self, index_name):
+        with self._lock:
+            if index_name in self._scheduled:
+                self._merged += 1
+                REFRESH_REQUESTS_TOTAL.labels('merged').inc()
+                return
+
+            timer = threading.Timer(self.window, self._refresh, (index_name,))
+            timer.daemon = True
+            self._scheduled[index_name] = timer
+            self._requested += 1
+            REFRESH_REQUESTS_TOTAL.labels('scheduled').inc()
+        timer.start()
+
+    def flush(self):
+        """Carry out any scheduled refreshes now, in the calling thread."""
+        with self._lock:
+            index_names = list(self._scheduled)
+        for index_name in index_names:
+            self._refresh(index_name)
+
+    def clear(self):
+        with self._lock:
+            for timer in self._scheduled.values():
+                timer.cancel()
+            self._scheduled.clear()
+        self._reset_stats()
+
+    def stats(self):
+        return {
+            'pending': len(self._scheduled),
+            'requested': self._requested,
+            'merged': self._merged,
+            'refreshes': self._refreshes,
+            'failures': self._failures,
+        }
+
+    def _reset_stats(self):
+        self._requested = 0
+        self._merged = 0
+        self._refreshes = 0
+        self._failures = 0
+
+    def _refresh(self, index_name):
+        with self._lock:
+            timer = self._scheduled.pop(index_name, None)
+        if timer is None:
+            # already done by a flush
+            return
+        timer.cancel()
+
+        with self._app.app_context():
+            try:
+                with logged_duration_for_external_request('es'):
+                    es.indices.refresh(index=index_name)
+                write_generations.invalidate(index_name, refreshed=True)
+                self._refreshes += 1
+            except TransportError as e:
+                self._failures += 1
+                self._app.logger.warning("Failed to refresh %s: %s", index_name, e)
+
+
+refresh_coordinator = RefreshCoordinator()
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from gds_metrics.metrics import Counter
+
+from app.aliases import alias_resolver
+from app.json_codec import json_codec
+
+
+SEARCH_CACHE_REQUESTS_TOTAL = Counter(
+    'search_api_search_cache_requests_total',
+    'Total lookups of the process-local search and aggregation response caches',
+    ['cache', 'result']
+)
+
+
+class WriteGenerations(object):
+    """
+    A per-index count of the writes made through this process, and when the latest was made. Anything writing to an
+    index should call `bump` with the concrete index Elasticsearch reports having written to.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generations = defaultdict(int)  # {concrete_index_name: generation}
+        self._last_writes = {}  # {concrete_index_name: time.monotonic() of last unsettled write}
+
+    def get(self, index_name):
+        return self._generations.get(index_name, 0)
+
+    def last_write(self, index_name):
+        return self._last_writes.get(index_name, float('-inf'))
+
+    def bump(self, *index_names, settled=False, refreshed=False):
+        """
+        Record a change to each of `index_names`. Unless `settled`, the change is taken to be a write which may not be
+        visible to searches until the index next refreshes. `refreshed` means the indexes have just been refreshed,
+        which settles the change and every write before it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for index_name in index_names:
+                self._generations[index_name] += 1
+                if refreshed:
+                    self._last_writes.pop(index_name, None)
+                elif not settled:
+                    self._last_writes[index_name] = now
+
+    def invalidate(self, index_name, settled=False, refreshed=False):
+        """Like `bump`, for an index or alias name which may not be the concrete index responses are cached under"""
+        self.bump(*{index_name, alias_resolver.get(index_name) or index_name}, settled=settled, refreshed=refreshed)
+
+
+write_generations = WriteGenerations()
+
+
+class SearchCache(object):
+    """
+    A process-local LRU cache of search or aggregation responses, keyed by concrete index, doc type and a canonical
+    form of the query.
+
+    Every entry records its index's write generation when its search started. Once the index has been written to
+    through this process the entry is no longer served, unless it's less than `max_stale` seconds old. Writes made
+    through other processes are only seen once entries expire after `ttl` seconds. Responses aren't stored within
+    `settle_time` seconds of a write to their index, as the write may not be visible to searches until the index next
+    refreshes.
+
+    The least recently used entries are evicted once `max_entries` are held, or the responses held would take more
+    than `max_bytes` to serialise.
+
+    `config_prefix` names the app config settings `init_app` reads these from.
+    """
+    def __init__(
+        self, name='search', config_prefix='DM_SEARCH_CACHE', generations=None,
+        ttl=60, max_entries=1024, max_bytes=64 * 1024 * 1024, max_stale=0, settle_time=2.0,
+    ):
+        self.name = name
+        self.config_prefix = config_prefix
+        self.generations = generations or WriteGenerations()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_stale = max_stale
+        self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {key: (stored_at, generation, size, response)}
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.ttl = app.config[self.config_prefix + '_TTL']
+        self.max_entries = app.config[self.config_prefix + '_MAX_ENTRIES']
+        self.max_bytes = app.config[self.config_prefix + '_MAX_BYTES']
+        self.max_stale = float(app.config[self.config_prefix + '_MAX_STALE'])
+        self.settle_time = float(app.config['DM_SEARCH_CACHE_WRITE_SETTLE_TIME'])
+        self.clear()
+
+    @property
+    def enabled(self):
+        return bool(self.ttl and self.max_entries and self.max_bytes)
+
+    def key(self, index_name, doc_type, query_args, *extra):
+        """
+        Build the cache key for a query against concrete index `index_name`. `extra` should hold anything else the
+        response depends on. Filter values are sorted, as their order doesn't affect which documents match, but each is
+        kept as often as it's given - a repeated `filter_lot=a,b` is two filters, not the one.
+        """
+        return (
+            index_name,
+            doc_type,
+            tuple(sorted(
+                (name, tuple(sorted(values)) if name.startswith('filter_') else tuple(values))
+                for name, values in query_args.lists()
+            )),
+        ) + extra
+
+    def generation(self, key):
+        """The write generation to pass to `set` along with the response to a search started now"""
+        return self.generations.get(key[0])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, generation, _, response = entry
+                age = time.monotonic() - stored_at
+                if age < self.ttl and (generation == self.generations.get(key[0]) or age < self.max_stale):
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    SEARCH_CACHE_REQUESTS_TOTAL.labels(self.name, 'hit').inc()
+                    return response
+
+                self._remove(key)
+            self._misses += 1
+            SEARCH_CACHE_REQUESTS_TOTAL.labels(self.name, 'miss').inc()
+            return None
+
+    def set(self, key, response, generation):
+        if not self.enabled:
+            return
+
+        index_name = key[0]
+        size = len(json_codec.dumps(response))
+        with self._lock:
+            if generation != self.generations.get(index_name):
+                # written to while the search was running, so this response may already be stale
+                return
+            if time.monotonic() - self.generations.last_write(index_name) < self.settle_time:
+                return
+            if size > self.max_bytes:
+                return
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), generation, size, response)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._reset_stats()
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_ratio': self._hits / lookups if lookups else None,
+            'evictions': self._evictions,
+        }
+
+    def _reset_stats(self):
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _remove(self, key):
+        size = self._entries.pop(key)[2]
+        self._bytes -= size
+
+
+search_cache = SearchCache('search', 'DM_SEARCH_CACHE', write_generations)
+aggregation_cache = SearchCache(
+    'aggregation', 'DM_AGGREGATION_CACHE', write_generations, ttl=300, max_entries=256, max_bytes=16 * 1024 * 1024,
+)
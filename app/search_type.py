@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+from gds_metrics.metrics import Counter
+
+from app.aliases import alias_resolver
+
+
+QUERY_THEN_FETCH = 'query_then_fetch'
+DFS_QUERY_THEN_FETCH = 'dfs_query_then_fetch'
+SEARCH_TYPES = (QUERY_THEN_FETCH, DFS_QUERY_THEN_FETCH)
+
+SEARCH_TYPE_REQUESTS_TOTAL = Counter(
+    'search_api_search_type_requests_total',
+    'Total searches sent to Elasticsearch, by the search type chosen for them',
+    ['search_type']
+)
+
+
+class SearchTypeChooser(object):
+    """
+    Chooses the search type for each search. `dfs_query_then_fetch` first gathers term statistics from every shard so
+    that documents are scored consistently wherever they're held, at the cost of an extra round trip to each shard.
+    That's only worth paying for a query with scoring terms against an index with more than one primary shard.
+
+    Primary shard counts are learned from the `_shards` of search responses, which every search reports anyway, and
+    kept for the least recently used `max_size` concrete indexes. Until an index's count is known its searches use
+    `dfs_query_then_fetch`, as they always used to.
+
+    `overrides` maps index or alias names to the search type to always use for them.
+    """
+    def __init__(self, overrides=None, max_size=64):
+        self.overrides = dict(overrides or {})
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._primary_shards = OrderedDict()  # {concrete_index_name: number_of_shards}
+
+    def init_app(self, app):
+        overrides = app.config['DM_SEARCH_TYPE_OVERRIDES'] or {}
+        invalid = {name: search_type for name, search_type in overrides.items() if search_type not in SEARCH_TYPES}
+        if invalid:
+            raise ValueError("Invalid DM_SEARCH_TYPE_OVERRIDES {!r}; expected one of: {}".format(
+                invalid, ", ".join(SEARCH_TYPES)
+            ))
+        self.overrides = dict(overrides)
+        self.clear()
+
+    def choose(self, index_name, scoring):
+        """
+        The search type for a search of `index_name`. `scoring` is whether the order of its results depends on their
+        scores - whether it's a query with scoring terms which returns documents.
+        """
+        concrete_index_name = alias_resolver.get(index_name) or index_name
+        search_type = self.overrides.get(index_name) or self.overrides.get(concrete_index_name)
+        if search_type is None:
+            if scoring and self._primary_shards.get(concrete_index_name, 2) > 1:
+                search_type = DFS_QUERY_THEN_FETCH
+            else:
+                search_type = QUERY_THEN_FETCH
+
+        SEARCH_TYPE_REQUESTS_TOTAL.labels(search_type).inc()
+        return search_type
+
+    def record_shards(self, index_name, res):
+        """Learn how many shards the index `index_name` resolves to has from the search response `res`"""
+        shards = res.get('_shards', {}).get('total')
+        if not isinstance(shards, int) or not shards:
+            return
+
+        concrete_index_name = alias_resolver.get(index_name) or index_name
+        with self._lock:
+            self._primary_shards[concrete_index_name] = shards
+            self._primary_shards.move_to_end(concrete_index_name)
+            while len(self._primary_shards) > self.max_size:
+                self._primary_shards.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._primary_shards.clear()
+
+
+search_type_chooser = SearchTypeChooser()
@@ -2,6 +2,10 @@ from flask import request
 
 from . import status
 from ..main.services.search_service import status_for_all_indexes
+from ..mapping import mapping_cache
+from ..refresh import refresh_coordinator
+from ..search_cache import aggregation_cache, search_cache
+from ..write_behind import write_behind_queue
 from dmutils.status import get_app_status, StatusError
 
 
@@ -16,9 +20,40 @@ def get_es_status():
     }
 
 
+def get_mapping_cache_status():
+    return {
+        'mapping_cache': mapping_cache.stats()
+    }
+
+
+def get_refresh_coordinator_status():
+    return {
+        'refresh_coordinator': refresh_coordinator.stats()
+    }
+
+
+def get_search_cache_status():
+    return {
+        'search_cache': search_cache.stats(),
+        'aggregation_cache': aggregation_cache.stats(),
+    }
+
+
+def get_write_behind_status():
+    return {
+        'write_behind': write_behind_queue.stats()
+    }
+
+
 @status.route('/_status')
 def status():
     return get_app_status(data_api_client=None,
                           search_api_client=None,
                           ignore_dependencies='ignore-dependencies' in request.args,
-                          additional_checks=[get_es_status])
+                          additional_checks=[
+                              get_es_status,
+                              get_mapping_cache_status,
+                              get_refresh_coordinator_status,
+                              get_search_cache_status,
+                              get_write_behind_status,
+                          ])
@@ -0,0 +1,148 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+from elasticsearch.helpers import streaming_bulk
+from flask import current_app
+
+from dmutils.timing import logged_duration_for_external_request
+
+from app import elasticsearch_client as es
+from app.search_cache import write_generations
+
+
+class WriteBehindQueue(object):
+    """
+    An in-process queue of `_bulk` actions, flushed to Elasticsearch by a background thread once `max_batch_size`
+    documents are waiting or `flush_interval` seconds have passed.
+
+    Actions are keyed by index and document id, so a later write to a document replaces any earlier one still waiting
+    to be flushed. Failed actions are counted and logged but not retried - the data-sync job which sent them will send
+    the document again on its next run.
+    """
+    def __init__(self, max_batch_size=500, flush_interval=1.0):
+        self.enabled = False
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._app = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._pending = OrderedDict()  # {(index_name, document_id): action}
+        self._worker = None
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.enabled = app.config['DM_SEARCH_WRITE_BEHIND']
+        self.max_batch_size = int(app.config['DM_SEARCH_BULK_BATCH_SIZE'])
+        self.flush_interval = float(app.config['DM_SEARCH_WRITE_BEHIND_FLUSH_INTERVAL'])
+        self._app = app
+        self.clear()
+
+    def put(self, action):
+        """Queue a `_bulk` action (a dict with `_op_type`, `_index` and `_id` keys) to be sent to Elasticsearch."""
+        with self._condition:
+            key = (action['_index'], action['_id'])
+            if self._pending.pop(key, None) is not None:
+                self._coalesced += 1
+            self._pending[key] = action
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+
+        self._ensure_worker()
+
+    def pending(self, index_name, document_id):
+        """The action queued for document `document_id` in `index_name`, or None if there isn't one waiting"""
+        with self._condition:
+            return self._pending.get((index_name, document_id))
+
+    def flush(self):
+        """Send everything currently queued to Elasticsearch, in the calling thread."""
+        while self._flush_batch():
+            pass
+
+    def clear(self):
+        with self._condition:
+            self._pending.clear()
+        self._reset_stats()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'depth': len(self._pending),
+            'flushes': self._flushes,
+            'flushed': self._flushed,
+            'coalesced': self._coalesced,
+            'failures': self._failures,
+            'last_flush_duration': self._last_flush_duration,
+            'last_failure': self._last_failure,
+        }
+
+    def _reset_stats(self):
+        self._flushes = 0
+        self._flushed = 0
+        self._failures = 0
+        self._last_flush_duration = None
+        self._last_failure = None
+        self._coalesced = 0
+
+    def _ensure_worker(self):
+        # started on first use rather than in init_app, so that it's running in the process (or forked worker) which
+        # actually receives the writes
+        with self._condition:
+            if self._worker is None:
+                atexit.register(self.flush)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.max_batch_size, self.flush_interval)
+            self.flush()
+
+    def _take_batch(self):
+        with self._condition:
+            return [self._pending.popitem(last=False)[1] for _ in range(min(len(self._pending), self.max_batch_size))]
+
+    def _flush_batch(self):
+        # only one flush at a time, so that a newer write to a document can't overtake an older one
+        with self._flush_lock:
+            batch = self._take_batch()
+            if not batch:
+                return False
+
+            started = time.monotonic()
+            with self._app.app_context():
+                with logged_duration_for_external_request('es'):
+                    for ok, item in streaming_bulk(
+                        es,
+                        batch,
+                        chunk_size=len(batch),
+                        raise_on_error=False,
+                        raise_on_exception=False,
+                    ):
+                        op_type, info = next(iter(item.items()))
+                        if ok:
+                            write_generations.bump(info['_index'])
+                        elif not (op_type == 'delete' and info.get('status') == 404):
+                            self._failures += 1
+                            self._last_failure = {
+                                'index': info.get('_index'),
+                                'id': info.get('_id'),
+                                'status': info.get('status'),
+                                'error': str(info.get('error')),
+                            }
+                            current_app.logger.error(
+                                "Write-behind %s of document %s failed: %s",
+                                op_type, info.get('_id'), self._last_failure['error'],
+                            )
+
+            self._flushes += 1
+            self._flushed += len(batch)
+            self._last_flush_duration = time.monotonic() - started
+            return True
+
+
+write_behind_queue = WriteBehindQueue()
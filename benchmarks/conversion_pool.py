@@ -0,0 +1,47 @@
+"""
+Benchmark of converting one large `_bulk` payload with the conversion pool, in-process and with increasing numbers of
+worker processes. Times are wall-clock, as that's what the pool improves, so expect them to scale only up to the number
+of cores on the machine.
+
+Run from the repository root with
+
+    python -m benchmarks.conversion_pool
+"""
+import json
+import os
+import time
+
+from app.mapping import Mapping
+from app.main.services.conversion_pool import ConversionPool
+
+from benchmarks.process_request_json import MAPPING_PATH, make_service
+
+
+def _time(pool, mapping, payload):
+    timings = []
+    for _ in range(3):
+        documents = json.loads(payload)
+        start = time.perf_counter()
+        pool.convert(mapping, documents)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(count=50000):
+    mapping = Mapping(json.loads(MAPPING_PATH.read_text()), "services")
+    payload = json.dumps([make_service(i) for i in range(count)])
+    expected = ConversionPool().convert(mapping, json.loads(payload))
+
+    for processes in sorted({0, 1, 3, os.cpu_count() or 1}):
+        pool = ConversionPool(processes=processes, threshold=1)
+        try:
+            # start the workers before timing anything
+            assert pool.convert(mapping, json.loads(payload)) == expected
+            seconds = _time(pool, mapping, payload)
+        finally:
+            pool.shutdown()
+        print(f"{processes or 'in-process'}: {count} documents in {seconds:.3f}s, {count / seconds:.0f} per second")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Microbenchmark of the JSON codec backends available in this environment, encoding and decoding the example
+Elasticsearch search response and a page of 300 ids as returned by an idOnly search.
+
+Run from the repository root with
+
+    python -m benchmarks.json_codec
+"""
+import json
+import pathlib
+import timeit
+
+from app.json_codec import BACKENDS
+
+
+SEARCH_RESULTS_PATH = pathlib.Path(__file__).parent.parent / "example_es_responses" / "search_results.json"
+
+
+def main(number=2000):
+    search_results = json.loads(SEARCH_RESULTS_PATH.read_text())
+    id_only_page = {
+        "meta": {"query": {}, "total": 300, "took": 3, "results_per_page": 300},
+        "documents": [{"id": str(100000000000 + i)} for i in range(300)],
+        "links": {"next": "http://localhost/g-cloud-12/services/search?idOnly=True&page=2"},
+    }
+
+    for name, data in (("search_results.json", search_results), ("idOnly page of 300", id_only_page)):
+        encoded = json.dumps(data).encode("utf-8")
+        print(f"{name} ({len(encoded)} bytes):")
+        for backend, (dumps, loads) in sorted(BACKENDS.items()):
+            assert loads(dumps(data)) == data
+            encode = min(timeit.repeat(lambda: dumps(data), number=number, repeat=5)) / number
+            decode = min(timeit.repeat(lambda: loads(encoded), number=number, repeat=5)) / number
+            print(f"    {backend}: encode {encode * 1e6:.1f}us, decode {decode * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
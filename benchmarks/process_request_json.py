@@ -0,0 +1,86 @@
+"""
+Microbenchmark of `convert_request_json_into_index_json` converting typical service documents with the G-Cloud 12
+services mapping, one at a time and in batches with `convert_request_jsons_into_index_jsons`.
+
+Run from the repository root with
+
+    python -m benchmarks.process_request_json
+"""
+import json
+import pathlib
+import time
+
+from app.mapping import Mapping
+from app.main.services.process_request_json import (
+    convert_request_json_into_index_json,
+    convert_request_jsons_into_index_jsons,
+)
+
+
+MAPPING_PATH = pathlib.Path(__file__).parent.parent / "mappings" / "services-g-cloud-12.json"
+
+
+def make_service(i):
+    return {
+        "id": str(100000000000 + i),
+        "lot": ("cloud-hosting", "cloud-software", "cloud-support")[i % 3],
+        "lotName": "Cloud software",
+        "frameworkName": "G-Cloud 12",
+        "serviceName": f"Service {i}",
+        "serviceDescription": "A service which does things with email, hosting and document management. " * 4,
+        "serviceBenefits": ["Benefit one", "Benefit two", "Benefit three"],
+        "serviceFeatures": ["Feature one", "Feature two", "Feature three", "Feature four"],
+        "serviceCategories": ["Accounts payable", "Payroll", "Customer service", "Data analytics"],
+        "supplierName": f"Supplier {i % 500}",
+        "publicSectorNetworksTypes": ["PSN", "PNN"],
+        "phoneSupport": bool(i % 2),
+        "emailOrTicketingSupport": "yes_extra_cost",
+        "onsiteSupport": "yes",
+        "dataStorageAndProcessingLocations": ["uk"],
+        "governmentSecurityClearances": ["sc"],
+        "setupAndMigrationService": True,
+        "training": True,
+        "QAAndTesting": False,
+        "ongoingSupport": True,
+        "unmappedField": "ignored",
+        # not every service has every field
+        **({"webChatSupport": "no", "securityTesting": True} if i % 4 else {}),
+    }
+
+
+def _time(mapping, payload, convert):
+    timings = []
+    for _ in range(5):
+        # the conversion modifies documents in place, so give every run its own copies
+        documents = json.loads(payload)
+        start = time.process_time()
+        convert(mapping, documents)
+        timings.append(time.process_time() - start)
+    return min(timings)
+
+
+def _convert_one_at_a_time(mapping, documents):
+    return [convert_request_json_into_index_json(mapping, document) for document in documents]
+
+
+def _convert_in_batches(mapping, documents, batch_size=500):
+    return [
+        index_json
+        for i in range(0, len(documents), batch_size)
+        for index_json in convert_request_jsons_into_index_jsons(mapping, documents[i:i + batch_size])
+    ]
+
+
+def main(count=30000):
+    mapping = Mapping(json.loads(MAPPING_PATH.read_text()), "services")
+    payload = json.dumps([make_service(i) for i in range(count)])
+
+    assert _convert_one_at_a_time(mapping, json.loads(payload)) == _convert_in_batches(mapping, json.loads(payload))
+
+    for name, convert in (("one at a time", _convert_one_at_a_time), ("in batches of 500", _convert_in_batches)):
+        seconds = _time(mapping, payload, convert)
+        print(f"{name}: {count} documents in {seconds:.3f}s CPU, {seconds / count * 1e6:.2f}us per document")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Microbenchmark of `construct_query` for a handful of typical requests against the G-Cloud 12 services mapping.
+
+Run from the repository root with
+
+    python -m benchmarks.query_builder
+"""
+import json
+import pathlib
+import timeit
+
+from werkzeug.datastructures import MultiDict
+
+from app.mapping import Mapping
+from app.main.services.query_builder import QueryPlan, construct_query
+
+
+MAPPING_PATH = pathlib.Path(__file__).parent.parent / "mappings" / "services-g-cloud-12.json"
+
+REQUESTS = {
+    "match_all": (MultiDict(), ()),
+    "keywords": (MultiDict({"q": "email hosting"}), ()),
+    "filtered": (
+        MultiDict((
+            ("q", "email hosting"),
+            ("filter_lot", "cloud-software"),
+            ("filter_serviceCategories", "Accounting and finance"),
+            ("filter_serviceCategories", "Marketing"),
+            ("filter_phoneSupport", "true"),
+            ("filter_dataStorageAndProcessingLocations", "uk,eea"),
+            ("page", "3"),
+        )),
+        (),
+    ),
+    "id_only": (MultiDict((("filter_lot", "cloud-hosting"), ("idOnly", "True"))), ()),
+    "aggregations": (MultiDict((("filter_lot", "cloud-support"),)), ("lot", "serviceCategories")),
+}
+
+
+def main(number=20000):
+    mapping = Mapping(json.loads(MAPPING_PATH.read_text()), "services")
+
+    for name, (query_args, aggregations) in REQUESTS.items():
+        seconds = min(timeit.repeat(
+            lambda: construct_query(mapping, query_args, aggregations, page_size=30),
+            number=number,
+            repeat=5,
+        ))
+        print(f"{name:<15}{seconds / number * 1e6:8.2f}us per query")
+
+    # the one-off cost construct_query no longer pays on each request
+    seconds = min(timeit.repeat(lambda: QueryPlan(mapping), number=number // 10, repeat=5))
+    print(f"{'(query plan)':<15}{seconds / (number // 10) * 1e6:8.2f}us per mapping")
+
+
+if __name__ == "__main__":
+    main()
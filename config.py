@@ -17,6 +17,55 @@ class Config:
 
     DM_SEARCH_PAGE_SIZE = 30
     DM_ID_ONLY_SEARCH_PAGE_SIZE_MULTIPLIER = 10
+    # Searches use dfs_query_then_fetch only when they have scoring terms and their index has more than one primary
+    # shard. This maps index or alias names to a search type to always use for them instead.
+    DM_SEARCH_TYPE_OVERRIDES = {}
+    # the most searches a single /_msearch request can make
+    DM_SEARCH_MSEARCH_MAX_SEARCHES = 50
+    # JSON codec for request bodies and search responses: 'auto' (orjson if installed), 'orjson' or 'json'
+    DM_SEARCH_JSON_CODEC = 'auto'
+    # Number of documents sent to elasticsearch in each _bulk request
+    DM_SEARCH_BULK_BATCH_SIZE = 500
+    # Queue single-document writes in-process and send them to elasticsearch in batches, responding with a 202
+    DM_SEARCH_WRITE_BEHIND = False
+    DM_SEARCH_WRITE_BEHIND_FLUSH_INTERVAL = 1.0  # seconds
+    # Worker processes used to convert _bulk payloads of at least the threshold's number of documents (0 to disable)
+    DM_SEARCH_CONVERSION_PROCESSES = 0
+    DM_SEARCH_CONVERSION_PROCESS_THRESHOLD = 5000
+    # Debounced refreshes requested within this long of each other are merged into one
+    DM_SEARCH_REFRESH_DEBOUNCE_WINDOW = 1.0  # seconds
+    # Cluster health an index must reach at the end of a bulk load before it can be aliased
+    DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS = 'green'
+    DM_SEARCH_BULK_LOAD_WAIT_TIMEOUT = '5m'
+
+    # Exports of every matching document read this many sliced scrolls in parallel, no more than the index has shards
+    DM_SEARCH_EXPORT_SLICES = 2
+    DM_SEARCH_EXPORT_BATCH_SIZE = 1000
+    DM_SEARCH_EXPORT_SCROLL = '1m'
+
+    # How long a point in time opened for consistent paging (with `pit=`) is kept after each search of it
+    DM_SEARCH_PIT_KEEP_ALIVE = '1m'
+    # Search responses are cached per-process. Writes made through the same process invalidate them immediately,
+    # writes through other processes are only seen once entries expire
+    DM_SEARCH_CACHE_TTL = 60  # seconds, 0 to disable
+    DM_SEARCH_CACHE_MAX_ENTRIES = 1024
+    DM_SEARCH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    # Responses younger than this are still served after a write to their index
+    DM_SEARCH_CACHE_MAX_STALE = 0  # seconds
+    # Aggregation responses (facet counts) have their own cache, whose counts may be a little out of date
+    DM_AGGREGATION_CACHE_TTL = 300  # seconds, 0 to disable
+    DM_AGGREGATION_CACHE_MAX_ENTRIES = 256
+    DM_AGGREGATION_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    DM_AGGREGATION_CACHE_MAX_STALE = 30  # seconds
+    # Aggregations whose unfiltered counts are cached as soon as an alias is moved to a new index
+    DM_AGGREGATION_CACHE_PREWARM = ['lot']
+    # Responses aren't cached this soon after a write to their index, as it may not be visible to searches yet
+    DM_SEARCH_CACHE_WRITE_SETTLE_TIME = 2.0  # seconds
+    # Built index mappings are cached per-process, keyed by index/alias name
+    DM_MAPPING_CACHE_TTL = 300  # seconds
+    DM_MAPPING_CACHE_MAX_SIZE = 64
+    # How long a process trusts its record of which concrete index an alias points at
+    DM_ALIAS_RECHECK_INTERVAL = 60  # seconds
     # Logging
     DM_LOG_LEVEL = 'DEBUG'
     DM_APP_NAME = 'search-api'
@@ -37,6 +86,8 @@ class Test(Config):
     DM_LOG_LEVEL = 'CRITICAL'
 
     DM_SEARCH_API_AUTH_TOKENS = 'valid-token'
+    # a single-node test cluster can't allocate replicas
+    DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS = 'yellow'
 
 
 class Development(Config):
@@ -44,6 +95,7 @@ class Development(Config):
     DM_PLAIN_TEXT_LOGS = True
 
     DM_SEARCH_API_AUTH_TOKENS = 'myToken'
+    DM_SEARCH_BULK_LOAD_WAIT_FOR_STATUS = 'yellow'
 
 
 class SharedLive(Config):
@@ -0,0 +1,77 @@
+import mock
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from app.main.services.conversion_pool import ConversionPool
+from app.main.services.process_request_json import convert_request_jsons_into_index_jsons
+from app.mapping import MappingRegistry
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch, make_service
+
+
+@pytest.fixture(scope="module")
+def g_cloud_12_mapping():
+    registry = MappingRegistry()
+    registry.reload()
+    return registry.get("services-g-cloud-12").mapping
+
+
+def _documents(count):
+    return [
+        make_service(id=str(i), lot=("cloud-hosting", "cloud-software")[i % 2])["document"] for i in range(count)
+    ]
+
+
+class TestConversionPool(BaseApplicationTestWithoutElasticsearch):
+    @pytest.mark.parametrize("processes, threshold", ((0, 1), (2, 10)))
+    def test_small_or_disabled_batches_are_converted_in_process(self, g_cloud_12_mapping, processes, threshold):
+        pool = ConversionPool(processes=processes, threshold=threshold)
+
+        with mock.patch.object(pool, "_get_executor") as get_executor:
+            result = pool.convert(g_cloud_12_mapping, _documents(9))
+
+        assert get_executor.called is False
+        assert result == convert_request_jsons_into_index_jsons(g_cloud_12_mapping, _documents(9))
+
+    def test_large_batches_are_converted_by_the_workers_in_order(self, g_cloud_12_mapping):
+        pool = ConversionPool(processes=2, threshold=10)
+        try:
+            result = pool.convert(g_cloud_12_mapping, _documents(25))
+            # the second batch reuses the mapping each worker has already compiled
+            second_result = pool.convert(g_cloud_12_mapping, _documents(10))
+        finally:
+            pool.shutdown()
+
+        assert result == convert_request_jsons_into_index_jsons(g_cloud_12_mapping, _documents(25))
+        assert second_result == convert_request_jsons_into_index_jsons(g_cloud_12_mapping, _documents(10))
+
+    def test_batch_is_split_between_the_workers_and_the_calling_process(self, g_cloud_12_mapping):
+        pool = ConversionPool(processes=2, threshold=10)
+
+        with mock.patch.object(pool, "_get_executor") as get_executor:
+            get_executor.return_value.map.side_effect = lambda fn, args, chunks: map(fn, args, chunks)
+            result = pool.convert(g_cloud_12_mapping, _documents(10))
+
+        _, mapping_args, chunks = get_executor.return_value.map.call_args[0]
+        assert [len(chunk) for chunk in chunks] == [4, 2]
+        assert result == convert_request_jsons_into_index_jsons(g_cloud_12_mapping, _documents(10))
+
+    def test_broken_pool_falls_back_to_converting_in_process(self, g_cloud_12_mapping):
+        pool = ConversionPool(processes=2, threshold=10)
+
+        with mock.patch.object(pool, "_get_executor") as get_executor, mock.patch.object(pool, "shutdown") as shutdown:
+            get_executor.return_value.map.side_effect = BrokenProcessPool("A child process terminated abruptly")
+            with self.app.app_context():
+                result = pool.convert(g_cloud_12_mapping, _documents(10))
+
+        assert shutdown.called is True
+        assert result == convert_request_jsons_into_index_jsons(g_cloud_12_mapping, _documents(10))
+
+    def test_pool_is_configured_from_the_app(self):
+        self.app.config["DM_SEARCH_CONVERSION_PROCESSES"] = "4"
+        self.app.config["DM_SEARCH_CONVERSION_PROCESS_THRESHOLD"] = "20000"
+        pool = ConversionPool()
+
+        pool.init_app(self.app)
+
+        assert (pool.enabled, pool.processes, pool.threshold) == (True, 4, 20000)
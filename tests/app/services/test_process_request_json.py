@@ -1,6 +1,16 @@
 
-from app.main.services.process_request_json import \
-    convert_request_json_into_index_json
+import pytest
+
+from app.main.services.process_request_json import (
+    PartialDocumentError,
+    convert_index_json_into_request_json,
+    convert_indexed_request_json_into_index_json,
+    convert_partial_request_json_into_index_json,
+    convert_request_json_into_index_json,
+    convert_request_jsons_into_index_jsons,
+    get_index_json_converter,
+)
+from app.mapping import MappingRegistry
 
 
 def test_should_add_filter_fields_to_index_json(services_mapping):
@@ -361,3 +371,160 @@ def test_service_id_hash_added_if_id_present(services_mapping):
         "dmtext_id": "999999999",
         "sortonly_serviceIdHash": "bb421fa35db885ce507b0ef5c3f23cb09c62eb378fae3641c165bdf4c0272949",
     }
+
+
+def test_index_json_can_be_converted_back_and_reindexed(services_mapping):
+    request = {
+        "id": "999999999",
+        "lot": "SaaS",
+        "serviceName": "Email",
+        "unmapped": "dropped",
+    }
+    index_json = convert_request_json_into_index_json(services_mapping, dict(request))
+
+    recovered = convert_index_json_into_request_json(index_json)
+
+    assert recovered["lot"] == "SaaS"
+    assert "unmapped" not in recovered
+    assert convert_request_json_into_index_json(services_mapping, recovered) == index_json
+
+
+class TestIndexedConversion():
+    def test_reconverting_indexed_document_does_not_append_values_again(self, services_mapping):
+        request = {
+            "id": "999999999",
+            "lot": "SaaS",
+            "serviceCategories": ["Accounts payable", "Data analytics"],
+            "emailOrTicketingSupport": "yes_extra_cost",
+        }
+        index_json = convert_request_json_into_index_json(services_mapping, dict(request))
+
+        reconverted = convert_indexed_request_json_into_index_json(
+            services_mapping, convert_index_json_into_request_json(index_json)
+        )
+
+        assert reconverted == index_json
+        assert convert_indexed_request_json_into_index_json(
+            services_mapping, convert_index_json_into_request_json(reconverted)
+        ) == index_json
+
+    def test_derived_fields_are_derived_afresh(self):
+        registry = MappingRegistry()
+        registry.reload()
+        mapping = registry.get("briefs-digital-outcomes-and-specialists-2").mapping
+        index_json = convert_request_json_into_index_json(mapping, {"id": "1", "status": "closed"})
+
+        reconverted = convert_indexed_request_json_into_index_json(
+            mapping, convert_index_json_into_request_json(index_json)
+        )
+
+        assert reconverted["sortonly_statusOrder"] == [1]
+        assert reconverted == index_json
+
+
+class TestIndexJsonConverter():
+    def test_converter_is_compiled_once_per_mapping(self, services_mapping):
+        assert get_index_json_converter(services_mapping) is get_index_json_converter(services_mapping)
+
+    def test_converter_is_recompiled_if_transformations_change(self, services_mapping):
+        converter = get_index_json_converter(services_mapping)
+        services_mapping.transform_fields = []
+
+        assert get_index_json_converter(services_mapping) is not converter
+        assert get_index_json_converter(services_mapping).transformations == ()
+
+    def test_prefixed_fields(self, services_mapping):
+        prefixed_fields = get_index_json_converter(services_mapping).prefixed_fields
+
+        assert frozenset(prefixed_fields["lot"]) == {"dmagg_lot", "dmfilter_lot", "dmtext_lot"}
+        assert prefixed_fields["serviceIdHash"] == ("sortonly_serviceIdHash",)
+        assert "ignore" not in prefixed_fields
+
+
+class TestFingerprints():
+    def test_fingerprint_is_added_if_mapping_has_somewhere_to_store_it(self):
+        registry = MappingRegistry()
+        registry.reload()
+        mapping = registry.get("services-g-cloud-12").mapping
+
+        first = convert_request_json_into_index_json(mapping, {"id": "1", "lot": "SaaS", "serviceName": "Email"})
+        second = convert_request_json_into_index_json(mapping, {"serviceName": "Email", "lot": "SaaS", "id": "1"})
+        different = convert_request_json_into_index_json(mapping, {"id": "1", "lot": "PaaS", "serviceName": "Email"})
+
+        assert len(first["dmfingerprint"]) == 64
+        assert first["dmfingerprint"] == second["dmfingerprint"]
+        assert first["dmfingerprint"] != different["dmfingerprint"]
+
+    def test_no_fingerprint_for_mappings_without_the_field(self, services_mapping):
+        assert "dmfingerprint" not in convert_request_json_into_index_json(services_mapping, {"id": "1"})
+
+
+class TestPartialConversion():
+    def _briefs_mapping(self):
+        registry = MappingRegistry()
+        registry.reload()
+        return registry.get("briefs-digital-outcomes-and-specialists-2").mapping
+
+    def test_only_supplied_fields_are_converted(self, services_mapping):
+        assert convert_partial_request_json_into_index_json(services_mapping, {"serviceName": "Email"}) == {
+            "dmtext_serviceName": "Email",
+        }
+
+    def test_transformations_of_supplied_fields_are_rerun(self):
+        result = convert_partial_request_json_into_index_json(self._briefs_mapping(), {"status": "closed"})
+
+        assert result == {
+            "dmtext_status": "closed",
+            "dmfilter_status": "closed",
+            "dmfilter_statusOpenClosed": "closed",
+            "sortonly_statusOrder": [1],
+            "dmfingerprint": None,
+        }
+
+    def test_derived_fields_which_no_longer_apply_are_cleared(self):
+        result = convert_partial_request_json_into_index_json(self._briefs_mapping(), {"status": "some-new-status"})
+
+        assert result["dmfilter_statusOpenClosed"] is None
+        assert result["sortonly_statusOrder"] is None
+
+    def test_fields_combined_by_transformations_must_be_supplied_together(self, services_mapping):
+        with pytest.raises(PartialDocumentError) as e:
+            convert_partial_request_json_into_index_json(services_mapping, {"ongoingSupport": True})
+
+        assert "serviceCategories" in str(e.value)
+        assert "QAAndTesting" in str(e.value)
+
+
+class TestBatchConversion():
+    def _documents(self):
+        return [
+            {"id": "1", "lot": "SaaS", "serviceCategories": ["Accounts payable"], "ongoingSupport": True},
+            {"id": "2", "lot": "PaaS", "phoneSupport": False},
+            {"id": "3", "lot": "SaaS", "serviceCategories": "Payroll", "ongoingSupport": False},
+            {"id": "4", "lot": "SaaS", "serviceCategories": ["Accounts payable"], "ongoingSupport": True},
+            {},
+        ]
+
+    def test_batch_gives_same_results_as_one_at_a_time(self, services_mapping):
+        expected = [convert_request_json_into_index_json(services_mapping, document) for document in self._documents()]
+
+        assert convert_request_jsons_into_index_jsons(services_mapping, self._documents()) == expected
+
+    def test_batch_gives_same_results_with_fingerprints_and_derived_fields(self):
+        registry = MappingRegistry()
+        registry.reload()
+        mapping = registry.get("briefs-digital-outcomes-and-specialists-2").mapping
+        documents = [{"id": str(i), "status": status} for i, status in enumerate(("live", "closed", "draft", "new"))]
+
+        expected = [convert_request_json_into_index_json(mapping, dict(document)) for document in documents]
+
+        assert convert_request_jsons_into_index_jsons(mapping, documents) == expected
+
+    def test_only_transformations_which_could_apply_are_planned(self, services_mapping):
+        converter = get_index_json_converter(services_mapping)
+
+        assert converter._transformation_plan(frozenset(("id", "lot"))) == tuple(
+            transformation
+            for (source_field, _), transformation in zip(converter.transformation_fields, converter.transformations)
+            if source_field == "id"
+        )
@@ -1,5 +1,7 @@
 import pytest
-from app.main.services.query_builder import construct_query, is_filtered
+from app.main.services.query_builder import (
+    construct_query, decode_cursor, encode_cursor, has_scoring_terms, is_filtered, get_query_plan,
+)
 from app.main.services.query_builder import (
     field_is_or_filter,
     field_filters,
@@ -31,11 +33,61 @@ def test_should_have_no_from_by_default(services_mapping):
     assert "from" not in construct_query(services_mapping, build_query_params())
 
 
+def test_empty_cursor_starts_from_first_page(services_mapping):
+    query = construct_query(services_mapping, MultiDict({"cursor": ""}))
+
+    assert "from" not in query
+    assert "search_after" not in query
+    assert query["sort"] == services_mapping.sort_clause
+
+
+def test_cursor_sets_search_after_parameter(services_mapping):
+    query = construct_query(services_mapping, MultiDict({"cursor": encode_cursor([1.5, "abc123"])}))
+
+    assert "from" not in query
+    assert query["search_after"] == [1.5, "abc123"]
+
+
+def test_id_only_cursor_search_is_sorted(services_mapping):
+    query = construct_query(services_mapping, MultiDict({"cursor": "", "idOnly": "True"}))
+
+    assert query["_source"] is False
+    assert query["sort"] == services_mapping.sort_clause
+
+
+def test_cursor_and_page_cannot_be_used_together(services_mapping):
+    with pytest.raises(ValueError):
+        construct_query(services_mapping, MultiDict({"cursor": "", "page": "2"}))
+
+
+@pytest.mark.parametrize("cursor", ("not-a-cursor", encode_cursor({"a": 1}), encode_cursor([])))
+def test_invalid_cursor_raises_value_error(services_mapping, cursor):
+    with pytest.raises(ValueError) as e:
+        construct_query(services_mapping, MultiDict({"cursor": cursor}))
+
+    assert str(e.value).startswith("Invalid cursor")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([0.2876821, "ffe5c3d9a3", 3])) == [0.2876821, "ffe5c3d9a3", 3]
+
+
 def test_should_have_match_all_query_if_no_params(services_mapping):
     assert "query" in construct_query(services_mapping, build_query_params())
     assert "match_all" in construct_query(services_mapping, build_query_params())["query"]
 
 
+@pytest.mark.parametrize("query_args,expected", (
+    ({}, False),
+    ({"q": ""}, False),
+    ({"q": "  "}, False),
+    ({"filter_lot": "SaaS"}, False),
+    ({"q": "email"}, True),
+))
+def test_has_scoring_terms(query_args, expected):
+    assert has_scoring_terms(MultiDict(query_args)) is expected
+
+
 def test_aggregations_root_element_present_if_aggregations(services_mapping):
     assert 'aggregations' in construct_query(services_mapping, build_query_params(), aggregations=['lot'])
 
@@ -54,6 +106,27 @@ def test_aggregations_terms_added_for_each_param(services_mapping, aggregations)
     }
 
 
+def test_aggregations_only_query_fetches_no_documents(services_mapping):
+    query = construct_query(services_mapping, build_query_params(keywords="email"), aggregations=['lot'])
+
+    assert query["size"] == 0
+    assert "highlight" not in query
+    assert "sort" not in query
+
+
+def test_aggregations_can_be_fetched_with_documents(services_mapping):
+    query = construct_query(
+        services_mapping, build_query_params(keywords="email", page=2), aggregations=['lot'], page_size=30,
+        include_documents=True,
+    )
+
+    assert set(query["aggregations"]) == {"lot"}
+    assert query["size"] == 30
+    assert query["from"] == 30
+    assert "highlight" in query
+    assert "sort" in query
+
+
 def test_aggregation_throws_error_if_not_implemented(services_mapping):
     with pytest.raises(ValueError):
         construct_query(services_mapping, build_query_params(), aggregations=['missing'])
@@ -229,6 +302,35 @@ def test_highlight_block_contains_correct_fields(services_mapping, example):
     assert any(re.match(field, "dmtext_" + example) for field in query["highlight"]["fields"]), example
 
 
+class TestQueryPlan(object):
+    def test_query_plan_is_built_once_per_mapping(self, services_mapping):
+        assert get_query_plan(services_mapping) is get_query_plan(services_mapping)
+
+    def test_query_plan_fields(self, services_mapping):
+        query_plan = get_query_plan(services_mapping)
+
+        assert frozenset(query_plan.text_search_fields) == frozenset(
+            "_".join(("dmtext", f)) for f in services_mapping.fields_by_prefix["dmtext"]
+        )
+        assert query_plan.filter_fields == services_mapping.fields_by_prefix["dmfilter"]
+        assert query_plan.aggregatable_fields == services_mapping.fields_by_prefix["dmagg"]
+        assert query_plan.sort_clause == services_mapping.sort_clause
+
+    def test_prefixed_filter_field(self, services_mapping):
+        query_plan = get_query_plan(services_mapping)
+
+        assert query_plan.prefixed_filter_field("lot") == "dmfilter_lot"
+        assert query_plan.prefixed_filter_field("notInMapping") == "dmfilter_notInMapping"
+
+    def test_filters_on_unknown_fields_are_kept_if_query_is_filtered(self, services_mapping):
+        query = construct_query(services_mapping, build_query_params(filters={'lot': "SaaS", 'notInMapping': "x"}))
+
+        assert query["query"]["bool"]["filter"]["bool"]["must"] == [
+            {"term": {"dmfilter_lot": "SaaS"}},
+            {"term": {"dmfilter_notInMapping": "x"}},
+        ]
+
+
 class TestFieldFilters(object):
     def test_field_is_or_filter(self):
         assert field_is_or_filter(['a,b'])
@@ -1,8 +1,10 @@
 import mock
 from flask import json
 
+from werkzeug.datastructures import MultiDict
+
 from app.main.services.response_formatters import \
-    convert_es_status, convert_es_results
+    convert_es_status, convert_es_results, generate_pagination_links
 
 
 with open("example_es_responses/stats.json") as services:
@@ -73,6 +75,7 @@ def test_should_build_status_response_from_es_response():
         "primary_size": "73.7mb",
         "mapping_version": "17.13.1",
         "mapping_generated_from_framework": "g-cloud-12",
+        "mapping_content_hash": None,
         "max_result_window": "50000",
         "aliases": [],
     }
@@ -85,6 +88,7 @@ def test_should_build_status_response_from_briefs_es_response():
         "primary_size": "2mb",
         "mapping_version": "11.0.0",
         "mapping_generated_from_framework": "digital-outcomes-and-specialists-2",
+        "mapping_content_hash": None,
         "max_result_window": "10000",
         "aliases": [],
     }
@@ -98,7 +102,28 @@ def test_should_build_status_response_from_es_response_with_empty_index():
         "aliases": [],
         "mapping_version": None,
         "mapping_generated_from_framework": None,
+        "mapping_content_hash": None,
         "max_result_window": None,
         "num_docs": None,
         "primary_size": "73.7mb",
     }
+
+
+def _url_for_search(**kwargs):
+    return "/search?" + "&".join("{}={}".format(k, v) for k, v in sorted(kwargs.items()))
+
+
+def test_pagination_links_for_pages():
+    links = generate_pagination_links(MultiDict({"q": "email", "page": "2"}), 100, 30, _url_for_search)
+
+    assert links == {"prev": "/search?page=1&q=['email']", "next": "/search?page=3&q=['email']"}
+
+
+def test_pagination_links_for_cursors_only_lead_forwards():
+    links = generate_pagination_links(MultiDict({"q": "email", "cursor": "abc"}), 100, 30, _url_for_search, "def")
+
+    assert links == {"next": "/search?cursor=def&q=['email']"}
+
+
+def test_no_next_link_without_next_cursor():
+    assert generate_pagination_links(MultiDict({"cursor": "abc"}), 100, 30, _url_for_search) == {}
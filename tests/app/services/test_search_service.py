@@ -1,9 +1,29 @@
 import json
 import mock
+from urllib.parse import parse_qs, urlparse
 
 from elasticsearch import TransportError
+from werkzeug.datastructures import MultiDict
 
-from tests.helpers import BaseApplicationTestWithIndex
+from app.main.services.search_service import (
+    bulk_delete,
+    bulk_index,
+    copy_documents,
+    create_alias,
+    create_index,
+    export_documents,
+    search_with_keywords_and_filters,
+    finish_bulk_load,
+    index,
+    multi_search,
+    start_bulk_load,
+)
+from app.aliases import alias_resolver
+from app.main.services.process_request_json import convert_request_json_into_index_json
+from app.mapping import MappingNotFound, mapping_cache, mapping_registry
+from app.main.services.query_builder import decode_cursor, encode_cursor
+from app.search_cache import search_cache
+from tests.helpers import BaseApplicationTestWithIndex, BaseApplicationTestWithoutElasticsearch
 
 
 class TestCoreSearchAndAggregate(BaseApplicationTestWithIndex):
@@ -27,3 +47,595 @@ class TestCoreSearchAndAggregate(BaseApplicationTestWithIndex):
 
         assert response.status_code == 500
         assert data['error'] is None
+
+
+class TestBulkIndex(BaseApplicationTestWithoutElasticsearch):
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    def test_results_are_reported_per_document(self, streaming_bulk):
+        streaming_bulk.return_value = iter([
+            (True, {"index": {"_index": "test-index", "_id": "1", "status": 201, "result": "created"}}),
+            (False, {"index": {
+                "_id": "2", "status": 400, "error": {"type": "mapper_parsing_exception", "reason": "bad"},
+            }}),
+            (False, {"index": {"_id": "3", "status": "N/A", "error": "ConnectionError(...)"}}),
+        ])
+
+        with self.app.app_context():
+            results = list(bulk_index("test-index", "services", [("1", {}), ("2", {}), ("3", {})]))
+
+        assert results == [
+            {"id": "1", "status": 200, "message": "acknowledged"},
+            {"id": "2", "status": 400, "error": "mapper_parsing_exception: bad"},
+            {"id": "3", "status": 500, "error": "ConnectionError(...)", "unexpectedStatusCode": "N/A"},
+        ]
+        assert streaming_bulk.call_args[1]["chunk_size"] == self.app.config["DM_SEARCH_BULK_BATCH_SIZE"]
+
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    def test_deletes_of_missing_documents_are_not_errors(self, streaming_bulk):
+        streaming_bulk.return_value = iter([
+            (True, {"delete": {"_index": "test-index", "_id": "1", "status": 200, "result": "deleted"}}),
+            (False, {"delete": {"_index": "test-index", "_id": "2", "status": 404, "result": "not_found"}}),
+        ])
+
+        with self.app.app_context():
+            results = list(bulk_delete("test-index", "services", ["1", "2"]))
+
+        assert results == [
+            {"id": "1", "status": 200, "message": "deleted"},
+            {"id": "2", "status": 404, "message": "not_found"},
+        ]
+        assert [action["_op_type"] for action in streaming_bulk.call_args[0][1]] == ["delete", "delete"]
+
+
+class TestCreateIndex(BaseApplicationTestWithoutElasticsearch):
+    def test_index_is_created_from_a_copy_of_the_definition_with_its_hash(self):
+        registered_mapping = mapping_registry.get("services-g-cloud-12")
+
+        with self.app.app_context():
+            assert create_index("test-index", "services-g-cloud-12") == ("acknowledged", 200)
+
+        definition = self.es.indices.create.call_args[1]["body"]
+        assert definition is not registered_mapping.mapping.definition
+        assert definition["mappings"]["_meta"]["content_hash"] == registered_mapping.content_hash
+        assert "content_hash" not in registered_mapping.mapping.definition["mappings"]["_meta"]
+        assert mapping_cache.get("test-index").definition is definition
+
+
+class TestCopyDocuments(BaseApplicationTestWithoutElasticsearch):
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    @mock.patch('app.main.services.search_service.scan')
+    def test_documents_are_retransformed_and_progress_reported(self, scan, streaming_bulk, services_mapping):
+        self.app.config['DM_SEARCH_BULK_BATCH_SIZE'] = 2
+        self.es.count.return_value = {"count": 3}
+        scan.return_value = iter([
+            {"_id": str(i), "_source": {"dmtext_lot": "SaaS", "dmtext_id": str(i)}} for i in range(3)
+        ])
+        copied = []
+        streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {"index": {"_index": "test-index-2", "_id": action["_id"], "status": 201}})
+            for action in actions
+            if not copied.append(action)
+        )
+
+        with self.app.app_context():
+            progress = list(copy_documents("test-index", "test-index-2", services_mapping))
+
+        assert progress == [
+            {"source": "test-index", "target": "test-index-2", "total": 3, "copied": 2, "failed": 0},
+            {"source": "test-index", "target": "test-index-2", "total": 3, "copied": 3, "failed": 0,
+             "status": "complete"},
+        ]
+        assert copied[0]["_index"] == "test-index-2"
+        assert copied[0]["_source"]["dmfilter_lot"] == "SaaS"
+
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    @mock.patch('app.main.services.search_service.scan')
+    def test_appended_values_are_not_duplicated(self, scan, streaming_bulk, services_mapping):
+        self.es.count.return_value = {"count": 1}
+        index_json = convert_request_json_into_index_json(services_mapping, {
+            "id": "1", "lot": "SaaS", "serviceCategories": ["Accounts payable", "Data analytics"],
+        })
+        scan.return_value = iter([{"_id": "1", "_source": index_json}])
+        copied = []
+        streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {"index": {"_index": "test-index-2", "_id": action["_id"], "status": 201}})
+            for action in actions
+            if not copied.append(action)
+        )
+
+        with self.app.app_context():
+            list(copy_documents("test-index", "test-index-2", services_mapping))
+
+        categories = copied[0]["_source"]["dmtext_serviceCategories"]
+        assert "Accounting and finance" in categories
+        assert len(categories) == len(set(categories))
+        assert copied[0]["_source"] == index_json
+
+    def test_failure_to_read_source_is_reported(self):
+        self.es.count.side_effect = TransportError(404, 'index_not_found_exception', {
+            'error': {'type': 'index_not_found_exception', 'reason': 'no such index'},
+        })
+
+        with self.app.app_context():
+            progress = list(copy_documents("test-index", "test-index-2", mock.Mock()))
+
+        assert len(progress) == 1
+        assert progress[0]["status"] == "failed"
+
+
+class TestBulkLoad(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.meta = {"doc_type": "services"}
+        self.es.indices.get_mapping.side_effect = lambda index: {
+            "test-index": {"mappings": {"_meta": self.meta}},
+        }
+        self.es.indices.put_mapping.side_effect = lambda index, body: setattr(self, "meta", body["_meta"])
+        self.es.indices.get_settings.return_value = {
+            "test-index": {
+                "settings": {"index.number_of_replicas": "1"},
+                "defaults": {"index.refresh_interval": "1s"},
+            },
+        }
+        self.es.cluster.health.return_value = {"timed_out": False, "status": "green"}
+
+    def test_original_settings_are_restored(self):
+        with self.app.app_context():
+            assert start_bulk_load("test-index") == ("acknowledged", 200)
+            # starting twice mustn't lose the original settings
+            assert start_bulk_load("test-index") == ("acknowledged", 200)
+
+            assert self.es.indices.put_settings.call_args == mock.call(
+                index="test-index", body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+            )
+
+            assert finish_bulk_load("test-index") == ("acknowledged", 200)
+
+        assert self.es.indices.put_settings.call_args == mock.call(
+            index="test-index", body={"index": {"refresh_interval": "1s", "number_of_replicas": "1"}},
+        )
+        assert self.meta == {"doc_type": "services"}
+        assert self.es.indices.forcemerge.called is False
+        self.es.indices.refresh.assert_called_once_with(index="test-index")
+
+    def test_finishing_waits_for_health(self):
+        self.es.cluster.health.return_value = {"timed_out": True, "status": "red"}
+
+        with self.app.app_context():
+            start_bulk_load("test-index")
+            result, status_code = finish_bulk_load("test-index", force_merge=True)
+
+        assert status_code == 504
+        assert result == "Index 'test-index' did not reach yellow status (currently red)"
+        assert self.es.indices.forcemerge.called is True
+        # still in bulk-load mode, so can't be aliased
+        with self.app.app_context():
+            assert create_alias("index-alias", "test-index")[1] == 400
+
+
+class TestFingerprintSkip(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.mget.return_value = {"docs": [
+            {"_id": "1", "found": True, "_source": {"dmfingerprint": "aaaa"}},
+            {"_id": "2", "found": True, "_source": {"dmfingerprint": "bbbb"}},
+            {"_id": "3", "found": False},
+        ]}
+        self.es.index.return_value = {"_index": "test-index"}
+
+    def test_unchanged_document_is_not_rewritten(self):
+        with self.app.app_context():
+            assert index("test-index", "services", {"dmfingerprint": "aaaa"}, "1") == ("skipped", 200)
+            assert index("test-index", "services", {"dmfingerprint": "cccc"}, "2") == ("acknowledged", 200)
+
+        assert self.es.mget.call_args_list[0] == mock.call(
+            index="test-index", body={"ids": ["1"]}, _source_includes=["dmfingerprint"],
+        )
+        assert self.es.index.call_count == 1
+
+    def test_documents_without_fingerprints_are_written_without_lookup(self):
+        with self.app.app_context():
+            assert index("test-index", "services", {}, "1") == ("acknowledged", 200)
+
+        assert self.es.mget.called is False
+
+    def test_failed_lookup_means_documents_are_written(self):
+        self.es.mget.side_effect = TransportError(500, "oops", None)
+
+        with self.app.app_context():
+            assert index("test-index", "services", {"dmfingerprint": "aaaa"}, "1") == ("acknowledged", 200)
+
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    def test_bulk_skips_unchanged_documents(self, streaming_bulk):
+        written = []
+        streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {"index": {"_index": "test-index", "_id": action["_id"], "status": 200}})
+            for action in actions
+            if not written.append(action["_id"])
+        )
+
+        with self.app.app_context():
+            results = list(bulk_index("test-index", "services", [
+                ("1", {"dmfingerprint": "aaaa"}),
+                ("2", {"dmfingerprint": "cccc"}),
+                ("3", {"dmfingerprint": "dddd"}),
+            ]))
+
+        assert results == [
+            {"id": "1", "status": 200, "message": "skipped"},
+            {"id": "2", "status": 200, "message": "acknowledged"},
+            {"id": "3", "status": 200, "message": "acknowledged"},
+        ]
+        assert written == ["2", "3"]
+        self.es.mget.assert_called_once()
+
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    def test_bulk_decides_skipping_per_item_for_repeated_ids(self, streaming_bulk):
+        written = []
+        streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {"index": {"_index": "test-index", "_id": action["_id"], "status": 200}})
+            for action in actions
+            if not written.append((action["_id"], action["_source"]["dmfingerprint"]))
+        )
+
+        with self.app.app_context():
+            results = list(bulk_index("test-index", "services", [
+                ("1", {"dmfingerprint": "aaaa"}),
+                ("1", {"dmfingerprint": "eeee"}),
+                ("2", {"dmfingerprint": "cccc"}),
+                ("2", {"dmfingerprint": "bbbb"}),
+            ]))
+
+        assert [result["message"] for result in results] == ["skipped", "acknowledged", "acknowledged", "acknowledged"]
+        assert written == [("1", "eeee"), ("2", "cccc"), ("2", "bbbb")]
+
+
+class TestWriteRefreshOptions(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.index.return_value = {"_index": "test-index"}
+        self.coordinator = self.patch('app.refresh.refresh_coordinator')
+
+    def test_wait_for_is_passed_to_elasticsearch(self):
+        with self.app.app_context():
+            index("test-index", "services", {}, "1", refresh="wait_for")
+
+        assert self.es.index.call_args[1]["refresh"] == "wait_for"
+        assert self.coordinator.request.called is False
+
+    def test_debounced_refresh_is_requested_after_write(self):
+        with self.app.app_context():
+            index("test-index", "services", {}, "1", refresh="debounced")
+
+        assert "refresh" not in self.es.index.call_args[1]
+        self.coordinator.request.assert_called_once_with("test-index")
+
+    @mock.patch('app.main.services.search_service.streaming_bulk')
+    def test_bulk_writes_request_one_refresh(self, streaming_bulk):
+        streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {"delete": {"_index": "test-index", "_id": action["_id"], "status": 200}}) for action in actions
+        )
+
+        with self.app.app_context():
+            list(bulk_delete("test-index", "services", ["1", "2", "3"], refresh="debounced"))
+
+        self.coordinator.request.assert_called_once_with("test-index")
+
+
+class TestCursorPagination(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.get_mapping = self.patch('app.mapping.get_mapping')
+        self.app.config['DM_SEARCH_PAGE_SIZE'] = 2
+        alias_resolver.set("test-index", "test-index")
+
+    def _es_response(self, *ids):
+        return {
+            "took": 1,
+            "hits": {
+                "total": {"value": 5},
+                "hits": [
+                    {"_id": id, "_source": {}, "sort": [1.0, "hash-" + id]} for id in ids
+                ],
+            },
+        }
+
+    def test_full_page_links_to_the_next_with_last_hits_sort_values(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.search.return_value = self._es_response("3", "4")
+
+        with self.app.test_request_context():
+            result, status_code = search_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"q": "email", "cursor": encode_cursor([1.0, "hash-2"])}),
+            )
+
+        assert status_code == 200
+        assert self.es.search.call_args[1]["body"]["search_after"] == [1.0, "hash-2"]
+        assert "from" not in self.es.search.call_args[1]["body"]
+        next_link_args = parse_qs(urlparse(result["links"]["next"]).query)
+        assert decode_cursor(next_link_args["cursor"][0]) == [1.0, "hash-4"]
+        assert next_link_args["q"] == ["email"]
+        assert "prev" not in result["links"]
+
+    def test_short_or_empty_page_has_no_next_link(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.search.return_value = self._es_response()
+
+        with self.app.test_request_context():
+            result, status_code = search_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"cursor": encode_cursor([1.0, "hash-5"])}),
+            )
+
+        assert status_code == 200
+        assert result["links"] == {}
+        assert result["documents"] == []
+
+    def test_invalid_cursor_gives_400(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        with self.app.test_request_context():
+            result, status_code = search_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"cursor": "nonsense"}),
+            )
+
+        assert status_code == 400
+        assert self.es.search.called is False
+
+
+class TestSearchWithAggregations(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.search.return_value = {
+            "took": 1,
+            "hits": {"total": {"value": 1}, "hits": [{"_id": "1", "_source": {}, "sort": [1.0, "a"]}]},
+            "aggregations": {"lot": {"buckets": [{"key": "cloud-hosting", "doc_count": 1}]}},
+        }
+        self.get_mapping = self.patch('app.mapping.get_mapping')
+        alias_resolver.set("test-index", "test-index")
+
+    def test_documents_and_aggregations_come_from_one_search(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        with self.app.test_request_context():
+            result, status_code = search_with_keywords_and_filters(
+                "test-index", "services", MultiDict([("q", "email"), ("aggregations", "lot")]), ["lot"],
+            )
+
+        assert status_code == 200
+        assert self.es.search.call_count == 1
+        body = self.es.search.call_args[1]["body"]
+        assert body["size"] == 30
+        assert set(body["aggregations"]) == {"lot"}
+        assert self.es.search.call_args[1]["search_type"] == "dfs_query_then_fetch"
+        assert result["documents"] == [{}]
+        assert result["aggregations"] == {"lot": {"cloud-hosting": 1}}
+
+    def test_unknown_aggregation_gives_400(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        with self.app.test_request_context():
+            result, status_code = search_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"aggregations": "missing"}), ["missing"],
+            )
+
+        assert status_code == 400
+        assert result == "Aggregations for `missing` are not supported."
+        assert self.es.search.called is False
+
+
+class TestPointInTimePagination(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.open_point_in_time.return_value = {"id": "pit-1"}
+        self.es.search.return_value = {
+            "took": 1,
+            "pit_id": "pit-2",
+            "hits": {"total": {"value": 5}, "hits": [{"_id": "1", "_source": {}}, {"_id": "2", "_source": {}}]},
+        }
+        self.get_mapping = self.patch('app.mapping.get_mapping')
+        self.app.config['DM_SEARCH_PAGE_SIZE'] = 2
+        alias_resolver.set("test-index", "test-index-2020-01-01")
+
+    def _search(self, query_args):
+        with self.app.test_request_context():
+            return search_with_keywords_and_filters("test-index", "services", MultiDict(query_args))
+
+    def test_empty_pit_opens_a_point_in_time_on_the_concrete_index(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        result, status_code = self._search({"q": "email", "pit": ""})
+
+        assert status_code == 200
+        self.es.open_point_in_time.assert_called_once_with(index="test-index-2020-01-01", keep_alive="1m")
+        assert "index" not in self.es.search.call_args[1]
+        assert self.es.search.call_args[1]["body"]["pit"] == {"id": "pit-1", "keep_alive": "1m"}
+        assert result["meta"]["query"]["pit"] == "pit-2"
+        next_link_args = parse_qs(urlparse(result["links"]["next"]).query)
+        assert next_link_args["pit"] == ["pit-2"]
+        assert next_link_args["page"] == ["2"]
+
+    def test_later_pages_search_the_same_point_in_time(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        result, status_code = self._search({"q": "email", "pit": "pit-1", "page": "2"})
+
+        assert status_code == 200
+        assert self.es.open_point_in_time.called is False
+        assert self.es.search.call_args[1]["body"]["pit"]["id"] == "pit-1"
+        assert self.es.search.call_args[1]["body"]["from"] == 2
+
+    def test_point_in_time_searches_are_not_cached(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        self._search({"q": "email", "pit": ""})
+        self._search({"q": "email", "pit": ""})
+
+        assert self.es.open_point_in_time.call_count == 2
+        assert self.es.search.call_count == 2
+
+    def test_result_window_too_large_is_counted_against_the_point_in_time(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.search.side_effect = [
+            TransportError(500, "search_phase_execution_exception", {
+                "error": {"root_cause": [{"reason": "Result window is too large, from + size must be less than..."}]}
+            }),
+            {"pit_id": "pit-1", "hits": {"total": {"value": 5}, "hits": []}},
+        ]
+
+        result, status_code = self._search({"q": "email", "pit": "pit-1", "page": "10001"})
+
+        assert status_code == 404
+        assert self.es.count.called is False
+        count_kwargs = self.es.search.call_args[1]
+        assert count_kwargs["body"]["size"] == 0
+        assert count_kwargs["body"]["pit"]["id"] == "pit-1"
+        assert count_kwargs["track_total_hits"] is True
+
+
+class TestExportDocuments(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.search.side_effect = self._es_search
+        self.es.scroll.return_value = {"_scroll_id": "scroll-end", "hits": {"hits": []}}
+        self.get_mapping = self.patch('app.mapping.get_mapping')
+        self.app.config['DM_SEARCH_EXPORT_SLICES'] = 3
+        alias_resolver.set("test-index", "test-index-2020-01-01")
+
+    def _es_search(self, index, body, **kwargs):
+        slice_id = body["slice"]["id"]
+        return {
+            "_scroll_id": f"scroll-{slice_id}",
+            "hits": {"hits": [{"_id": f"{slice_id}-{i}", "_source": {}} for i in range(2)]},
+        }
+
+    def test_every_slice_is_scrolled_to_the_end(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        with self.app.app_context():
+            documents, status_code = export_documents(
+                "test-index", "services", MultiDict({"q": "email", "idOnly": "True", "page": "3"})
+            )
+            documents = list(documents)
+
+        assert status_code == 200
+        assert sorted(document["id"] for document in documents) == ["0-0", "0-1", "1-0", "1-1", "2-0", "2-1"]
+        bodies = [call[1]["body"] for call in self.es.search.call_args_list]
+        assert sorted(body["slice"]["id"] for body in bodies) == [0, 1, 2]
+        assert all(body["slice"]["max"] == 3 for body in bodies)
+        assert all(body["sort"] == ["_doc"] and body["_source"] is False and "from" not in body for body in bodies)
+        assert {call[1]["index"] for call in self.es.search.call_args_list} == {"test-index-2020-01-01"}
+        assert self.es.clear_scroll.call_count == 3
+
+    def test_a_single_slice_is_not_sliced(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.app.config['DM_SEARCH_EXPORT_SLICES'] = 1
+        self.es.search.side_effect = None
+        self.es.search.return_value = {"_scroll_id": "scroll", "hits": {"hits": [{"_id": "1", "_source": {}}]}}
+
+        with self.app.app_context():
+            documents, status_code = export_documents("test-index", "services", MultiDict({"idOnly": "True"}))
+
+            assert list(documents) == [{"id": "1"}]
+        assert "slice" not in self.es.search.call_args[1]["body"]
+
+    def test_failed_scroll_ends_export_with_an_error(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.scroll.side_effect = TransportError(404, "search_context_missing_exception", "No search context found")
+
+        with self.app.app_context():
+            documents, status_code = export_documents("test-index", "services", MultiDict({"idOnly": "True"}))
+            documents = list(documents)
+
+        assert documents[-1] == {"error": "No search context found"}
+        assert len(documents) <= 7
+
+    def test_missing_index_gives_404_before_streaming(self):
+        self.get_mapping.side_effect = TransportError(404, "index_not_found_exception", "no such index [test-index]")
+
+        with self.app.app_context():
+            result, status_code = export_documents("test-index", "services", MultiDict({"idOnly": "True"}))
+
+        assert (result, status_code) == ("no such index [test-index]", 404)
+        assert self.es.search.called is False
+
+
+class TestMultiSearch(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.get_mapping = self.patch('app.mapping.get_mapping')
+        alias_resolver.set("g-cloud-12", "g-cloud-12-2020-01-01")
+        alias_resolver.set("g-cloud-11", "g-cloud-11-2019-01-01")
+
+    def _es_response(self, *ids):
+        return {"took": 1, "hits": {"total": {"value": len(ids)}, "hits": [{"_id": id, "_source": {}} for id in ids]}}
+
+    def test_searches_are_sent_in_one_msearch(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.msearch.return_value = {"responses": [self._es_response("1", "2"), self._es_response("3")]}
+
+        with self.app.test_request_context():
+            results = multi_search([
+                ("g-cloud-12", "services", MultiDict({"q": "email", "idOnly": "True"})),
+                ("g-cloud-11", "services", MultiDict({"q": "email", "idOnly": "True"})),
+            ])
+
+        assert self.es.msearch.call_count == 1
+        body = self.es.msearch.call_args[1]["body"]
+        assert body[0] == {"index": "g-cloud-12-2020-01-01", "search_type": "dfs_query_then_fetch"}
+        assert body[2] == {"index": "g-cloud-11-2019-01-01", "search_type": "dfs_query_then_fetch"}
+        assert body[1]["track_total_hits"] is True
+        assert body[1]["_source"] is False
+        assert [status_code for _, status_code in results] == [200, 200]
+        assert results[0][0]["documents"] == [{"id": "1"}, {"id": "2"}]
+        assert results[1][0]["documents"] == [{"id": "3"}]
+        assert results[1][0]["meta"]["total"] == 1
+
+    def test_each_search_gets_its_own_status(self, services_mapping):
+        def get_mapping(index_name, doc_type):
+            if doc_type != "services":
+                raise MappingNotFound(f"Document type '{doc_type}' is not valid in index '{index_name}'")
+            return services_mapping
+
+        self.get_mapping.side_effect = get_mapping
+        self.es.msearch.return_value = {"responses": [
+            {"status": 400, "error": {"root_cause": [{"type": "query_shard_exception", "reason": "failed"}]}},
+            self._es_response(),
+        ]}
+
+        with self.app.test_request_context():
+            results = multi_search([
+                ("g-cloud-12", "services", MultiDict({"q": "email"})),
+                ("g-cloud-12", "briefs", MultiDict({"q": "email"})),
+                ("g-cloud-12", "services", MultiDict({"q": "email", "page": "nonsense"})),
+                ("g-cloud-12", "services", MultiDict({"q": "email", "page": "2"})),
+            ])
+
+        assert len(self.es.msearch.call_args[1]["body"]) == 4
+        assert [status_code for _, status_code in results] == [400, 400, 400, 404]
+        assert results[0][0] == "query_shard_exception: failed"
+        assert results[2][0] == "Invalid page nonsense"
+        assert results[3][0] == "Page 2 does not exist for this search"
+
+    def test_cached_searches_are_not_sent_again(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.msearch.return_value = {"responses": [self._es_response("1")]}
+        search_cache.settle_time = 0
+
+        with self.app.test_request_context():
+            first = multi_search([("g-cloud-12", "services", MultiDict({"q": "email"}))])
+            second = multi_search([("g-cloud-12", "services", MultiDict({"q": "email"}))])
+
+        assert first == second
+        assert self.es.msearch.call_count == 1
+
+    def test_msearch_failure_is_every_searchs_status(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.msearch.side_effect = TransportError(503, "unavailable", "cluster unavailable")
+
+        with self.app.test_request_context():
+            results = multi_search([
+                ("g-cloud-12", "services", MultiDict({"q": "email"})),
+                ("g-cloud-11", "services", MultiDict({"q": "email"})),
+            ])
+
+        assert results == [("cluster unavailable", 503), ("cluster unavailable", 503)]
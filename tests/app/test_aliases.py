@@ -0,0 +1,77 @@
+import mock
+import pytest
+from elasticsearch.exceptions import NotFoundError
+
+from app.aliases import AliasResolver, CONCRETE_INDEX_HEADER
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+class TestAliasResolver(BaseApplicationTestWithoutElasticsearch):
+    es_target = 'app.aliases.es'
+
+    def setup(self):
+        super().setup()
+        self.es.indices.get_alias.return_value = {"g-cloud-12-2020-01-01": {"aliases": {"g-cloud-12": {}}}}
+
+    def test_resolve_asks_elasticsearch_once(self):
+        resolver = AliasResolver()
+        with self.app.app_context():
+            assert resolver.resolve("g-cloud-12") == "g-cloud-12-2020-01-01"
+            assert resolver.resolve("g-cloud-12") == "g-cloud-12-2020-01-01"
+
+        self.es.indices.get_alias.assert_called_once_with(index="g-cloud-12")
+
+    def test_resolve_rechecks_after_interval(self):
+        resolver = AliasResolver(recheck_interval=10)
+        with self.app.app_context():
+            with mock.patch("app.aliases.time.monotonic", return_value=100):
+                resolver.resolve("g-cloud-12")
+            with mock.patch("app.aliases.time.monotonic", return_value=109):
+                resolver.resolve("g-cloud-12")
+            with mock.patch("app.aliases.time.monotonic", return_value=111):
+                resolver.resolve("g-cloud-12")
+
+        assert self.es.indices.get_alias.call_count == 2
+
+    @pytest.mark.parametrize("get_alias_kwargs", (
+        {"side_effect": NotFoundError(404, "index_not_found_exception")},
+        {"return_value": {"g-cloud-11-2019-01-01": {}, "g-cloud-12-2020-01-01": {}}},
+    ))
+    def test_unresolvable_names_are_returned_unchanged_and_not_cached(self, get_alias_kwargs):
+        self.es.indices.get_alias.configure_mock(**get_alias_kwargs)
+        resolver = AliasResolver()
+        with self.app.app_context():
+            assert resolver.resolve("g-cloud-*") == "g-cloud-*"
+
+        assert resolver.get("g-cloud-*") is None
+
+    def test_set_replaces_resolution_immediately(self):
+        resolver = AliasResolver()
+        with self.app.app_context():
+            resolver.resolve("g-cloud-12")
+            resolver.set("g-cloud-12", "g-cloud-12-2020-02-02")
+
+            assert resolver.resolve("g-cloud-12") == "g-cloud-12-2020-02-02"
+
+        assert self.es.indices.get_alias.call_count == 1
+
+    def test_invalidating_an_index_forgets_aliases_pointing_at_it(self):
+        resolver = AliasResolver()
+        resolver.set("g-cloud-12", "g-cloud-12-2020-01-01")
+        resolver.set("g-cloud-11", "g-cloud-11-2019-01-01")
+
+        resolver.invalidate("g-cloud-12-2020-01-01")
+
+        assert resolver.get("g-cloud-12") is None
+        assert resolver.get("g-cloud-11") == "g-cloud-11-2019-01-01"
+
+    def test_resolved_index_is_reported_in_response_header(self):
+        @self.app.route("/_test_resolve")
+        def resolve_view():
+            AliasResolver().resolve("g-cloud-12")
+            return "ok"
+
+        response = self.client.get("/_test_resolve")
+
+        assert response.headers[CONCRETE_INDEX_HEADER] == "g-cloud-12-2020-01-01"
@@ -0,0 +1,83 @@
+import json
+
+import mock
+import pytest
+from flask import json as flask_json
+from werkzeug.datastructures import MultiDict
+
+from app.json_codec import BACKENDS, JsonCodec, json_codec, jsonify
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    original_backend = json_codec.backend
+    json_codec.use(request.param)
+    yield request.param
+    json_codec.use(original_backend)
+
+
+class TestJsonCodec:
+    def test_dumps_is_compact_and_sorted(self, backend):
+        assert json_codec.dumps({"b": [1, 2.5, None], "a": {"d": True, "c": "x"}}) == (
+            b'{"a":{"c":"x","d":true},"b":[1,2.5,null]}'
+        )
+
+    def test_round_trip(self, backend):
+        data = {"documents": [{"id": "123", "serviceName": "Email £ hosting", "score": 1.5, "tags": ["a", "b"]}]}
+
+        assert json_codec.loads(json_codec.dumps(data)) == data
+        assert json_codec.loads(json_codec.dumps(data).decode("utf-8")) == data
+        assert json.loads(json_codec.dumps(data)) == data
+
+    def test_multidicts_are_encoded_with_first_values_as_flask_does(self, backend):
+        query = MultiDict([("q", "email"), ("filter_lot", "a"), ("filter_lot", "b")])
+
+        assert json_codec.dumps({"meta": {"query": query}}) == b'{"meta":{"query":{"filter_lot":"a","q":"email"}}}'
+        assert json.loads(json_codec.dumps(query)) == json.loads(flask_json.dumps(query))
+
+    def test_loads_raises_value_error_for_invalid_json(self, backend):
+        with pytest.raises(ValueError):
+            json_codec.loads(b'{"document": ')
+
+    def test_auto_uses_the_fastest_backend_installed(self):
+        assert JsonCodec("auto").backend == ("orjson" if "orjson" in BACKENDS else "json")
+
+    def test_stdlib_fallback_is_used_without_orjson(self):
+        with mock.patch.dict("app.json_codec.BACKENDS", clear=True, json=BACKENDS["json"]):
+            assert JsonCodec("auto").backend == "json"
+
+    def test_unknown_backend_raises(self):
+        with pytest.raises(ValueError) as e:
+            JsonCodec("simplejson")
+
+        assert "simplejson" in str(e.value)
+
+
+class TestJsonCodecInApp(BaseApplicationTestWithoutElasticsearch):
+    def test_jsonify_response(self, backend):
+        with self.app.app_context():
+            response = jsonify(meta={"total": 1}, documents=[{"id": "123"}])
+
+        assert response.mimetype == "application/json"
+        assert json.loads(response.get_data()) == {"meta": {"total": 1}, "documents": [{"id": "123"}]}
+
+    def test_request_bodies_are_parsed_with_codec(self, backend):
+        with self.app.test_request_context(
+            data=json.dumps({"document": {"id": "123"}}), content_type="application/json"
+        ) as context:
+            with mock.patch.object(json_codec, "_loads", wraps=json_codec._loads) as loads:
+                assert context.request.get_json() == {"document": {"id": "123"}}
+                assert context.request.get_json() == {"document": {"id": "123"}}
+
+        assert loads.call_count == 1
+
+    def test_invalid_request_body_gives_400(self, backend):
+        response = self.client.put(
+            "/index-to-create",
+            data='{"type": ',
+            content_type="application/json",
+        )
+
+        assert response.status_code == 400
@@ -0,0 +1,233 @@
+import json
+
+import mock
+import pytest
+
+import app.aliases
+import app.mapping
+from app import create_app
+from app.mapping import (
+    MappingCache,
+    MappingDefinitionError,
+    MappingNotFound,
+    MappingRegistry,
+    get_mapping,
+    mapping_registry,
+)
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+class TestMappingCache:
+    def test_get_returns_none_for_unknown_name(self):
+        cache = MappingCache()
+
+        assert cache.get("g-cloud-12") is None
+        assert cache.stats() == {"size": 0, "hits": 0, "misses": 1}
+
+    def test_get_returns_cached_mapping(self, services_mapping):
+        cache = MappingCache()
+        cache.set("g-cloud-12-2020-01-01", services_mapping)
+
+        assert cache.get("g-cloud-12-2020-01-01") is services_mapping
+        assert cache.stats() == {"size": 1, "hits": 1, "misses": 0}
+
+    def test_entries_expire_after_ttl(self, services_mapping):
+        cache = MappingCache(ttl=10)
+        with mock.patch("app.mapping.time.monotonic", return_value=100):
+            cache.set("g-cloud-12-2020-01-01", services_mapping)
+        with mock.patch("app.mapping.time.monotonic", return_value=109):
+            assert cache.get("g-cloud-12-2020-01-01") is services_mapping
+        with mock.patch("app.mapping.time.monotonic", return_value=111):
+            assert cache.get("g-cloud-12-2020-01-01") is None
+
+        assert cache.stats() == {"size": 0, "hits": 1, "misses": 1}
+
+    def test_least_recently_used_entry_is_evicted(self, services_mapping):
+        cache = MappingCache(max_size=2)
+        cache.set("a", services_mapping)
+        cache.set("b", services_mapping)
+        cache.get("a")
+        cache.set("c", services_mapping)
+
+        assert cache.get("a") is services_mapping
+        assert cache.get("b") is None
+        assert cache.get("c") is services_mapping
+
+    @pytest.mark.parametrize("ttl, max_size", ((0, 64), (300, 0)))
+    def test_nothing_is_cached_if_disabled(self, services_mapping, ttl, max_size):
+        cache = MappingCache(ttl=ttl, max_size=max_size)
+        cache.set("g-cloud-12-2020-01-01", services_mapping)
+
+        assert cache.get("g-cloud-12-2020-01-01") is None
+
+    def test_invalidate_drops_entry(self, services_mapping):
+        cache = MappingCache()
+        cache.set("g-cloud-12-2020-01-01", services_mapping)
+        cache.set("g-cloud-11-2019-01-01", services_mapping)
+
+        cache.invalidate("g-cloud-12-2020-01-01")
+
+        assert cache.get("g-cloud-12-2020-01-01") is None
+        assert cache.get("g-cloud-11-2019-01-01") is services_mapping
+
+
+class TestGetMapping(BaseApplicationTestWithoutElasticsearch):
+    es_target = 'app.mapping.es'
+
+    def test_mapping_is_only_fetched_once(self, services_mapping):
+        self.es.indices.get_mapping.return_value = {"test-index": services_mapping.definition}
+
+        with self.app.app_context():
+            first = get_mapping("test-index", "services")
+            second = get_mapping("test-index", "services")
+
+        assert first is second
+        assert self.es.indices.get_mapping.call_count == 1
+        assert app.mapping.mapping_cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+    def test_wrong_doc_type_raises_even_when_cached(self, services_mapping):
+        self.es.indices.get_mapping.return_value = {"test-index": services_mapping.definition}
+
+        with self.app.app_context():
+            get_mapping("test-index", "services")
+            with pytest.raises(MappingNotFound):
+                get_mapping("test-index", "briefs")
+
+        assert self.es.indices.get_mapping.call_count == 1
+
+    def test_mapping_is_refetched_after_invalidation(self, services_mapping):
+        self.es.indices.get_mapping.return_value = {"test-index": services_mapping.definition}
+
+        with self.app.app_context():
+            get_mapping("index-alias", "services")
+            app.mapping.mapping_cache.invalidate("test-index")
+            get_mapping("index-alias", "services")
+
+        assert self.es.indices.get_mapping.call_count == 2
+
+    def test_aliases_share_their_index_mapping(self, services_mapping):
+        self.es.indices.get_mapping.return_value = {"test-index": services_mapping.definition}
+
+        with self.app.app_context():
+            first = get_mapping("index-alias", "services")
+            second = get_mapping("test-index", "services")
+
+        assert first is second
+        assert self.es.indices.get_mapping.call_count == 1
+        assert app.aliases.alias_resolver.get("index-alias") == "test-index"
+
+    @pytest.mark.parametrize("index_name", ("test-*", "test-index-1,test-index-2"))
+    def test_names_of_several_indexes_arent_resolved_to_one(self, services_mapping, index_name):
+        self.es.indices.get_mapping.return_value = {
+            "test-index-1": services_mapping.definition,
+            "test-index-2": services_mapping.definition,
+        }
+
+        with self.app.app_context():
+            assert get_mapping(index_name, "services").mapping_type == "services"
+            get_mapping(index_name, "services")
+
+        assert self.es.indices.get_mapping.call_count == 2
+        assert app.aliases.alias_resolver.get(index_name) is None
+        assert app.mapping.mapping_cache.stats()["size"] == 0
+
+
+class TestMappingRegistry:
+    def test_registry_has_all_mapping_files(self):
+        registry = MappingRegistry()
+        registry.reload()
+
+        assert frozenset(registry.names()) == frozenset((
+            'services',
+            'briefs-digital-outcomes-and-specialists-2',
+            'services-g-cloud-10',
+            'services-g-cloud-11',
+            'services-g-cloud-12',
+        ))
+
+    def test_registered_mapping(self, services_mapping):
+        registry = MappingRegistry()
+        registry.reload()
+        registered_mapping = registry.get("services-g-cloud-10")
+
+        assert registered_mapping.name == "services-g-cloud-10"
+        assert registered_mapping.mapping.mapping_type == "services"
+        assert registered_mapping.mapping.prefixes_by_field == services_mapping.prefixes_by_field
+
+    def test_registered_mappings_have_a_fingerprint_field(self, services_mapping):
+        registry = MappingRegistry()
+        registry.reload()
+        registered_mapping = registry.get("services-g-cloud-10")
+
+        properties = dict(registered_mapping.mapping.definition["mappings"]["properties"])
+        assert properties.pop("dmfingerprint") == {"type": "keyword", "index": False, "doc_values": False}
+        assert properties == services_mapping.definition["mappings"]["properties"]
+        assert registered_mapping.mapping.has_fingerprint is True
+        assert services_mapping.has_fingerprint is False
+
+    def test_unknown_mapping_raises_mapping_not_found(self):
+        registry = MappingRegistry()
+        registry.reload()
+
+        with pytest.raises(MappingNotFound):
+            registry.get("some-bad-mapping")
+
+    def test_get_definition_returns_a_copy(self):
+        registry = MappingRegistry()
+        registry.reload()
+
+        registry.get_definition("services")["mappings"]["properties"].clear()
+
+        assert registry.get_definition("services")["mappings"]["properties"]
+
+    def test_content_hash_ignores_formatting(self, tmpdir):
+        definition = {"mappings": {"_meta": {"doc_type": "services"}, "properties": {"dmtext_a": {}, "dmtext_b": {}}}}
+        tmpdir.join("compact.json").write(json.dumps(definition))
+        tmpdir.join("pretty.json").write(json.dumps(definition, indent=4))
+        registry = MappingRegistry(directory=str(tmpdir))
+        registry.reload()
+
+        assert registry.get("compact").content_hash == registry.get("pretty").content_hash
+
+    def test_reload_picks_up_changes(self, tmpdir):
+        tmpdir.join("services.json").write(json.dumps(
+            {"mappings": {"_meta": {"doc_type": "services"}, "properties": {"dmtext_a": {}}}}
+        ))
+        registry = MappingRegistry(directory=str(tmpdir))
+        registry.reload()
+        original_hash = registry.get("services").content_hash
+
+        tmpdir.join("services.json").write(json.dumps(
+            {"mappings": {"_meta": {"doc_type": "services"}, "properties": {"dmtext_b": {}}}}
+        ))
+        tmpdir.join(".ignored.json").write("not json")
+        registry.reload()
+
+        assert list(registry.names()) == ["services"]
+        assert registry.get("services").content_hash != original_hash
+        assert registry.get("services").mapping.fields_by_prefix == {"dmtext": frozenset(("b",))}
+
+    @pytest.mark.parametrize("definition", (
+        {"mappings": {"properties": {"dmtext_a": {}}}},
+        {"mappings": {"_meta": {"doc_type": "services"}, "properties": {}}},
+        {
+            "mappings": {
+                "_meta": {"doc_type": "services", "transformations": [{"hash_to": {}, "set_conditionally": {}}]},
+                "properties": {"dmtext_a": {}},
+            },
+        },
+    ))
+    def test_invalid_definitions_are_rejected(self, tmpdir, definition):
+        tmpdir.join("invalid.json").write(json.dumps(definition))
+        registry = MappingRegistry(directory=str(tmpdir))
+
+        with pytest.raises(MappingDefinitionError):
+            registry.reload()
+
+    def test_registry_is_loaded_at_app_creation(self):
+        mapping_registry._registered = {}
+
+        create_app('test')
+
+        assert "services-g-cloud-12" in mapping_registry.names()
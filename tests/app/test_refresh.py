@@ -0,0 +1,53 @@
+from app.refresh import RefreshCoordinator
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+class TestRefreshCoordinator(BaseApplicationTestWithoutElasticsearch):
+    es_target = 'app.refresh.es'
+
+    def _coordinator(self, window=60):
+        coordinator = RefreshCoordinator(window=window)
+        coordinator._app = self.app
+        return coordinator
+
+    def test_requests_for_an_index_are_merged(self):
+        coordinator = self._coordinator()
+        coordinator.request("test-index")
+        coordinator.request("test-index")
+        coordinator.request("test-index-2")
+        coordinator.request("test-index")
+
+        assert coordinator.stats() == {"pending": 2, "requested": 2, "merged": 2, "refreshes": 0, "failures": 0}
+
+        coordinator.flush()
+
+        assert sorted(call[1]["index"] for call in self.es.indices.refresh.call_args_list) == [
+            "test-index", "test-index-2",
+        ]
+        assert coordinator.stats() == {"pending": 0, "requested": 2, "merged": 2, "refreshes": 2, "failures": 0}
+
+    def test_request_after_refresh_schedules_another(self):
+        coordinator = self._coordinator()
+        coordinator.request("test-index")
+        coordinator.flush()
+        coordinator.request("test-index")
+        coordinator.flush()
+
+        assert self.es.indices.refresh.call_count == 2
+        assert coordinator.stats()["merged"] == 0
+
+    def test_refresh_happens_after_window(self):
+        coordinator = self._coordinator(window=0.01)
+        coordinator.request("test-index")
+        coordinator._scheduled["test-index"].join(1)
+
+        self.es.indices.refresh.assert_called_once_with(index="test-index")
+
+    def test_clear_cancels_scheduled_refreshes(self):
+        coordinator = self._coordinator()
+        coordinator.request("test-index")
+        coordinator.clear()
+        coordinator.flush()
+
+        assert self.es.indices.refresh.called is False
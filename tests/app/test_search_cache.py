@@ -0,0 +1,312 @@
+import json
+
+import mock
+import pytest
+from elasticsearch import TransportError
+from werkzeug.datastructures import MultiDict
+
+from app.aliases import alias_resolver
+from app.mapping import MappingNotFound
+from app.main.services.search_service import (
+    aggregations_with_keywords_and_filters,
+    core_search_and_aggregate,
+    create_alias,
+    index,
+    refresh,
+)
+from app.search_cache import SearchCache, WriteGenerations, aggregation_cache, search_cache
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+with open("example_es_responses/search_results.json") as search_results:
+    SEARCH_RESULTS = json.load(search_results)
+
+
+class TestSearchCache:
+    def _cache(self, **kwargs):
+        return SearchCache(**dict({"settle_time": 0}, **kwargs))
+
+    def test_filter_values_are_sorted_in_keys(self):
+        cache = self._cache()
+
+        assert cache.key(
+            "g-cloud-12-2020-01-01", "services",
+            MultiDict([("filter_lot", "cloud-support"), ("q", "email"), ("filter_lot", "cloud-hosting")]),
+        ) == cache.key(
+            "g-cloud-12-2020-01-01", "services",
+            MultiDict([("q", "email"), ("filter_lot", "cloud-hosting"), ("filter_lot", "cloud-support")]),
+        )
+
+    def test_repeated_filter_values_are_kept_in_keys(self):
+        cache = self._cache()
+
+        assert cache.key(
+            "g-cloud-12-2020-01-01", "services",
+            MultiDict([("filter_lot", "cloud-hosting,cloud-support"), ("filter_lot", "cloud-hosting,cloud-support")]),
+        ) != cache.key(
+            "g-cloud-12-2020-01-01", "services",
+            MultiDict([("filter_lot", "cloud-hosting,cloud-support")]),
+        )
+
+    @pytest.mark.parametrize("query_args", (
+        MultiDict([("q", "email"), ("page", "2")]),
+        MultiDict([("q", "email hosting")]),
+        MultiDict([("q", "email"), ("idOnly", "True")]),
+        MultiDict([("q", "email"), ("filter_lot", "cloud-hosting")]),
+    ))
+    def test_different_queries_have_different_keys(self, query_args):
+        cache = self._cache()
+
+        assert cache.key("g-cloud-12", "services", query_args) != cache.key(
+            "g-cloud-12", "services", MultiDict({"q": "email"})
+        )
+
+    def test_cached_response_is_returned(self):
+        cache = self._cache()
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        cache.set(key, {"documents": []}, cache.generation(key))
+
+        assert cache.get(key) == {"documents": []}
+        assert cache.get(cache.key("g-cloud-11", "services", MultiDict({"q": "email"}))) is None
+        assert cache.stats() == {"size": 1, "bytes": 16, "hits": 1, "misses": 1, "hit_ratio": 0.5, "evictions": 0}
+
+    def test_bumping_an_index_invalidates_its_responses(self):
+        cache = self._cache()
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        other_key = cache.key("g-cloud-11", "services", MultiDict({"q": "email"}))
+        cache.set(key, {"documents": []}, cache.generation(key))
+        cache.set(other_key, {"documents": []}, cache.generation(other_key))
+
+        cache.generations.bump("g-cloud-12")
+
+        assert cache.get(cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))) is None
+        assert cache.get(cache.key("g-cloud-11", "services", MultiDict({"q": "email"}))) == {"documents": []}
+
+    def test_response_from_before_a_write_is_not_stored(self):
+        cache = self._cache()
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        generation = cache.generation(key)
+
+        cache.generations.bump("g-cloud-12")
+        cache.set(key, {"documents": []}, generation)
+
+        assert cache.stats()["size"] == 0
+
+    def test_stale_responses_are_served_within_max_stale(self):
+        cache = self._cache(max_stale=30)
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        with mock.patch("app.search_cache.time.monotonic", return_value=100):
+            cache.set(key, {"documents": []}, cache.generation(key))
+            cache.generations.bump("g-cloud-12")
+
+        with mock.patch("app.search_cache.time.monotonic", return_value=129):
+            assert cache.get(key) == {"documents": []}
+        with mock.patch("app.search_cache.time.monotonic", return_value=131):
+            assert cache.get(key) is None
+
+    def test_caches_can_share_write_generations(self):
+        generations = WriteGenerations()
+        caches = [self._cache(generations=generations), self._cache(generations=generations)]
+        keys = [cache.key("g-cloud-12", "services", MultiDict({"q": "email"})) for cache in caches]
+        for cache, key in zip(caches, keys):
+            cache.set(key, {"documents": []}, cache.generation(key))
+
+        generations.bump("g-cloud-12")
+
+        assert [cache.get(key) for cache, key in zip(caches, keys)] == [None, None]
+
+    def test_responses_are_not_stored_until_writes_have_settled(self):
+        cache = self._cache(settle_time=2)
+        with mock.patch("app.search_cache.time.monotonic", return_value=100):
+            cache.generations.bump("g-cloud-12")
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+
+        with mock.patch("app.search_cache.time.monotonic", return_value=101):
+            cache.set(key, {"documents": []}, cache.generation(key))
+        assert cache.stats()["size"] == 0
+
+        with mock.patch("app.search_cache.time.monotonic", return_value=103):
+            cache.set(key, {"documents": []}, cache.generation(key))
+        assert cache.stats()["size"] == 1
+
+    @pytest.mark.parametrize("refreshed, size", ((False, 0), (True, 1)))
+    def test_refreshes_settle_earlier_writes(self, refreshed, size):
+        cache = self._cache(settle_time=2)
+        with mock.patch("app.search_cache.time.monotonic", return_value=100):
+            cache.generations.bump("g-cloud-12")
+            cache.generations.bump("g-cloud-12", settled=True, refreshed=refreshed)
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+
+        with mock.patch("app.search_cache.time.monotonic", return_value=101):
+            cache.set(key, {"documents": []}, cache.generation(key))
+        assert cache.stats()["size"] == size
+
+    def test_entries_expire_after_ttl(self):
+        cache = self._cache(ttl=10)
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        with mock.patch("app.search_cache.time.monotonic", return_value=100):
+            cache.set(key, {"documents": []}, cache.generation(key))
+
+        with mock.patch("app.search_cache.time.monotonic", return_value=111):
+            assert cache.get(key) is None
+        assert cache.stats()["bytes"] == 0
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self._cache(max_entries=2)
+        keys = [cache.key("g-cloud-12", "services", MultiDict({"q": q})) for q in ("a", "b", "c")]
+        cache.set(keys[0], {"documents": []}, cache.generation(keys[0]))
+        cache.set(keys[1], {"documents": []}, cache.generation(keys[1]))
+        cache.get(keys[0])
+        cache.set(keys[2], {"documents": []}, cache.generation(keys[2]))
+
+        assert [cache.get(key) is not None for key in keys] == [True, False, True]
+        assert cache.stats()["evictions"] == 1
+
+    def test_memory_cap_evicts_entries(self):
+        cache = self._cache(max_bytes=40)
+        keys = [cache.key("g-cloud-12", "services", MultiDict({"q": q})) for q in ("a", "b", "c")]
+        for key in keys:
+            cache.set(key, {"documents": []}, cache.generation(key))  # 16 bytes each
+        huge_key = cache.key("g-cloud-12", "services", MultiDict({"q": "huge"}))
+        cache.set(huge_key, {"documents": ["x" * 40]}, cache.generation(huge_key))
+
+        assert [cache.get(key) is not None for key in keys] == [False, True, True]
+        assert cache.stats()["bytes"] == 32
+
+    @pytest.mark.parametrize("kwargs", ({"ttl": 0}, {"max_entries": 0}, {"max_bytes": 0}))
+    def test_nothing_is_cached_if_disabled(self, kwargs):
+        cache = self._cache(**kwargs)
+        key = cache.key("g-cloud-12", "services", MultiDict({"q": "email"}))
+        cache.set(key, {"documents": []}, cache.generation(key))
+
+        assert cache.get(key) is None
+
+
+class TestSearchCaching(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        search_cache.settle_time = aggregation_cache.settle_time = 0
+        alias_resolver.set("test-index", "test-index-2020-01-01")
+        self.es.search.return_value = SEARCH_RESULTS
+        self.es.index.return_value = {"_index": "test-index-2020-01-01"}
+        self.get_mapping = self.patch("app.mapping.get_mapping")
+
+    def _search(self, **query_args):
+        with self.app.test_request_context():
+            return core_search_and_aggregate("test-index", "services", MultiDict(query_args), search=True)
+
+    def test_repeated_search_is_served_from_cache(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        first = self._search(q="email")
+        second = self._search(q="email")
+
+        assert first == second
+        assert self.es.search.call_count == 1
+        assert search_cache.stats()["hits"] == 1
+
+    def test_write_invalidates_cached_search(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        self._search(q="email")
+        with self.app.app_context():
+            index("test-index", "services", {"dmtext_serviceName": "Email"}, "123")
+        self._search(q="email")
+
+        assert self.es.search.call_count == 2
+
+    def test_alias_swap_invalidates_cached_search(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.indices.get_mapping.return_value = {"test-index-2020-01-02": {"mappings": {}}}
+
+        self._search(q="email")
+        with self.app.app_context():
+            create_alias("test-index", "test-index-2020-01-02")
+        self._search(q="email")
+
+        assert self.es.search.call_count == 2
+        assert self.es.search.call_args[1]["index"] == "test-index-2020-01-02"
+
+    def test_searches_outside_a_request_are_not_cached(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+
+        with self.app.app_context():
+            core_search_and_aggregate("test-index", "services", MultiDict(), aggregations=["lot"])
+
+        assert self.es.search.call_count == 1
+        assert aggregation_cache.stats() == {
+            "size": 0, "bytes": 0, "hits": 0, "misses": 0, "hit_ratio": None, "evictions": 0,
+        }
+
+    def test_error_responses_are_not_cached(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.search.return_value = dict(SEARCH_RESULTS, hits={"total": {"value": 0}, "hits": []})
+
+        assert self._search(q="email", page="2")[1] == 404
+        assert self._search(q="email", page="2")[1] == 404
+
+        assert self.es.search.call_count == 2
+
+    def test_aggregations_are_cached_separately_and_may_be_stale(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        query_args = MultiDict({"aggregations": "lot"})
+
+        with self.app.test_request_context():
+            aggregations_with_keywords_and_filters("test-index", "services", query_args, ["lot"])
+            index("test-index", "services", {"dmtext_serviceName": "Email"}, "123")
+            aggregations_with_keywords_and_filters("test-index", "services", query_args, ["lot"])
+
+        assert self.es.search.call_count == 1
+        assert aggregation_cache.stats()["hits"] == 1
+        assert search_cache.stats()["size"] == 0
+
+    def test_alias_swap_prewarms_lot_aggregation(self, services_mapping):
+        self.get_mapping.return_value = services_mapping
+        self.es.indices.get_mapping.return_value = {
+            "test-index-2020-01-02": {"mappings": {"_meta": {"doc_type": "services"}}},
+        }
+
+        with self.app.test_request_context():
+            create_alias("test-index", "test-index-2020-01-02")
+            aggregations_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"aggregations": "lot"}), ["lot"]
+            )
+
+        assert self.es.search.call_count == 1
+        assert self.es.search.call_args[1]["index"] == "test-index-2020-01-02"
+        assert aggregation_cache.stats()["hits"] == 1
+
+    @pytest.mark.parametrize("error", (
+        TransportError(404, "index_not_found_exception", "no such index"),
+        MappingNotFound("Mapping not found"),
+    ))
+    def test_failed_prewarm_doesnt_fail_alias_swap(self, error):
+        self.get_mapping.side_effect = error
+        self.es.indices.get_mapping.return_value = {
+            "test-index-2020-01-02": {"mappings": {"_meta": {"doc_type": "services"}}},
+        }
+
+        with self.app.test_request_context():
+            assert create_alias("test-index", "test-index-2020-01-02") == ("acknowledged", 200)
+
+        assert alias_resolver.get("test-index") == "test-index-2020-01-02"
+
+    def test_alias_swap_prewarms_just_refreshed_index(self, services_mapping):
+        aggregation_cache.settle_time = 2
+        self.get_mapping.return_value = services_mapping
+        self.es.index.return_value = {"_index": "test-index-2020-01-02"}
+        self.es.indices.get_mapping.return_value = {
+            "test-index-2020-01-02": {"mappings": {"_meta": {"doc_type": "services"}}},
+        }
+
+        with self.app.test_request_context():
+            index("test-index-2020-01-02", "services", {"dmtext_serviceName": "Email"}, "123")
+            refresh("test-index-2020-01-02")
+            create_alias("test-index", "test-index-2020-01-02")
+            aggregations_with_keywords_and_filters(
+                "test-index", "services", MultiDict({"aggregations": "lot"}), ["lot"]
+            )
+
+        assert self.es.search.call_count == 1
+        assert aggregation_cache.stats()["hits"] == 1
@@ -0,0 +1,58 @@
+import pytest
+
+from app.aliases import alias_resolver
+from app.search_type import SearchTypeChooser
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch
+
+
+class TestSearchTypeChooser:
+    def test_searches_without_scoring_terms_use_query_then_fetch(self):
+        assert SearchTypeChooser().choose("g-cloud-12-2020-01-01", scoring=False) == "query_then_fetch"
+
+    def test_scoring_searches_use_dfs_until_shard_count_is_known(self):
+        assert SearchTypeChooser().choose("g-cloud-12-2020-01-01", scoring=True) == "dfs_query_then_fetch"
+
+    @pytest.mark.parametrize("shards,search_type", ((1, "query_then_fetch"), (5, "dfs_query_then_fetch")))
+    def test_scoring_searches_depend_on_shard_count(self, shards, search_type):
+        chooser = SearchTypeChooser()
+        chooser.record_shards("g-cloud-12-2020-01-01", {"_shards": {"total": shards, "successful": shards}})
+
+        assert chooser.choose("g-cloud-12-2020-01-01", scoring=True) == search_type
+        assert chooser.choose("g-cloud-11-2019-01-01", scoring=True) == "dfs_query_then_fetch"
+
+    def test_responses_without_shards_are_ignored(self):
+        chooser = SearchTypeChooser()
+        chooser.record_shards("g-cloud-12-2020-01-01", {"hits": {"hits": []}})
+
+        assert chooser.choose("g-cloud-12-2020-01-01", scoring=True) == "dfs_query_then_fetch"
+
+    def test_least_recently_recorded_shard_counts_are_evicted(self):
+        chooser = SearchTypeChooser(max_size=1)
+        chooser.record_shards("g-cloud-12-2020-01-01", {"_shards": {"total": 1}})
+        chooser.record_shards("g-cloud-11-2019-01-01", {"_shards": {"total": 1}})
+
+        assert chooser.choose("g-cloud-12-2020-01-01", scoring=True) == "dfs_query_then_fetch"
+        assert chooser.choose("g-cloud-11-2019-01-01", scoring=True) == "query_then_fetch"
+
+
+class TestSearchTypeChooserInApp(BaseApplicationTestWithoutElasticsearch):
+    def test_overrides_apply_to_aliases_and_their_indexes(self):
+        chooser = SearchTypeChooser()
+        self.app.config["DM_SEARCH_TYPE_OVERRIDES"] = {
+            "g-cloud-12": "query_then_fetch",
+            "g-cloud-11-2019-01-01": "dfs_query_then_fetch",
+        }
+        chooser.init_app(self.app)
+        alias_resolver.set("g-cloud-11", "g-cloud-11-2019-01-01")
+
+        assert chooser.choose("g-cloud-12", scoring=True) == "query_then_fetch"
+        assert chooser.choose("g-cloud-11", scoring=False) == "dfs_query_then_fetch"
+
+    def test_invalid_override_raises(self):
+        self.app.config["DM_SEARCH_TYPE_OVERRIDES"] = {"g-cloud-12": "dfs"}
+
+        with pytest.raises(ValueError) as e:
+            SearchTypeChooser().init_app(self.app)
+
+        assert "g-cloud-12" in str(e.value)
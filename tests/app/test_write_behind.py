@@ -0,0 +1,155 @@
+import mock
+from flask import json
+
+from app.main.services.process_request_json import convert_request_json_into_index_json
+from app.mapping import Mapping, mapping_registry
+from app.write_behind import WriteBehindQueue, write_behind_queue
+
+from tests.helpers import BaseApplicationTestWithoutElasticsearch, make_service
+
+
+class TestWriteBehindQueue(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.streaming_bulk = self.patch("app.write_behind.streaming_bulk")
+        self.streaming_bulk.side_effect = lambda es, actions, **kwargs: (
+            (True, {action["_op_type"]: {"_index": action["_index"], "_id": action["_id"], "status": 200}})
+            for action in actions
+        )
+
+    def _queue(self, **kwargs):
+        queue = WriteBehindQueue(**kwargs)
+        queue._app = self.app
+        queue._ensure_worker = mock.Mock()
+        return queue
+
+    def test_later_writes_to_a_document_replace_earlier_ones(self):
+        queue = self._queue()
+        queue.put({"_op_type": "index", "_index": "test-index", "_id": "1", "_source": {"a": 1}})
+        queue.put({"_op_type": "index", "_index": "test-index", "_id": "2", "_source": {"a": 2}})
+        queue.put({"_op_type": "delete", "_index": "test-index", "_id": "1"})
+
+        assert queue.stats()["depth"] == 2
+
+        queue.flush()
+
+        assert [
+            (action["_op_type"], action["_id"]) for action in self.streaming_bulk.call_args[0][1]
+        ] == [("index", "2"), ("delete", "1")]
+        assert queue.stats()["depth"] == 0
+        assert queue.stats()["flushed"] == 2
+        assert queue.stats()["coalesced"] == 1
+
+    def test_flushes_in_batches_of_max_batch_size(self):
+        queue = self._queue(max_batch_size=2)
+        for document_id in range(5):
+            queue.put({"_op_type": "delete", "_index": "test-index", "_id": str(document_id)})
+
+        queue.flush()
+
+        assert [len(call[0][1]) for call in self.streaming_bulk.call_args_list] == [2, 2, 1]
+        assert queue.stats()["flushes"] == 3
+
+    def test_failures_are_counted_but_missing_documents_are_not(self):
+        self.streaming_bulk.side_effect = lambda es, actions, **kwargs: iter([
+            (False, {"index": {"_index": "test-index", "_id": "1", "status": 400, "error": {"type": "bad"}}}),
+            (False, {"delete": {"_index": "test-index", "_id": "2", "status": 404, "result": "not_found"}}),
+        ])
+        queue = self._queue()
+        queue.put({"_op_type": "index", "_index": "test-index", "_id": "1", "_source": {}})
+        queue.put({"_op_type": "delete", "_index": "test-index", "_id": "2"})
+
+        queue.flush()
+
+        assert queue.stats()["failures"] == 1
+        assert queue.stats()["last_failure"] == {
+            "index": "test-index", "id": "1", "status": 400, "error": "{'type': 'bad'}",
+        }
+
+    def test_background_worker_flushes_after_interval(self):
+        queue = WriteBehindQueue(flush_interval=0.01)
+        queue._app = self.app
+        queue.put({"_op_type": "delete", "_index": "test-index", "_id": "1"})
+
+        for _ in range(100):
+            if queue.stats()["flushed"]:
+                break
+            queue._worker.join(0.01)
+
+        assert queue.stats()["flushed"] == 1
+
+
+class TestWriteBehindViews(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.app.config["DM_SEARCH_WRITE_BEHIND"] = True
+        write_behind_queue.init_app(self.app)
+        write_behind_queue._ensure_worker = mock.Mock()
+        self.patch("app.main.views.update.get_mapping").return_value = mapping_registry.get("services").mapping
+        self.es.mget.return_value = {"docs": []}
+
+    def teardown(self):
+        del write_behind_queue._ensure_worker
+        self.app.config["DM_SEARCH_WRITE_BEHIND"] = False
+        write_behind_queue.init_app(self.app)
+        super().teardown()
+
+    def test_writes_are_accepted_and_queued(self):
+        service = make_service(id="1")
+        response = self.client.put(
+            "/test-index/services/1",
+            data=json.dumps(service),
+            content_type="application/json")
+
+        assert response.status_code == 202
+        assert response.json == {"message": "accepted"}
+
+        response = self.client.delete("/test-index/services/2")
+
+        assert response.status_code == 202
+
+        response = self.client.get("/_write-behind")
+
+        assert response.status_code == 200
+        assert response.json["write_behind"]["enabled"] is True
+        assert response.json["write_behind"]["depth"] == 2
+
+    def test_explicit_refresh_is_rejected(self):
+        service = make_service(id="1")
+        response = self.client.put(
+            "/test-index/services/1?refresh=wait_for",
+            data=json.dumps(service),
+            content_type="application/json")
+
+        assert response.status_code == 400
+        assert response.json == {"error": "The 'refresh' option can't be used while write-behind is enabled"}
+
+        response = self.client.delete("/test-index/services/2?refresh=debounced")
+
+        assert response.status_code == 400
+        assert write_behind_queue.stats()["depth"] == 0
+
+    def test_unchanged_documents_are_skipped_rather_than_queued(self):
+        service = make_service(id="1")
+        index_json = convert_request_json_into_index_json(mapping_registry.get("services").mapping, service["document"])
+        self.es.mget.return_value = {"docs": [
+            {"_id": "1", "found": True, "_source": {Mapping.fingerprint_field: index_json[Mapping.fingerprint_field]}},
+        ]}
+
+        response = self.client.put("/test-index/services/1", data=json.dumps(service), content_type="application/json")
+
+        assert response.status_code == 200
+        assert response.json == {"message": "skipped"}
+        assert write_behind_queue.stats()["depth"] == 0
+
+    def test_queued_writes_are_compared_against_rather_than_stored_documents(self):
+        service = make_service(id="1")
+        for _ in range(2):
+            response = self.client.put(
+                "/test-index/services/1", data=json.dumps(service), content_type="application/json"
+            )
+
+        assert response.status_code == 200
+        assert response.json == {"message": "skipped"}
+        assert write_behind_queue.stats()["depth"] == 1
+        assert self.es.mget.call_count == 1
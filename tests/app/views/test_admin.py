@@ -1,6 +1,15 @@
+import mock
 from flask import json
 
-from tests.helpers import BaseApplicationTest
+from app import elasticsearch_client
+from app.main.services import search_service
+from app.mapping import MappingRegistry
+from tests.helpers import (
+    BaseApplicationTest,
+    BaseApplicationTestWithoutElasticsearch,
+    make_search_api_url,
+    make_service
+)
 
 
 class TestSearchIndexes(BaseApplicationTest):
@@ -130,3 +139,159 @@ class TestSearchIndexes(BaseApplicationTest):
 
         assert response.status_code == 400
         assert response.json["error"] == "Mapping definition named 'some-bad-mapping' not found."
+
+
+class TestReindex(BaseApplicationTest):
+    def test_documents_are_copied_to_new_index_and_alias_repointed(self):
+        self.create_index()
+        self.client.put('/index-alias', data=json.dumps({
+            "type": "alias",
+            "target": "test-index"
+        }), content_type="application/json")
+        for i in range(3):
+            service = make_service(id=str(i))
+            self.client.put(make_search_api_url(service), data=json.dumps(service), content_type="application/json")
+        with self.app.app_context():
+            search_service.refresh('test-index')
+
+        response = self.client.post('/test-index-2/_reindex', data=json.dumps({
+            "source": "index-alias",
+            "mapping": self.default_mapping_name,
+            "alias": "index-alias",
+        }), content_type="application/json")
+
+        assert response.status_code == 200
+        progress = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert progress[-2]["status"] == "complete"
+        assert (progress[-2]["total"], progress[-2]["copied"], progress[-2]["failed"]) == (3, 3, 0)
+        assert progress[-1]["status"] == "aliased"
+
+        status = self.client.get('/_all').json["status"]
+        assert status['test-index']['aliases'] == []
+        assert status['test-index-2']['aliases'] == ['index-alias']
+        assert status['test-index-2']['num_docs'] == 3
+
+    def test_bad_mapping_name_gives_400(self):
+        response = self.client.post('/test-index-2/_reindex', data=json.dumps({
+            "source": "test-index",
+            "mapping": "some-bad-mapping",
+        }), content_type="application/json")
+
+        assert response.status_code == 400
+
+
+class TestReindexFailure(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.patch("app.main.views.admin.create_index", return_value=("acknowledged", 200))
+        self.patch("app.main.views.admin.start_bulk_load", return_value=("acknowledged", 200))
+        self.finish_bulk_load = self.patch("app.main.views.admin.finish_bulk_load", return_value=("acknowledged", 200))
+        self.create_alias = self.patch("app.main.views.admin.create_alias", return_value=("acknowledged", 200))
+        self.copy_documents = self.patch("app.main.views.admin.copy_documents")
+
+    def test_failed_copy_finishes_bulk_load_and_reports_failure(self):
+        self.copy_documents.return_value = iter([
+            {"total": 3, "copied": 1, "failed": 0},
+            {"total": 3, "copied": 1, "failed": 0, "status": "failed", "error": "oops"},
+        ])
+
+        response = self.client.post('/test-index-2/_reindex', data=json.dumps({
+            "source": "test-index",
+            "mapping": self.default_mapping_name,
+            "alias": "index-alias",
+        }), content_type="application/json")
+
+        progress = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert progress[-1] == {
+            "target": "test-index-2",
+            "alias": "index-alias",
+            "status": "failed",
+            "message": "Not every document could be copied from 'test-index'",
+        }
+        self.finish_bulk_load.assert_called_once_with("test-index-2")
+        assert self.create_alias.called is False
+
+
+class TestMappingDefinitions(BaseApplicationTestWithoutElasticsearch):
+    def test_definitions_can_be_listed_and_reloaded(self, tmpdir):
+        tmpdir.join("services.json").write(json.dumps(
+            {"mappings": {"_meta": {"doc_type": "services"}, "properties": {"dmtext_a": {}}}}
+        ))
+        registry = MappingRegistry(directory=str(tmpdir))
+        registry.reload()
+
+        with mock.patch("app.main.views.admin.mapping_registry", registry):
+            response = self.client.get('/_mappings')
+
+            assert response.status_code == 200
+            assert response.json == {"mappings": {"services": registry.get("services").content_hash}}
+
+            tmpdir.join("briefs.json").write(json.dumps(
+                {"mappings": {"_meta": {"doc_type": "briefs"}, "properties": {"dmtext_a": {}}}}
+            ))
+            response = self.client.post('/_mappings/_reload')
+
+        assert response.status_code == 200
+        assert sorted(response.json["mappings"]) == ["briefs", "services"]
+
+    def test_invalid_definitions_leave_the_loaded_ones_in_place(self, tmpdir):
+        tmpdir.join("services.json").write(json.dumps(
+            {"mappings": {"_meta": {"doc_type": "services"}, "properties": {"dmtext_a": {}}}}
+        ))
+        registry = MappingRegistry(directory=str(tmpdir))
+        registry.reload()
+        tmpdir.join("broken.json").write("{")
+
+        with mock.patch("app.main.views.admin.mapping_registry", registry):
+            response = self.client.post('/_mappings/_reload')
+
+        assert response.status_code == 500
+        assert list(registry.names()) == ["services"]
+
+
+class TestBulkLoad(BaseApplicationTest):
+    def _index_settings(self):
+        with self.app.app_context():
+            return elasticsearch_client.indices.get_settings(index='test-index', flat_settings=True)[
+                'test-index'
+            ]['settings']
+
+    def test_bulk_load_lifecycle(self):
+        self.create_index()
+
+        response = self.client.put('/test-index/_bulk-load')
+
+        assert response.status_code == 200
+        assert self._index_settings()['index.refresh_interval'] == '-1'
+        assert self._index_settings()['index.number_of_replicas'] == '0'
+
+        response = self.client.put('/index-alias', data=json.dumps({
+            "type": "alias",
+            "target": "test-index"
+        }), content_type="application/json")
+
+        assert response.status_code == 400
+        assert response.json["error"] == (
+            "Index 'test-index' is being bulk loaded and cannot be aliased until the load is finished"
+        )
+
+        response = self.client.delete('/test-index/_bulk-load?force_merge=true')
+
+        assert response.status_code == 200
+        assert self._index_settings()['index.refresh_interval'] == '1s'
+        assert self._index_settings()['index.number_of_replicas'] == '1'
+
+        response = self.client.put('/index-alias', data=json.dumps({
+            "type": "alias",
+            "target": "test-index"
+        }), content_type="application/json")
+
+        assert response.status_code == 200
+
+    def test_cant_finish_bulk_load_that_was_never_started(self):
+        self.create_index()
+
+        response = self.client.delete('/test-index/_bulk-load')
+
+        assert response.status_code == 400
+        assert response.json["error"] == "Index 'test-index' is not being bulk loaded"
@@ -8,6 +8,7 @@ from app.main.services import search_service
 from app.main.services.search_service import core_search_and_aggregate
 from tests.helpers import (
     BaseApplicationTestWithIndex,
+    BaseApplicationTestWithoutElasticsearch,
     make_search_api_url,
     make_service
 )
@@ -68,6 +69,7 @@ class TestSearchEndpoint(BaseSearchTestWithServices):
                 '/index-alias/services/search?q=serviceName')
             assert response.status_code == 200
             assert response.json["meta"]["total"] == 10
+            assert response.headers["X-Concrete-Index"] == "test-index"
 
     def test_should_get_services_up_to_page_size(self):
         with self.app.app_context():
@@ -81,6 +83,26 @@ class TestSearchEndpoint(BaseSearchTestWithServices):
             assert response.json["meta"]["total"] == 10
             assert len(response.json["documents"]) == 5
 
+    def test_should_return_aggregations_with_search_results(self):
+        with self.app.app_context():
+            self.app.config['DM_SEARCH_PAGE_SIZE'] = '3'
+
+            response = self.client.get(
+                '/test-index/services/search?q=serviceName&aggregations=lot')
+            response_json = response.json
+
+            assert response.status_code == 200
+            assert len(response_json["documents"]) == 3
+            assert sum(response_json["aggregations"]["lot"].values()) == 10
+            assert "aggregations=lot" in response_json['links']['next']
+
+    def test_search_without_aggregations_has_none_in_response(self):
+        with self.app.app_context():
+            response = self.client.get('/test-index/services/search?q=serviceName')
+
+            assert response.status_code == 200
+            assert "aggregations" not in response.json
+
     def test_should_get_pagination_links(self):
         with self.app.app_context():
             self.app.config['DM_SEARCH_PAGE_SIZE'] = '3'
@@ -226,12 +248,27 @@ class TestFetchById(BaseApplicationTestWithIndex):
 
 
 class TestSearchType(BaseApplicationTestWithIndex):
-    def test_core_search_and_aggregate_does_dfs_query_for_searches(self):
+    def test_core_search_and_aggregate_does_dfs_query_for_keyword_searches(self):
         with self.app.app_context(), mock.patch.object(es, 'search') as es_search_mock:
-            core_search_and_aggregate('test-index', 'services', MultiDict(), search=True)
+            core_search_and_aggregate('test-index', 'services', MultiDict({'q': 'email'}), search=True)
 
         assert es_search_mock.call_args[1]['search_type'] == 'dfs_query_then_fetch'
 
+    def test_core_search_and_aggregate_skips_dfs_without_keywords(self):
+        with self.app.app_context(), mock.patch.object(es, 'search') as es_search_mock:
+            core_search_and_aggregate('test-index', 'services', MultiDict({'filter_lot': 'SaaS'}), search=True)
+
+        assert es_search_mock.call_args[1]['search_type'] == 'query_then_fetch'
+
+    def test_core_search_and_aggregate_skips_dfs_for_single_shard_index(self):
+        with self.app.app_context():
+            core_search_and_aggregate('test-index', 'services', MultiDict({'q': 'serviceName'}), search=True)
+            with mock.patch.object(es, 'search') as es_search_mock:
+                core_search_and_aggregate('test-index', 'services', MultiDict({'q': 'email'}), search=True)
+
+        # the test index has Elasticsearch's default of one primary shard, as the first search reported
+        assert es_search_mock.call_args[1]['search_type'] == 'query_then_fetch'
+
     def test_core_search_and_aggregate_does_size_0_query_for_aggregations(self):
         with self.app.app_context(), mock.patch.object(es, 'search') as es_search_mock:
             core_search_and_aggregate('test-index', 'services', MultiDict(), aggregations=['serviceCategories'])
@@ -390,3 +427,71 @@ class TestHighlightedService(BaseApplicationTestWithIndex):
             ==
             got
         )
+
+
+class TestExportEndpoint(BaseApplicationTestWithoutElasticsearch):
+    def test_documents_are_streamed_as_ndjson(self):
+        documents = iter([{"id": "1"}, {"id": "2"}])
+        with mock.patch("app.main.views.search.export_documents", return_value=(documents, 200)) as export_documents:
+            response = self.client.get("/g-cloud-12/services/export?idOnly=True&q=email")
+
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        assert [json.loads(line) for line in response.get_data().splitlines()] == [{"id": "1"}, {"id": "2"}]
+        assert export_documents.call_args[0][:2] == ("g-cloud-12", "services")
+
+    def test_error_before_streaming_gives_json_error(self):
+        with mock.patch("app.main.views.search.export_documents", return_value=("no such index", 404)):
+            response = self.client.get("/g-cloud-12/services/export")
+
+        assert response.status_code == 404
+        assert json.loads(response.get_data()) == {"error": "no such index"}
+
+
+class TestMultiSearchEndpoint(BaseApplicationTestWithoutElasticsearch):
+    def _post(self, data):
+        return self.client.post("/_msearch", data=json.dumps(data), content_type="application/json")
+
+    def test_each_search_is_returned_with_its_status(self):
+        results = [({"meta": {"total": 1}, "documents": [{"id": "1"}], "links": {}}, 200), ("Invalid page 0", 400)]
+        with mock.patch("app.main.views.search.multi_search", return_value=results) as multi_search:
+            response = self._post({"searches": [
+                {"index": "g-cloud-12", "doc_type": "services", "query_args": {"q": "email", "filter_lot": ["a", "b"]}},
+                {"index": "g-cloud-11", "doc_type": "services", "query_args": {"page": "0"}},
+            ]})
+
+        assert response.status_code == 200
+        assert json.loads(response.get_data()) == {"responses": [
+            {"status": 200, "meta": {"total": 1}, "documents": [{"id": "1"}], "links": {}},
+            {"status": 400, "error": "Invalid page 0"},
+        ]}
+        searches = multi_search.call_args[0][0]
+        assert [search[:2] for search in searches] == [("g-cloud-12", "services"), ("g-cloud-11", "services")]
+        assert searches[0][2].getlist("filter_lot") == ["a", "b"]
+
+    @pytest.mark.parametrize("searches", (
+        None,
+        {"index": "g-cloud-12"},
+        [{"index": "g-cloud-12"}],
+        [{"index": "g-cloud-12", "doc_type": "services", "query_args": "q=email"}],
+        [{"index": "g-cloud-12", "doc_type": "services", "query_args": {"q": 5}}],
+        [{"index": "g-cloud-12", "doc_type": "services", "query_args": {"q": None}}],
+        [{"index": "g-cloud-12", "doc_type": "services", "query_args": {"filter_lot": ["a", 5]}}],
+        [{"index": "g-cloud-12", "doc_type": "services", "query_args": {"filter_lot": {"a": "b"}}}],
+    ))
+    def test_invalid_searches_give_400(self, searches):
+        with mock.patch("app.main.views.search.multi_search") as multi_search:
+            response = self._post({"searches": searches})
+
+        assert response.status_code == 400
+        assert multi_search.called is False
+
+    def test_too_many_searches_give_400(self):
+        self.app.config["DM_SEARCH_MSEARCH_MAX_SEARCHES"] = 2
+        search = {"index": "g-cloud-12", "doc_type": "services"}
+
+        with mock.patch("app.main.views.search.multi_search") as multi_search:
+            response = self._post({"searches": [search] * 3})
+
+        assert response.status_code == 400
+        assert multi_search.called is False
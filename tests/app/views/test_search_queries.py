@@ -27,7 +27,7 @@ def dummy_services(services_mapping_file_name_and_path):
                 '/test-index/services/%s' % service["document"]["id"],
                 data=json.dumps(service), content_type='application/json'
             )
-            search_service.refresh('test-index')
+        search_service.refresh('test-index')
     yield
     test_client.delete('/test-index')
 
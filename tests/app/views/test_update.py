@@ -4,7 +4,13 @@ from flask import json
 from urllib3.exceptions import NewConnectionError
 
 from app.main.services import search_service
-from tests.helpers import BaseApplicationTestWithIndex, make_search_api_url
+from app.mapping import mapping_registry
+from tests.helpers import (
+    BaseApplicationTestWithIndex,
+    BaseApplicationTestWithoutElasticsearch,
+    make_search_api_url,
+    make_service
+)
 
 
 class TestIndexingDocuments(BaseApplicationTestWithIndex):
@@ -27,6 +33,24 @@ class TestIndexingDocuments(BaseApplicationTestWithIndex):
         assert response.status_code == 200
         assert response.json["status"]["num_docs"] == 1
 
+    def test_reindexing_an_unchanged_document_is_skipped(self, service):
+        for expected_message in ("acknowledged", "skipped"):
+            response = self.client.put(
+                make_search_api_url(service),
+                data=json.dumps(service),
+                content_type='application/json')
+
+            assert response.status_code == 200
+            assert response.json["message"] == expected_message
+
+        service["document"]["serviceName"] = "changed"
+        response = self.client.put(
+            make_search_api_url(service),
+            data=json.dumps(service),
+            content_type='application/json')
+
+        assert response.json["message"] == "acknowledged"
+
     @mock.patch('app.main.views.update.index')
     @mock.patch('app.main.services.response_formatters.current_app')
     @pytest.mark.parametrize('error_status_code', ['N/A', 'something_other_than_N/A'])
@@ -93,6 +117,43 @@ class TestIndexingDocuments(BaseApplicationTestWithIndex):
         assert response.status_code == 400
 
 
+class TestUpdatingDocuments(BaseApplicationTestWithIndex):
+    def test_should_update_supplied_fields_only(self, service):
+        self.client.put(
+            make_search_api_url(service),
+            data=json.dumps(service),
+            content_type='application/json')
+
+        response = self.client.patch(
+            make_search_api_url(service),
+            data=json.dumps({"document": {"serviceName": "A new name"}}),
+            content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json["message"] == "acknowledged"
+
+        response = self.client.get(make_search_api_url(service))
+        assert response.json["services"]["_source"]["dmtext_serviceName"] == "A new name"
+        assert response.json["services"]["_source"]["dmtext_supplierName"] == "Supplier Name"
+
+    def test_should_return_404_if_no_document(self, service):
+        response = self.client.patch(
+            make_search_api_url(service),
+            data=json.dumps({"document": {"serviceName": "A new name"}}),
+            content_type='application/json')
+
+        assert response.status_code == 404
+
+    def test_should_raise_400_if_fields_combined_by_transformations_are_missing(self, service):
+        response = self.client.patch(
+            make_search_api_url(service),
+            data=json.dumps({"document": {"ongoingSupport": True}}),
+            content_type='application/json')
+
+        assert response.status_code == 400
+        assert "serviceCategories" in response.json["error"]
+
+
 class TestDeleteById(BaseApplicationTestWithIndex):
     def test_should_delete_service_by_id(self, service):
         self.client.put(
@@ -138,3 +199,173 @@ class TestDeleteById(BaseApplicationTestWithIndex):
         )
 
         assert response.status_code == 400
+
+
+class TestBulkIndexingDocuments(BaseApplicationTestWithIndex):
+    def _bulk_url(self, type_name='services'):
+        return '/test-index/{}/_bulk'.format(type_name)
+
+    def test_should_index_many_documents(self):
+        documents = [
+            {"id": str(i), "document": make_service(id=str(i))["document"]}
+            for i in range(3)
+        ]
+
+        response = self.client.post(
+            self._bulk_url(),
+            data=json.dumps({"documents": documents}),
+            content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json["errors"] is False
+        assert [item["id"] for item in response.json["items"]] == [document["id"] for document in documents]
+        assert {item["status"] for item in response.json["items"]} == {200}
+
+        with self.app.app_context():
+            search_service.refresh('test-index')
+        response = self.client.get('/test-index')
+        assert response.json["status"]["num_docs"] == 3
+
+    def test_invalid_items_are_reported_in_position(self, service):
+        response = self.client.post(
+            self._bulk_url(),
+            data=json.dumps({"documents": [{"id": "1"}, {"id": "2", "document": service["document"]}]}),
+            content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json["errors"] is True
+        assert [(item["id"], item["status"]) for item in response.json["items"]] == [("1", 400), ("2", 200)]
+
+    def test_should_raise_400_if_documents_is_not_a_list(self, service):
+        response = self.client.post(
+            self._bulk_url(),
+            data=json.dumps({"documents": service}),
+            content_type='application/json')
+
+        assert response.status_code == 400
+
+    def test_should_raise_400_on_bad_doc_type(self, service):
+        response = self.client.post(
+            self._bulk_url(type_name='some-bad-type'),
+            data=json.dumps({"documents": [service]}),
+            content_type='application/json')
+
+        assert response.status_code == 400
+
+
+class TestBulkDeleteById(BaseApplicationTestWithIndex):
+    def test_should_delete_many_documents_and_report_missing_ones(self):
+        for i in range(2):
+            service = make_service(id=str(i))
+            self.client.put(
+                make_search_api_url(service),
+                data=json.dumps(service),
+                content_type='application/json')
+
+        response = self.client.delete(
+            '/test-index/services/_bulk',
+            data=json.dumps({"ids": ["0", "1", "not-an-id-that-exists"]}),
+            content_type='application/json')
+
+        assert response.status_code == 200
+        assert response.json["errors"] is False
+        assert response.json["notFound"] == ["not-an-id-that-exists"]
+        assert [(item["id"], item["status"]) for item in response.json["items"]] == [
+            ("0", 200), ("1", 200), ("not-an-id-that-exists", 404),
+        ]
+
+    def test_should_raise_400_if_ids_is_not_a_list(self):
+        response = self.client.delete(
+            '/test-index/services/_bulk',
+            data=json.dumps({"ids": "0"}),
+            content_type='application/json')
+
+        assert response.status_code == 400
+
+    def test_should_raise_400_on_bad_doc_type(self):
+        response = self.client.delete(
+            '/test-index/some-bad-type/_bulk',
+            data=json.dumps({"ids": ["0"]}),
+            content_type='application/json')
+
+        assert response.status_code == 400
+
+
+class TestBulkIndexingNdjson(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.app.config['DM_SEARCH_BULK_BATCH_SIZE'] = 2
+        self.bulk_index = self.patch(
+            'app.main.views.update.bulk_index',
+            side_effect=lambda index_name, doc_type, documents, **kwargs: (
+                {"id": document_id, "status": 200, "message": "acknowledged"} for document_id, _ in documents
+            ),
+        )
+        self.patch('app.main.views.update.get_mapping').return_value = mapping_registry.get('services').mapping
+
+    def test_documents_are_indexed_and_reported_a_chunk_at_a_time(self):
+        lines = [json.dumps({"id": str(i), "document": make_service(id=str(i))["document"]}) for i in range(3)]
+
+        response = self.client.post(
+            '/test-index/services/_bulk',
+            data="\n".join(lines + ["", "not json"]) + "\n",
+            content_type='application/x-ndjson')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        chunks = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [(chunk["chunk"], chunk["firstLine"], chunk["errors"]) for chunk in chunks] == [
+            (0, 1, False),
+            (1, 3, True),
+        ]
+        assert [(item["id"], item["status"]) for item in chunks[1]["items"]] == [("2", 200), (None, 400)]
+        assert self.bulk_index.call_count == 2
+
+    def test_invalid_refresh_option_gives_400(self):
+        response = self.client.post(
+            '/test-index/services/_bulk?refresh=true',
+            data="",
+            content_type='application/x-ndjson')
+
+        assert response.status_code == 400
+        assert response.json["error"] == "Invalid 'refresh' value; expected one of: wait_for, debounced"
+
+
+class TestBulkIndexingRefresh(BaseApplicationTestWithoutElasticsearch):
+    def setup(self):
+        super().setup()
+        self.es.mget.return_value = {"docs": []}
+        self.patch(
+            'app.main.services.search_service.streaming_bulk',
+            side_effect=lambda es, actions, **kwargs: (
+                (True, {"index": {"_index": "test-index", "_id": action["_id"], "status": 200}}) for action in actions
+            ),
+        )
+        self.refresh_request = self.patch('app.refresh.refresh_coordinator.request')
+        self.patch('app.main.views.update.get_mapping').return_value = mapping_registry.get('services').mapping
+
+    @pytest.mark.parametrize("content_type", ("application/json", "application/x-ndjson"))
+    def test_debounced_refresh_is_requested(self, content_type):
+        documents = [{"id": str(i), "document": make_service(id=str(i))["document"]} for i in range(2)]
+        if content_type == "application/json":
+            data = json.dumps({"documents": documents})
+        else:
+            data = "\n".join(json.dumps(document) for document in documents) + "\n"
+
+        response = self.client.post(
+            '/test-index/services/_bulk?refresh=debounced', data=data, content_type=content_type
+        )
+        response.get_data()
+
+        assert response.status_code == 200
+        self.refresh_request.assert_called_with("test-index")
+
+    def test_no_refresh_is_requested_by_default(self):
+        documents = [{"id": "1", "document": make_service(id="1")["document"]}]
+
+        response = self.client.post(
+            '/test-index/services/_bulk', data=json.dumps({"documents": documents}), content_type="application/json"
+        )
+
+        assert response.status_code == 200
+        assert self.refresh_request.called is False
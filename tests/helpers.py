@@ -75,6 +75,30 @@ class BaseApplicationTest(object):
         self.app_env_var_mock.stop()
 
 
+class BaseApplicationTestWithoutElasticsearch(BaseApplicationTest):
+    """
+    For tests which never reach Elasticsearch. The client the search service uses (or the one at `es_target`) is
+    replaced by a mock, `self.es`, and there are no test indexes to delete afterwards. Anything else patched with
+    `self.patch` is unpatched along with it.
+    """
+    es_target = 'app.main.services.search_service.es'
+
+    def setup(self):
+        super().setup()
+        self._patches = []
+        self.es = self.patch(self.es_target)
+
+    def patch(self, target, *args, **kwargs):
+        patch = mock.patch(target, *args, **kwargs)
+        self._patches.append(patch)
+        return patch.start()
+
+    def teardown(self):
+        for patch in reversed(self._patches):
+            patch.stop()
+        self.app_env_var_mock.stop()
+
+
 class BaseApplicationTestWithIndex(BaseApplicationTest):
     def setup(self):
         super().setup()